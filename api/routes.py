@@ -3,12 +3,13 @@ from flask import Blueprint, request, jsonify, make_response
 from configuration.config import db
 from application.models import User
 from flask_jwt_extended import jwt_required, get_jwt_identity, create_access_token
-from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.exceptions import BadRequest
 from sqlalchemy import select
 from application.schemas import user_schema, user_schema_private
 from helpers.common_responses import badRequest, unauthorized, forbidden, notFound
 from helpers.input_validator import username_is_valid, password_is_valid, username_is_reserved
+from helpers.rbac_cache import rbac_cache
+from helpers.passwords import hash_password, verify_password, needs_rehash
 
 # Create blueprint
 auth_bp = Blueprint('auth', __name__)
@@ -42,8 +43,8 @@ def register():
         })
         return make_response(response, 406)
 
-    # Reject if the user already exists
-    existing_user = User.query.filter(User.username == username).one_or_none()
+    # Reject if the user already exists, or is still being purged
+    existing_user = User.query.execution_options(include_deleted=True).filter(User.username == username).one_or_none()
     if existing_user is not None:
         response = jsonify({
             "error": "Username already in use",
@@ -69,7 +70,7 @@ def register():
 
     # Else, Accept the request and register new user
     new_user = user_schema.load(user, session=db.session)
-    new_user.password = generate_password_hash(password)
+    new_user.password = hash_password(password)
     db.session.add(new_user)
     db.session.commit()
     return jsonify(user_schema_private.dump(new_user)), 201
@@ -101,8 +102,20 @@ def login():
     existing_user = User.query.filter(User.username == username).one_or_none()
 
     # Generate JWT if user exists and has provided the correct password
-    if existing_user is not None and check_password_hash(existing_user.password, password):
-        access_token = create_access_token(identity={'username': username}, expires_delta=datetime.timedelta(hours=24))
+    if existing_user is not None and verify_password(existing_user.password, password):
+        # Transparently upgrade hashes made with outdated parameters
+        if needs_rehash(existing_user.password):
+            existing_user.password = hash_password(password)
+            db.session.commit()
+
+        # Carry the authorization data in the token so decorators can skip the lookup
+        cached_user = rbac_cache.get_user(username)
+        additional_claims = {
+            'uid': cached_user.id,
+            'roles': sorted(cached_user.roles),
+            'perms': sorted(rbac_cache.permissions_of(cached_user))
+        }
+        access_token = create_access_token(identity={'username': username}, additional_claims=additional_claims, expires_delta=datetime.timedelta(hours=24))
         response = jsonify({
             "access_token": f"{access_token}",
             "id": f"{existing_user.id}"
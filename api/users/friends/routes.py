@@ -1,11 +1,19 @@
-from flask import Blueprint, jsonify, make_response
+from flask import Blueprint, request, jsonify, make_response, current_app
 from configuration.config import db
 from application.models import User, Friend
 from application.schemas import friend_schema, user_schema_private
+from application.serializers import serialize_user_private, json_response
+from sqlalchemy import select
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import selectinload
 from flask_jwt_extended import jwt_required, get_jwt_identity
+from werkzeug.exceptions import BadRequest
 from helpers.common_responses import badRequest, unauthorized, forbidden, notFound
 from helpers.decorators import permission_required
+from helpers.friend_index import friend_index
+from helpers.bulk import insert_ignore
+from helpers.pagination import paginate, page_headers, PaginationError
+from helpers import timelines, etags
 
 # Create blueprint
 friends_bp = Blueprint('friends', __name__)
@@ -27,23 +35,142 @@ def create(user_id, friend_id):
     try:
         friend = Friend(user_id=user_id, friend_id=fuser.id)
         db.session.add(friend)
+        db.session.flush()
+        timelines.add_friends(user_id, [fuser.id])
+        etags.bump(etags.FRIENDS, [user_id])
         db.session.commit()
+        friend_index.add(user_id, fuser.id)
         return jsonify(friend_schema.dump(friend)), 201
     except IntegrityError:
         db.session.rollback()
         return make_response(jsonify({"error": "Conflict", "message": f"Already Friends with user {fuser.username}"}), 406)
 
 
+def _batch_ids(friend_data, key):
+    ids = friend_data.get(key, [])
+    if not isinstance(ids, list) or not all(isinstance(i, int) and not isinstance(i, bool) for i in ids):
+        raise KeyError
+    # Keep the first occurrence of every id, in request order
+    return list(dict.fromkeys(ids))
+
+
+# Add and remove many friends of user in one request
+# Body is {"add": [ids], "remove": [ids]}, the response lists what happened to every id
+@friends_bp.route("/batch", methods=["POST"])
+@jwt_required()
+@permission_required("can_create_friends", "can_delete_friends")
+def batch(user_id):
+    try:
+        friend_data = request.get_json()
+        if not isinstance(friend_data, dict):
+            raise KeyError
+        add_ids = _batch_ids(friend_data, 'add')
+        remove_ids = _batch_ids(friend_data, 'remove')
+    except BadRequest:
+        return badRequest("Could not load JSON from request")
+    except KeyError:
+        return badRequest("Invalid JSON body")
+
+    max_size = current_app.config['FRIENDS_BATCH_MAX_SIZE']
+    if not 1 <= len(add_ids) + len(remove_ids) <= max_size:
+        return badRequest(f"Batch must contain between 1 and {max_size} ids")
+
+    if set(add_ids) & set(remove_ids):
+        return badRequest("Cannot add and remove the same friend")
+
+    # One query tells which targets exist and which of them are already friends
+    current = db.session.execute(
+        select(User.id, Friend.id)
+        .outerjoin(Friend, (Friend.friend_id == User.id) & (Friend.user_id == user_id))
+        .where(User.id.in_(add_ids + remove_ids + [user_id]))
+    ).all()
+    if user_id not in {target_id for target_id, _ in current}:
+        return notFound()
+    existing = {target_id for target_id, _ in current}
+    friends = {target_id for target_id, friend_row in current if friend_row is not None}
+
+    result = {key: [] for key in ("added", "already_friends", "removed", "not_friends", "missing", "invalid")}
+    for target_id in add_ids:
+        if target_id == user_id:
+            result["invalid"].append(target_id)
+        elif target_id not in existing:
+            result["missing"].append(target_id)
+        elif target_id in friends:
+            result["already_friends"].append(target_id)
+        else:
+            result["added"].append(target_id)
+    for target_id in remove_ids:
+        if target_id not in existing:
+            result["missing"].append(target_id)
+        elif target_id in friends:
+            result["removed"].append(target_id)
+        else:
+            result["not_friends"].append(target_id)
+
+    if result["added"] or result["removed"]:
+        # Bumping the version first locks the user's row, so concurrent batches for the
+        # same user take turns, and the friends are read again under that lock
+        etags.bump(etags.FRIENDS, [user_id])
+        friends = set(db.session.execute(
+            select(Friend.friend_id)
+            .where((Friend.user_id == user_id) & Friend.friend_id.in_(result["added"] + result["removed"]))
+            .with_for_update()
+        ).scalars())
+        # Friendships added or removed concurrently since the lookup are reported as such
+        result["already_friends"] += [target_id for target_id in result["added"] if target_id in friends]
+        result["added"] = [target_id for target_id in result["added"] if target_id not in friends]
+        result["not_friends"] += [target_id for target_id in result["removed"] if target_id not in friends]
+        result["removed"] = [target_id for target_id in result["removed"] if target_id in friends]
+
+    added, removed = result["added"], result["removed"]
+    if added or removed:
+        # Rows a single friend add inserted meanwhile are skipped, not an error
+        insert_ignore(Friend, [{"user_id": user_id, "friend_id": friend_id} for friend_id in added])
+        if removed:
+            Friend.query.filter(Friend.user_id == user_id, Friend.friend_id.in_(removed)).delete(synchronize_session=False)
+        timelines.add_friends(user_id, added)
+        timelines.remove_friends(user_id, removed)
+        db.session.commit()
+        for friend_id in added:
+            friend_index.add(user_id, friend_id)
+        for friend_id in removed:
+            friend_index.remove(user_id, friend_id)
+    else:
+        # Nothing changed after all, drop the version bump
+        db.session.rollback()
+
+    return jsonify(result), 200
+
+
 # Retrieve all friends of user
 @friends_bp.route("", methods=["GET"])
 @jwt_required()
 @permission_required("can_read_friends")
 def read_all(user_id):
-    friends_as_user = Friend.query.filter_by(user_id=user_id).all()
-    friend_ids = {f.friend_id for f in friends_as_user}
+    version = etags.current_version(etags.FRIENDS, user_id)
+    etag = etags.make_etag(etags.FRIENDS, user_id, version) if version is not None else None
+
+    if etag and etags.is_fresh(etag):
+        return etags.not_modified(etag)
+
+    if friend_index.enabled():
+        # At least as new as the ETag, which other processes' writes may have moved on
+        friend_ids = set(friend_index.friends_of(user_id, version))
+    else:
+        friends_as_user = Friend.query.filter_by(user_id=user_id).all()
+        friend_ids = {f.friend_id for f in friends_as_user}
     friend_ids.discard(user_id)
-    friends = User.query.filter(User.id.in_(friend_ids)).all()
-    return jsonify(user_schema_private.dump(friends, many=True)), 200
+
+    try:
+        friends_query = User.query.options(selectinload(User.roles)).filter(User.id.in_(friend_ids))
+        friends, next_cursor = paginate(friends_query, (User.id,))
+    except PaginationError as e:
+        return badRequest(str(e))
+
+    response = json_response([serialize_user_private(friend) for friend in friends], headers=page_headers(next_cursor))
+    if etag:
+        response.set_etag(etag)
+    return response
 
 
 # Delete friend from user
@@ -60,7 +187,10 @@ def delete(user_id, friend_id):
 
     if friend_to_delete:
         db.session.delete(friend_to_delete)
+        timelines.remove_friends(user_id, [fuser.id])
+        etags.bump(etags.FRIENDS, [user_id])
         db.session.commit()
+        friend_index.remove(user_id, fuser.id)
         return make_response(jsonify({"message": f"Removed Friend with user id {fuser.id}"}), 200)
     else:
         return make_response(jsonify({"error": "Bad request", "message": f"Not Friends with user id {fuser.id}"}), 400)
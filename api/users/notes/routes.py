@@ -1,17 +1,31 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app
 from configuration.config import db
-from application.models import Note, User, Friend
+from application.models import Note, User, Friend, TimelineEntry
 from application.schemas import note_schema
+from application.serializers import serialize_note, json_response, wants_ndjson, ndjson_response
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from werkzeug.exceptions import BadRequest
 from sqlalchemy import select
 from helpers.common_responses import badRequest, unauthorized, forbidden, notFound
-from helpers.decorators import permission_required, access_required
+from helpers.decorators import permission_required, access_required, current_caller
+from helpers.friend_index import friend_index
+from helpers.pagination import paginate, page_headers, filter_time_range, PaginationError
+from helpers import timelines, etags, search, group_commit, user_purge
+from helpers.response_cache import response_cache
 
 # Create blueprint
 notes_bp = Blueprint('notes', __name__)
 
 
+# Filter matching the notes of everyone who added user_id as a friend, but not those
+# of friends being deleted
+def _written_by_friends_of(user_id):
+    if friend_index.enabled():
+        return Note.user_id.in_(friend_index.added_by(user_id)) & user_purge.live_author()
+    friends_who_added_me_subquery = db.session.query(Friend.user_id).filter(Friend.friend_id == user_id).subquery()
+    return Note.user_id.in_(select(friends_who_added_me_subquery)) & user_purge.live_author()
+
+
 # Retrieve all notes of user friends
 @notes_bp.route("/friends", methods=["GET"])
 @jwt_required()
@@ -24,10 +38,59 @@ def get_friends_notes(user_id):
     if existing_user is None:
         return notFound()
 
-    friends_who_added_me_subquery = db.session.query(Friend.user_id).filter(Friend.friend_id == cuser.id).subquery()
-    friends_notes_query = Note.query.filter(Note.user_id.in_(select(friends_who_added_me_subquery)))
-    friends_notes = friends_notes_query.all()
-    return note_schema.dump(friends_notes, many=True)
+    # Read the materialized timeline if notes are fanned out on write
+    if timelines.enabled():
+        friends_notes_query = timelines.feed_query(cuser.id)
+        ordering = (TimelineEntry.timestamp, TimelineEntry.note_id)
+    else:
+        friends_notes_query = Note.query.filter(_written_by_friends_of(cuser.id))
+        ordering = (Note.timestamp, Note.id)
+
+    try:
+        friends_notes_query = filter_time_range(friends_notes_query, ordering[0])
+        if wants_ndjson():
+            return ndjson_response(friends_notes_query.order_by(*[column.desc() for column in ordering]), serialize_note)
+        friends_notes, next_cursor = paginate(friends_notes_query, ordering, descending=True, key=lambda note: (note.timestamp, note.id))
+    except PaginationError as e:
+        return badRequest(str(e))
+
+    return json_response([serialize_note(note) for note in friends_notes], headers=page_headers(next_cursor))
+
+
+# Ranked full-text search of notes matching ?q= among those picked by note_filter
+def _search(note_filter):
+    try:
+        terms = search.parse_terms(request.args.get('q'))
+        search_results_query, score = search.search_query(terms)
+        search_results_query = filter_time_range(search_results_query.filter(note_filter), Note.timestamp)
+        results, next_cursor = paginate(
+            search_results_query, (score, Note.id), descending=True,
+            key=lambda row: (row.score, row.Note.id), always=True
+        )
+    except (search.SearchError, PaginationError) as e:
+        return badRequest(str(e))
+
+    return json_response(
+        [{**serialize_note(row.Note), "score": row.score} for row in results],
+        headers=page_headers(next_cursor)
+    )
+
+
+# Search the notes of user
+@notes_bp.route("/search", methods=["GET"])
+@jwt_required()
+@access_required("can_read_notes")
+def search_notes(user_id):
+    # access_required has already checked that the user exists
+    return _search(Note.user_id == user_id)
+
+
+# Search the notes of user friends
+@notes_bp.route("/friends/search", methods=["GET"])
+@jwt_required()
+@access_required("can_read_notes")
+def search_friends_notes(user_id):
+    return _search(_written_by_friends_of(current_caller().id))
 
 
 # Create note for user
@@ -52,13 +115,127 @@ def create(user_id):
     if existing_user is None:
         return notFound()
 
-    new_note = Note(
-        content=content.strip(),
-        user_id=user_id
-    )
-    db.session.add(new_note)
+    # Committed on its own or together with concurrent note writes
+    def write():
+        new_note = Note(
+            content=content.strip(),
+            user_id=user_id
+        )
+        db.session.add(new_note)
+        db.session.flush()
+        timelines.fan_out([new_note])
+        etags.bump(etags.NOTES, [user_id])
+        return note_schema.dump(new_note)
+
+    return jsonify(group_commit.submit(write)), 201
+
+
+# Validate one bulk operation, returning an error message or None
+def _batch_error(operation, seen_ids):
+    if not isinstance(operation, dict) or operation.get('op') not in ('create', 'update', 'delete'):
+        return "Invalid operation"
+
+    if operation['op'] != 'delete':
+        content = operation.get('content')
+        if not isinstance(content, str) or not content.strip():
+            return "Invalid content"
+        if len(content.strip()) > Note.content.type.length:
+            return "Content too long"
+
+    if operation['op'] != 'create':
+        note_id = operation.get('id')
+        if not isinstance(note_id, int) or isinstance(note_id, bool):
+            return "Invalid note id"
+        if note_id in seen_ids:
+            return "Duplicate note id in batch"
+        seen_ids.add(note_id)
+
+    return None
+
+def _batch_result(operation, status, **fields):
+    op = operation.get('op') if isinstance(operation, dict) else None
+    return {"op": op, "status": status, **fields}
+
+
+# Create, update and delete notes of a user in one request
+# Body is an array of {"op": "create", "content"}, {"op": "update", "id", "content"}
+# or {"op": "delete", "id"}; every operation gets its own result, in request order
+@notes_bp.route("/batch", methods=["POST"])
+@jwt_required()
+@permission_required("can_create_notes", "can_update_notes", "can_delete_notes")
+def batch(user_id):
+    try:
+        operations = request.get_json()
+        if not isinstance(operations, list):
+            raise KeyError
+    except BadRequest:
+        return badRequest("Could not load JSON from request")
+    except KeyError:
+        return badRequest("Invalid JSON body")
+
+    max_size = current_app.config['NOTES_BATCH_MAX_SIZE']
+    if not 1 <= len(operations) <= max_size:
+        return badRequest(f"Batch must contain between 1 and {max_size} operations")
+
+    existing_user = User.query.filter(User.id == user_id).one_or_none()
+
+    if existing_user is None:
+        return notFound()
+
+    results = [None] * len(operations)
+    valid = []
+    seen_ids = set()
+    for index, operation in enumerate(operations):
+        error = _batch_error(operation, seen_ids)
+        if error:
+            results[index] = _batch_result(operation, 400, error="Bad Request", message=error)
+        else:
+            valid.append((index, operation))
+
+    # Load every referenced note with one query
+    note_ids = [operation['id'] for _, operation in valid if operation['op'] != 'create']
+    existing_notes = {note.id: note for note in Note.query.filter(Note.id.in_(note_ids))} if note_ids else {}
+
+    created, updated, deleted_ids = [], [], []
+    for index, operation in valid:
+        if operation['op'] == 'create':
+            new_note = Note(content=operation['content'].strip(), user_id=user_id)
+            db.session.add(new_note)
+            created.append((index, new_note))
+            continue
+
+        existing_note = existing_notes.get(operation['id'])
+        if existing_note is None:
+            results[index] = _batch_result(operation, 404, error="Not Found", message="Resource not found")
+        elif existing_note.user_id != user_id:
+            results[index] = _batch_result(operation, 403, error="Forbidden", message="Not authorized to access this resource")
+        elif operation['op'] == 'update':
+            existing_note.content = operation['content'].strip()
+            updated.append((index, existing_note))
+        else:
+            db.session.delete(existing_note)
+            deleted_ids.append(existing_note.id)
+            results[index] = _batch_result(operation, 200, id=existing_note.id)
+
+    if not (created or updated or deleted_ids):
+        return json_response({"results": results})
+
+    # One flush writes every change, then the notes are serialized before the
+    # commit expires them
+    db.session.flush()
+    timelines.fan_out([new_note for _, new_note in created])
+    timelines.remove_notes(deleted_ids)
+    etags.bump(etags.NOTES, [user_id])
+    for index, note in created:
+        results[index] = _batch_result(operations[index], 201, note=serialize_note(note))
+    for index, note in updated:
+        results[index] = _batch_result(operations[index], 200, note=serialize_note(note))
+    changed_ids = [note.id for _, note in updated] + deleted_ids
     db.session.commit()
-    return jsonify(note_schema.dump(new_note)), 201
+
+    for note_id in changed_ids:
+        response_cache.invalidate(('note', note_id))
+    return json_response({"results": results})
 
 
 # Retrieve all notes of user
@@ -66,32 +243,48 @@ def create(user_id):
 @jwt_required()
 @access_required("can_read_notes")
 def read_all(user_id):
-    existing_user = User.query.filter(User.id == user_id).one_or_none()
+    # The version lookup doubles as the existence check
+    version = etags.current_version(etags.NOTES, user_id)
 
-    if existing_user is None:
+    if version is None:
         return notFound()
 
-    my_notes = Note.query.filter_by(user_id=existing_user.id).all()
-    return note_schema.dump(my_notes, many=True)
+    etag = etags.make_etag(etags.NOTES, user_id, version)
+    if etags.is_fresh(etag):
+        return etags.not_modified(etag)
+
+    try:
+        my_notes_query = filter_time_range(Note.query.filter_by(user_id=user_id), Note.timestamp)
+        if wants_ndjson():
+            response = ndjson_response(my_notes_query.order_by(Note.timestamp.desc(), Note.id.desc()), serialize_note)
+        else:
+            my_notes, next_cursor = paginate(my_notes_query, (Note.timestamp, Note.id), descending=True)
+            response = json_response([serialize_note(note) for note in my_notes], headers=page_headers(next_cursor))
+    except PaginationError as e:
+        return badRequest(str(e))
+
+    response.set_etag(etag)
+    return response
 
 
 @notes_bp.route("/<int:note_id>", methods=["GET"])
 @jwt_required()
 @access_required("can_read_notes")
 def read_one(user_id, note_id):
-    existing_user = User.query.filter(User.id == user_id).one_or_none()
-    note = Note.query.get(note_id)
+    # access_required has already checked that the user exists
+    def load_note():
+        note = Note.query.get(note_id)
+        return note_schema.dump(note) if note is not None else None
 
-    if existing_user is None:
-        return notFound()
+    note = response_cache.get_or_load(('note', note_id), load_note, tags=lambda note: [('user', note['user_id'])])
 
     if note is None:
         return notFound()
 
-    if note.user_id != user_id:
+    if note['user_id'] != user_id:
         return forbidden()
 
-    return note_schema.dump(note)
+    return note
 
 
 # Retrieve one note for user
@@ -112,9 +305,24 @@ def update(user_id, note_id):
     if existing_note.user_id != user_id:
         return forbidden()
 
-    existing_note.content = note_data.get('content').strip()
-    db.session.commit()
-    return note_schema.dump(existing_note)
+    content = note_data.get('content').strip()
+
+    # The note is loaded again by the session that writes it, it may be gone by then
+    def write():
+        note = Note.query.get(note_id)
+        if note is None:
+            return None
+        note.content = content
+        etags.bump(etags.NOTES, [user_id])
+        return note_schema.dump(note)
+
+    updated_note = group_commit.submit(write)
+    response_cache.invalidate(('note', note_id))
+
+    if updated_note is None:
+        return notFound()
+
+    return updated_note
 
 
 # Delete note from user
@@ -130,6 +338,19 @@ def delete(user_id, note_id):
     if existing_note.user_id != user_id:
         return forbidden()
 
-    db.session.delete(existing_note)
-    db.session.commit()
+    def write():
+        note = Note.query.get(note_id)
+        if note is None:
+            return False
+        db.session.delete(note)
+        timelines.remove_notes([note_id])
+        etags.bump(etags.NOTES, [user_id])
+        return True
+
+    deleted = group_commit.submit(write)
+    response_cache.invalidate(('note', note_id))
+
+    if not deleted:
+        return notFound()
+
     return jsonify(message=f"Note with id {note_id} successfully deleted"), 200
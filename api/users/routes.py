@@ -1,12 +1,19 @@
 from flask import Blueprint, make_response, jsonify, request
 from configuration.config import db, jwt
-from application.models import User
+from application.models import User, Friend
 from application.schemas import user_schema, user_schema_private
-from werkzeug.security import generate_password_hash
+from application.serializers import serialize_user_private, json_response
 from werkzeug.exceptions import BadRequest
 from flask_jwt_extended import jwt_required, get_jwt_identity
+from sqlalchemy import select
+from sqlalchemy.orm import selectinload
 from helpers.common_responses import badRequest, unauthorized, forbidden, notFound
 from helpers.decorators import permission_required, admin_required
+from helpers.friend_index import friend_index
+from helpers.passwords import hash_password
+from helpers.pagination import paginate, page_headers, PaginationError
+from helpers import etags, user_purge
+from helpers.response_cache import response_cache
 
 # Create blueprint
 users_bp = Blueprint('users', __name__)
@@ -27,8 +34,12 @@ def expired_token_callback(header, payload):
 @admin_required("can_read_users")
 def read_all():
     # Query users that have no roles (non-admins)
-    users = User.query.filter(User.roles == None).all()
-    return user_schema_private.dump(users, many=True)
+    try:
+        users, next_cursor = paginate(User.query.options(selectinload(User.roles)).filter(User.roles == None), (User.id,))
+    except PaginationError as e:
+        return badRequest(str(e))
+
+    return json_response([serialize_user_private(user) for user in users], headers=page_headers(next_cursor))
 
 
 # Retrieve one user
@@ -36,11 +47,15 @@ def read_all():
 @jwt_required()
 @permission_required("can_read_users")
 def read_one(user_id):
-    user = User.query.filter(User.id == user_id).one_or_none()
+    def load_user():
+        user = User.query.filter(User.id == user_id).one_or_none()
+        return user_schema_private.dump(user) if user is not None else None
+
+    user = response_cache.get_or_load(('user', user_id), load_user, tags=lambda user: [('user', user_id)])
     if user is None:
         return notFound()
 
-    return user_schema_private.dump(user)
+    return user
 
 
 # Update user password
@@ -66,14 +81,19 @@ def update(user_id):
         return notFound()
 
     update_user = user_schema.load(user, session=db.session)
-    existing_user.password = generate_password_hash(update_user.password)
+    existing_user.password = hash_password(update_user.password)
+    # Friend lists show the user's timestamp, which the update changes
+    etags.bump(etags.FRIENDS, select(Friend.user_id).where(Friend.friend_id == user_id))
     db.session.merge(existing_user)
     db.session.commit()
+    response_cache.invalidate(('user', user_id))
 
     return user_schema_private.dump(existing_user), 200
 
 
 # Delete user
+# The database cascades the delete to the user's notes, friends and timelines. Large
+# users are only tombstoned and purged in the background, answered with 202
 @users_bp.route("/<int:user_id>", methods=["DELETE"])
 @jwt_required()
 @permission_required("can_delete_users")
@@ -83,8 +103,25 @@ def delete(user_id):
     if existing_user is None:
         return notFound()
 
+    # Friend lists that contained this user are about to change
+    etags.bump(etags.FRIENDS, select(Friend.user_id).where(Friend.friend_id == user_id))
+
+    if user_purge.enabled() and user_purge.is_large(user_id):
+        user_purge.tombstone(existing_user)
+        db.session.commit()
+        response_cache.invalidate_tag(('user', user_id))
+        friend_index.remove_user(user_id)
+        user_purge.purger().wake_up()
+
+        response = jsonify({
+            "message": f"{existing_user.username} scheduled for deletion"
+        })
+        return make_response(response, 202)
+
     db.session.delete(existing_user)
     db.session.commit()
+    response_cache.invalidate_tag(('user', user_id))
+    friend_index.remove_user(user_id)
 
     response = jsonify({
         "message": f"{existing_user.username} successfully deleted"
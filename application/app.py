@@ -1,31 +1,69 @@
-from flask import abort, jsonify, request, url_for, render_template, make_response
-import configuration.config as config
-import datetime
-import sqlite3
-from configuration.config import db
-from application.models import User
-from werkzeug.security import generate_password_hash, check_password_hash
-from werkzeug.exceptions import BadRequest
-from flask_jwt_extended import create_access_token
-from application.schemas import user_schema, user_schema_private
-from api.users.routes import users_bp
-from api.users.notes.routes import notes_bp
-from api.users.friends.routes import friends_bp
-from api.routes import auth_bp
-
-app = config.app
-
-# Register blueprints' routes with the app and set their URL prefixes
-app.register_blueprint(users_bp, url_prefix='/api/users')
-app.register_blueprint(notes_bp, url_prefix='/api/users/<int:user_id>/notes')
-app.register_blueprint(friends_bp, url_prefix='/api/users/<int:user_id>/friends')
-app.register_blueprint(auth_bp, url_prefix='/api')
+import time
+from flask import Flask, current_app, url_for, render_template
+from configuration.config import Config, db, jwt, ma
+from helpers import db_routing, query_stats, metrics, profiler
+
+
+# Create the Flask app
+# Extensions, blueprints and request hooks are only set up here, so importing this
+# module stays cheap and every worker or test process can build its own app.
+# The seconds spent in each step are kept in app.extensions['startup'].
+def create_app(config=None):
+    timings = {}
+    started = step = time.perf_counter()
+
+    def timed(name):
+        nonlocal step
+        now = time.perf_counter()
+        timings[name] = now - step
+        step = now
+
+    app = Flask(__name__,
+                static_url_path='',
+                static_folder='../static',
+                template_folder='../templates')
+    app.config.from_object(config or Config())
+    timed('config')
+
+    # Initialize JWT, SQLAlchemy, and Marshmallow with the Flask app
+    jwt.init_app(app)
+    db.init_app(app)
+    ma.init_app(app)
+    db_routing.init_app(app)
+    query_stats.init_app(app)
+    timed('extensions')
+
+    # Import the API on first use, it pulls in the models, schemas and serializers
+    from api.users.routes import users_bp
+    from api.users.notes.routes import notes_bp
+    from api.users.friends.routes import friends_bp
+    from api.routes import auth_bp
+
+    # Register blueprints' routes with the app and set their URL prefixes
+    app.register_blueprint(users_bp, url_prefix='/api/users')
+    app.register_blueprint(notes_bp, url_prefix='/api/users/<int:user_id>/notes')
+    app.register_blueprint(friends_bp, url_prefix='/api/users/<int:user_id>/friends')
+    app.register_blueprint(auth_bp, url_prefix='/api')
+
+    app.add_url_rule('/', view_func=home)
+    app.add_url_rule('/api/docs', view_func=redoc)
+    app.add_url_rule('/metrics', view_func=prometheus_metrics)
+    timed('blueprints')
+
+    # Profile requests on demand and record request metrics for every route
+    profiler.init_app(app)
+    metrics.init_app(app)
+    timed('hooks')
+
+    timings['total'] = time.perf_counter() - started
+    app.extensions['startup'] = timings
+    app.logger.info("App created in %.1f ms", timings['total'] * 1000)
+    return app
 
 
 # Define the home route
 # This route will be the first thing a user sees when they visit the API
 # It will provide a brief welcome message and a link to the API documentation
-@app.route('/')
 def home():
     docs_url = url_for('redoc')
     return f"""
@@ -44,9 +82,45 @@ def home():
 # The OpenAPI Specification is a standard for documenting REST APIs
 # The OpenAPI Specification is a JSON or YAML file that describes the API's endpoints, request/response formats, and other details
 # The ReDoc UI reads the OpenAPI Specification and generates a user-friendly documentation page
-@app.route('/api/docs')
 def redoc():
     return render_template("redoc.html")
 
+# Define the route for the metrics
+# Request counts, latency histograms and in-flight requests in the Prometheus text format
+def prometheus_metrics():
+    return current_app.response_class(metrics.render(current_app), mimetype=metrics.METRICS_MIMETYPE)
+
+# Prime what the first requests would otherwise pay for: mapper configuration, the
+# schemas, the jinja templates, the RBAC data of the admins and, when enabled, the
+# friend index. Returns the seconds it took.
+def warm_up(app):
+    from sqlalchemy.exc import SQLAlchemyError
+    from sqlalchemy.orm import configure_mappers
+    from application.models import User, Note
+    from application.schemas import note_schema, user_schema, user_schema_private
+    from helpers.rbac_cache import rbac_cache
+    from helpers.friend_index import friend_index
+
+    started = time.perf_counter()
+    with app.app_context():
+        configure_mappers()
+        note_schema.dump(Note(id=0, content='', user_id=0))
+        user_schema.dump(User(id=0, username=''))
+        user_schema_private.dump(User(id=0, username=''))
+        app.jinja_env.get_template('redoc.html')
+
+        try:
+            rbac_cache.role_permissions()
+            for (username,) in db.session.query(User.username).filter(User.roles.any()):
+                rbac_cache.get_user(username)
+            if app.config['FRIEND_INDEX_ENABLED']:
+                friend_index.load()
+        except SQLAlchemyError as e:
+            # Not fatal, the data is loaded on first use instead
+            app.logger.warning("Warm-up skipped loading RBAC data: %s", e)
+        finally:
+            db.session.remove()
+    return time.perf_counter() - started
+
 def run():
-    app.run(host="0.0.0.0", port=8000, debug=True)
+    create_app().run(host="0.0.0.0", port=8000, debug=True)
@@ -1,7 +1,26 @@
+import sqlite3
 from datetime import datetime, timezone
+from sqlalchemy import event, DDL
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session, with_loader_criteria
 from configuration.config import db
+from helpers.friend_index import friend_index
 
 # Define models and relationships that translate to database tables using the ORM
+# Rows that belong to a user are removed by the database's ON DELETE CASCADE when the
+# user is deleted (passive_deletes), so the ORM never loads them just to delete them
+
+# SQLite only enforces foreign keys, and so their ON DELETE CASCADE, when asked on every connection
+@event.listens_for(Engine, 'connect')
+def _enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA foreign_keys=ON")
+        cursor.close()
+
+# Evaluated for every row, unlike datetime.now(...) passed directly as a default
+def utcnow():
+    return datetime.now(timezone.utc)
 
 class Friend(db.Model):
     __tablename__ = "friend"
@@ -13,16 +32,54 @@ class Friend(db.Model):
         db.UniqueConstraint('user_id', 'friend_id', name='unique_user_friend'),
     )
 
-    user = db.relationship('User', foreign_keys=[user_id], backref=db.backref('friends', cascade="all, delete-orphan"))
-    friend = db.relationship('User', foreign_keys=[friend_id], backref=db.backref('friends_of', cascade="all, delete-orphan"))
+    user = db.relationship('User', foreign_keys=[user_id], backref=db.backref('friends', cascade="all, delete-orphan", passive_deletes=True))
+    friend = db.relationship('User', foreign_keys=[friend_id], backref=db.backref('friends_of', cascade="all, delete-orphan", passive_deletes=True))
 
 class Note(db.Model):
     __tablename__ = "note"
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey("user.id", ondelete="CASCADE"))
     content = db.Column(db.String(240), nullable=False)
-    timestamp = db.Column(
-        db.DateTime, default=datetime.now(timezone.utc), onupdate=datetime.now(timezone.utc)
+    # Creation time, never changes so it can order and paginate notes
+    timestamp = db.Column(db.DateTime, default=utcnow, nullable=False)
+    updated_at = db.Column(db.DateTime, default=utcnow, onupdate=utcnow, nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_note_user_id_timestamp', 'user_id', 'timestamp'),
+    )
+
+# Full-text index over note content, created and dropped with the note table
+# SQLite keeps an external-content FTS5 table in step through triggers, MariaDB/MySQL
+# maintain a FULLTEXT index themselves
+_note_search_ddl = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS note_fts USING fts5(content, content='note', content_rowid='id')",
+    "CREATE TRIGGER IF NOT EXISTS note_fts_insert AFTER INSERT ON note BEGIN "
+    "INSERT INTO note_fts(rowid, content) VALUES (new.id, new.content); END",
+    "CREATE TRIGGER IF NOT EXISTS note_fts_delete AFTER DELETE ON note BEGIN "
+    "INSERT INTO note_fts(note_fts, rowid, content) VALUES ('delete', old.id, old.content); END",
+    "CREATE TRIGGER IF NOT EXISTS note_fts_update AFTER UPDATE OF content ON note BEGIN "
+    "INSERT INTO note_fts(note_fts, rowid, content) VALUES ('delete', old.id, old.content); "
+    "INSERT INTO note_fts(rowid, content) VALUES (new.id, new.content); END",
+    "INSERT INTO note_fts(note_fts) VALUES ('rebuild')",
+]
+for statement in _note_search_ddl:
+    event.listen(Note.__table__, 'after_create', DDL(statement).execute_if(dialect='sqlite'))
+event.listen(Note.__table__, 'before_drop', DDL("DROP TABLE IF EXISTS note_fts").execute_if(dialect='sqlite'))
+event.listen(Note.__table__, 'after_create', DDL(
+    "CREATE FULLTEXT INDEX ix_note_content_fulltext ON note (content)"
+).execute_if(dialect=('mysql', 'mariadb')))
+
+# Materialized friend feed, one row per note in each feed it shows up in (fan-out on write)
+class TimelineEntry(db.Model):
+    __tablename__ = "timeline"
+    owner_id = db.Column(db.Integer, db.ForeignKey("user.id", ondelete="CASCADE"), primary_key=True)
+    note_id = db.Column(db.Integer, db.ForeignKey("note.id", ondelete="CASCADE"), primary_key=True)
+    author_id = db.Column(db.Integer, db.ForeignKey("user.id", ondelete="CASCADE"), nullable=False)
+    timestamp = db.Column(db.DateTime, nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_timeline_owner_timestamp', 'owner_id', 'timestamp', 'note_id'),
+        db.Index('ix_timeline_owner_author', 'owner_id', 'author_id'),
     )
 
 # Mapper table (Role < - > Permission)
@@ -44,17 +101,21 @@ class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(32), unique=True)
     password = db.Column(db.String(120))
-    timestamp = db.Column(
-        db.DateTime, default=datetime.now(timezone.utc), onupdate=datetime.now(timezone.utc)
-    )
+    timestamp = db.Column(db.DateTime, default=utcnow, onupdate=utcnow)
+    # Bumped on every change to the user's notes/friends, backs their ETags
+    notes_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    friends_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # Set when the user is deleted in the background, see helpers.user_purge
+    deleted_at = db.Column(db.DateTime, nullable=True)
     notes = db.relationship(
         'Note',
         backref="user",
         cascade="all, delete, delete-orphan",
         single_parent=True,
+        passive_deletes=True,
         order_by="desc(Note.timestamp)"
     )
-    roles = db.relationship('Role', secondary=users_roles, backref=db.backref('users', lazy='dynamic', cascade="all, delete"))
+    roles = db.relationship('Role', secondary=users_roles, passive_deletes=True, backref=db.backref('users', lazy='dynamic', cascade="all, delete"))
 
     def has_role(self, role_name):
         return any(role.name == role_name for role in self.roles)
@@ -63,6 +124,9 @@ class User(db.Model):
         return any(role.has_permission(permission_name) for role in self.roles)
 
     def is_friend(self, friend_user_id):
+        if friend_index.enabled():
+            return friend_index.is_friend(self.id, friend_user_id)
+
         return db.session.query(
             Friend.query.filter(
                 (Friend.user_id == self.id) &
@@ -70,6 +134,20 @@ class User(db.Model):
             ).exists()
         ).scalar()
 
+# Users waiting to be purged are left out of every ORM query, unless it runs
+# with the include_deleted execution option
+@event.listens_for(Session, 'do_orm_execute')
+def _hide_deleted_users(orm_execute_state):
+    if (
+        orm_execute_state.is_select
+        and not orm_execute_state.is_column_load
+        and not orm_execute_state.is_relationship_load
+        and not orm_execute_state.execution_options.get('include_deleted', False)
+    ):
+        orm_execute_state.statement = orm_execute_state.statement.options(
+            with_loader_criteria(User, User.deleted_at.is_(None), include_aliases=True)
+        )
+
 class Role(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(64), unique=True, nullable=False)
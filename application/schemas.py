@@ -1,4 +1,5 @@
 from flask_marshmallow import Marshmallow
+from marshmallow import EXCLUDE
 from marshmallow_sqlalchemy import fields
 from application.models import User, Note, Friend
 from configuration.config import db, ma
@@ -20,6 +21,9 @@ class UserSchema(ma.SQLAlchemyAutoSchema):
         load_instance = True
         sqla_session = db.session
         include_relationships = True
+        exclude = ("notes_version", "friends_version", "deleted_at")
+        # Excluded fields sent by clients are dropped instead of rejected
+        unknown = EXCLUDE
     notes = fields.Nested(NoteSchema, many=True)
 
 class UserSchemaPrivate(ma.SQLAlchemyAutoSchema):
@@ -28,7 +32,7 @@ class UserSchemaPrivate(ma.SQLAlchemyAutoSchema):
         load_instance = True
         sqla_session = db.session
         include_relationships = True
-        exclude = ("notes", "friends", "friends_of", "password")
+        exclude = ("notes", "friends", "friends_of", "password", "notes_version", "friends_version", "deleted_at")
     notes = fields.Nested(NoteSchema, many=True)
 
 class FriendSchema(ma.SQLAlchemyAutoSchema):
@@ -0,0 +1,120 @@
+# Bulk database seeding
+#
+# Everything is written with Core executemany inserts on one connection, in
+# batches of batch_size rows, inside the caller's transaction. seed_admins()
+# creates the roles, permissions and elevated users of elevated_users.toml,
+# generate() adds a reproducible synthetic data set for capacity testing:
+# users whose friend counts follow a power law, befriending a small set of very
+# popular users far more often than the rest, and a fixed number of notes each.
+
+import random
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import select, func
+from application.models import User, Note, Friend, Role, Permission, roles_permissions, users_roles
+from helpers.passwords import hash_password
+from helpers.rbac_cache import rbac_cache
+from helpers.friend_index import friend_index
+
+WORDS = (
+    "meeting lunch idea draft call reminder groceries book travel project deadline "
+    "coffee weekend review budget design fix release party gym read write plan"
+).split()
+
+
+# Buffers rows per table and inserts them batch_size at a time
+class _BatchWriter:
+    def __init__(self, connection, batch_size):
+        self.connection = connection
+        self.batch_size = batch_size
+        self.rows = {}
+        self.counts = {}
+
+    def add(self, table, row):
+        rows = self.rows.setdefault(table, [])
+        rows.append(row)
+        if len(rows) >= self.batch_size:
+            self.flush(table)
+
+    def flush(self, table=None):
+        tables = [table] if table is not None else list(self.rows)
+        for table in tables:
+            rows = self.rows.pop(table, [])
+            if rows:
+                self.connection.execute(table.insert(), rows)
+                self.counts[table.name] = self.counts.get(table.name, 0) + len(rows)
+
+
+def _next_id(connection, model):
+    return (connection.execute(select(func.max(model.id))).scalar() or 0) + 1
+
+# Write roles, permissions and admin users from the elevated users config
+def seed_admins(connection, config, batch_size=1000):
+    writer = _BatchWriter(connection, batch_size)
+
+    role_names = list(config['users']['elevated_users'])
+    permission_names = sorted({name for names in config['permissions'].values() for name in names})
+    role_ids = {name: role_id for role_id, name in enumerate(role_names, start=_next_id(connection, Role))}
+    permission_ids = {name: permission_id for permission_id, name in enumerate(permission_names, start=_next_id(connection, Permission))}
+
+    for name, role_id in role_ids.items():
+        writer.add(Role.__table__, {'id': role_id, 'name': name})
+    for name, permission_id in permission_ids.items():
+        writer.add(Permission.__table__, {'id': permission_id, 'name': name})
+    writer.flush()
+
+    for role_name, names in config['permissions'].items():
+        for name in names:
+            writer.add(roles_permissions, {'role_id': role_ids[role_name], 'permission_id': permission_ids[name]})
+
+    # Admin ids start at 1 and every admin holds the role named after them
+    for user_id, username in enumerate(role_names, start=1):
+        writer.add(User.__table__, {'id': user_id, 'username': username, 'password': hash_password(username)})
+    writer.flush()
+    for user_id, username in enumerate(role_names, start=1):
+        writer.add(users_roles, {'user_id': user_id, 'role_id': role_ids[username]})
+
+    writer.flush()
+    rbac_cache.invalidate()
+    return writer.counts
+
+# Draw how many friends a user adds, Pareto distributed with the given mean
+def _friend_count(rng, mean, alpha, limit):
+    return min(limit, int(mean * (alpha - 1) / alpha * rng.paretovariate(alpha)))
+
+# Write users synthetic users with power-law friend graphs and notes_per_user notes each
+# The same seed always produces the same users, friendships and note contents
+def generate(connection, users, notes_per_user, mean_friends=20, alpha=2.0, popularity=3.0,
+             seed=0, password="C0mpl3x!", batch_size=5000, now=None):
+    rng = random.Random(seed)
+    now = now or datetime.now(timezone.utc)
+    writer = _BatchWriter(connection, batch_size)
+    first_id = _next_id(connection, User)
+    user_ids = range(first_id, first_id + users)
+    # One hash for everyone, hashing millions of passwords would dominate the run
+    password_hash = hash_password(password)
+
+    for user_id in user_ids:
+        writer.add(User.__table__, {'id': user_id, 'username': f"user{user_id}", 'password': password_hash, 'timestamp': now})
+    writer.flush()
+
+    for user_id in user_ids:
+        wanted = _friend_count(rng, mean_friends, alpha, users - 1)
+        friend_ids = set()
+        # Low offsets are picked far more often, making those users the popular ones
+        for _ in range(wanted * 2):
+            if len(friend_ids) == wanted:
+                break
+            friend_id = first_id + int(users * rng.random() ** popularity)
+            if friend_id != user_id:
+                friend_ids.add(friend_id)
+        for friend_id in sorted(friend_ids):
+            writer.add(Friend.__table__, {'user_id': user_id, 'friend_id': friend_id})
+
+        for _ in range(notes_per_user):
+            timestamp = now - timedelta(seconds=rng.randrange(365 * 24 * 3600))
+            content = " ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 12)))
+            writer.add(Note.__table__, {'user_id': user_id, 'content': content, 'timestamp': timestamp, 'updated_at': timestamp})
+
+    writer.flush()
+    friend_index.reset()
+    return writer.counts
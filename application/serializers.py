@@ -0,0 +1,109 @@
+# Precompiled row -> dict serializers for the hot list endpoints
+#
+# Each serializer is generated once from a schema's dump fields and produces
+# exactly what schema.dump() would, without marshmallow's per-field dispatch on
+# every row. Responses are encoded with orjson when it is installed. Large lists
+# can be streamed as newline-delimited JSON instead of built in one piece.
+
+import json
+import time
+from flask import current_app, request, stream_with_context
+from marshmallow import fields
+from marshmallow_sqlalchemy.fields import Related, RelatedList
+from application.schemas import note_schema, user_schema_private
+from helpers.metrics import add_serialization_time
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _related_key(field):
+    keys = field.related_keys
+    return keys[0].key if len(keys) == 1 else None
+
+# Python expression rendering one field of `obj`, or None if it needs marshmallow
+def _field_expression(field, attribute):
+    value = f"obj.{attribute}"
+
+    if isinstance(field, fields.DateTime) and field.format in (None, 'iso'):
+        return f"(None if {value} is None else {value}.isoformat())"
+
+    if isinstance(field, RelatedList) and isinstance(field.inner, Related):
+        key = _related_key(field.inner)
+        if key:
+            return f"[item.{key} for item in {value}]"
+
+    if isinstance(field, Related):
+        key = _related_key(field)
+        if key:
+            return f"(None if {value} is None else {value}.{key})"
+
+    if isinstance(field, (fields.Integer, fields.String, fields.Boolean)):
+        return value
+
+    return None
+
+# Build a function obj -> dict equivalent to schema.dump(obj)
+def compile_serializer(schema):
+    namespace = {}
+    items = []
+    for name, field in schema.dump_fields.items():
+        key = field.data_key or name
+        attribute = field.attribute or name
+        expression = None
+        if attribute.isidentifier():
+            expression = _field_expression(field, attribute)
+        if expression is None:
+            # Anything unusual falls back to the marshmallow field itself
+            namespace[f"_field_{name}"] = field
+            expression = f"_field_{name}.serialize({attribute!r}, obj)"
+        items.append(f"        {key!r}: {expression},")
+
+    source = "\n".join(["def serialize(obj):", "    return {", *items, "    }"])
+    exec(compile(source, f"<serializer {type(schema).__name__}>", "exec"), namespace)
+    return namespace['serialize']
+
+
+def dumps(data):
+    started = time.perf_counter()
+    if orjson is not None:
+        encoded = orjson.dumps(data, option=orjson.OPT_SORT_KEYS)
+    else:
+        encoded = json.dumps(data, sort_keys=True, separators=(',', ':'))
+    add_serialization_time(time.perf_counter() - started)
+    return encoded
+
+# JSON response for already serialized data, keys sorted like jsonify
+def json_response(data, status=200, headers=None):
+    return current_app.response_class(dumps(data), status=status, headers=headers, mimetype='application/json')
+
+NDJSON_MIMETYPE = 'application/x-ndjson'
+
+# True if the client prefers a newline-delimited JSON stream over a JSON array
+def wants_ndjson():
+    return request.accept_mimetypes.best_match(['application/json', NDJSON_MIMETYPE]) == NDJSON_MIMETYPE
+
+# Stream the rows of a query as one JSON document per line
+# Rows are fetched STREAM_BATCH_SIZE at a time and each batch is written out before
+# the next is read, so memory does not grow with the number of rows
+def ndjson_response(query, serialize, headers=None):
+    batch_size = current_app.config['STREAM_BATCH_SIZE']
+
+    def generate():
+        lines = []
+        for row in query.yield_per(batch_size):
+            line = dumps(serialize(row))
+            lines.append(line if isinstance(line, bytes) else line.encode())
+            if len(lines) == batch_size:
+                yield b'\n'.join(lines) + b'\n'
+                lines = []
+        if lines:
+            yield b'\n'.join(lines) + b'\n'
+
+    return current_app.response_class(stream_with_context(generate()), headers=headers, mimetype=NDJSON_MIMETYPE)
+
+
+serialize_note = compile_serializer(note_schema)
+serialize_user_private = compile_serializer(user_schema_private)
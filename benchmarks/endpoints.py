@@ -0,0 +1,227 @@
+# Endpoint scenarios for run_benchmarks.py
+#
+# Every scenario sends one request through the Flask test client per call, so
+# timings cover routing, JWT decoding, the decorators, the queries and
+# serialization, but not a real network or server. Requests are spread over a
+# pool of logged-in synthetic users picked with a seeded random generator.
+
+import json
+import math
+import random
+import time
+from configuration.config import db
+from application.models import User, Note, Friend
+from application import seeding
+from helpers import query_stats
+
+PASSWORD = "B3nchmark!"
+
+
+# Raised by a scenario when the data it needs was never seeded or is used up
+class NoData(Exception):
+    pass
+
+
+class Context:
+    def __init__(self, client, users, seed):
+        self.client = client
+        self.users = users
+        self.rng = random.Random(seed)
+        self.counter = 0
+
+    # A random pool user, optionally only among those matching a predicate
+    def user(self, having=None):
+        users = self.users if having is None else [user for user in self.users if having(user)]
+        if not users:
+            raise NoData
+        return self.rng.choice(users)
+
+    def unique(self):
+        self.counter += 1
+        return self.counter
+
+
+# A logged-in synthetic user with the ids the scenarios need
+class BenchUser:
+    def __init__(self, user_id, username, headers, note_ids, strangers):
+        self.id = user_id
+        self.username = username
+        self.headers = headers
+        self.note_ids = note_ids
+        # Iterator over users who are not friends yet, and those added by friends_create
+        self.strangers = strangers
+        self.added = []
+
+
+def _post(client, path, body, headers=None):
+    return client.post(path, data=json.dumps(body), headers=headers, content_type='application/json')
+
+def register(ctx):
+    return _post(ctx.client, '/api/register', {'username': f"bench{ctx.unique()}", 'password': PASSWORD}), 201
+
+def login(ctx):
+    return _post(ctx.client, '/api/login', {'username': ctx.user().username, 'password': PASSWORD}), 200
+
+def users_read_one(ctx):
+    user = ctx.user()
+    return ctx.client.get(f'/api/users/{user.id}', headers=user.headers), 200
+
+def notes_create(ctx):
+    user = ctx.user()
+    response = _post(ctx.client, f'/api/users/{user.id}/notes', {'content': f"benchmark note {ctx.unique()}"}, user.headers)
+    if response.status_code == 201:
+        user.note_ids.append(json.loads(response.data)['id'])
+    return response, 201
+
+def notes_read_all(ctx):
+    user = ctx.user()
+    return ctx.client.get(f'/api/users/{user.id}/notes?limit=50', headers=user.headers), 200
+
+def notes_read_one(ctx):
+    user = ctx.user(lambda user: user.note_ids)
+    return ctx.client.get(f'/api/users/{user.id}/notes/{ctx.rng.choice(user.note_ids)}', headers=user.headers), 200
+
+def notes_update(ctx):
+    user = ctx.user(lambda user: user.note_ids)
+    note_id = ctx.rng.choice(user.note_ids)
+    return ctx.client.put(f'/api/users/{user.id}/notes/{note_id}', data=json.dumps({'content': f"updated {ctx.unique()}"}), headers=user.headers, content_type='application/json'), 200
+
+def notes_delete(ctx):
+    user = ctx.user(lambda user: user.note_ids)
+    note_id = user.note_ids.pop()
+    return ctx.client.delete(f'/api/users/{user.id}/notes/{note_id}', headers=user.headers), 200
+
+def notes_search(ctx):
+    user = ctx.user()
+    word = ctx.rng.choice(seeding.WORDS)
+    return ctx.client.get(f'/api/users/{user.id}/notes/search?q={word}&limit=50', headers=user.headers), 200
+
+def friends_read_all(ctx):
+    user = ctx.user()
+    return ctx.client.get(f'/api/users/{user.id}/friends?limit=50', headers=user.headers), 200
+
+def friends_create(ctx):
+    user = ctx.user()
+    friend_id = next(user.strangers, None)
+    if friend_id is None:
+        raise NoData
+    user.added.append(friend_id)
+    return ctx.client.post(f'/api/users/{user.id}/friends/{friend_id}', headers=user.headers), 201
+
+# Removes friends added by friends_create
+def friends_delete(ctx):
+    user = ctx.user(lambda user: user.added)
+    return ctx.client.delete(f'/api/users/{user.id}/friends/{user.added.pop()}', headers=user.headers), 200
+
+def friends_feed(ctx):
+    user = ctx.user()
+    return ctx.client.get(f'/api/users/{user.id}/notes/friends?limit=50', headers=user.headers), 200
+
+# Name -> scenario, in run order; every call is a single request
+# notes_delete and friends_delete consume what the earlier scenarios created
+SCENARIOS = {
+    'register': register,
+    'login': login,
+    'users_read_one': users_read_one,
+    'notes_create': notes_create,
+    'notes_read_all': notes_read_all,
+    'notes_read_one': notes_read_one,
+    'notes_update': notes_update,
+    'notes_search': notes_search,
+    'notes_delete': notes_delete,
+    'friends_read_all': friends_read_all,
+    'friends_feed': friends_feed,
+    'friends_create': friends_create,
+    'friends_delete': friends_delete,
+}
+
+# Scenarios that only have data to work on after another one ran
+REQUIRES = {
+    'friends_delete': ['friends_create'],
+}
+
+# The named scenarios and those they require, in run order
+def with_required(names):
+    wanted = set()
+    pending = list(names)
+    while pending:
+        name = pending.pop()
+        if name not in wanted:
+            wanted.add(name)
+            pending.extend(REQUIRES.get(name, ()))
+    return [name for name in SCENARIOS if name in wanted]
+
+
+# Recreate the database with the given synthetic data set
+def seed(config, users, notes_per_user, mean_friends, seed_value):
+    db.session.remove()
+    db.drop_all()
+    db.create_all()
+    with db.engine.begin() as connection:
+        seeding.seed_admins(connection, config)
+        counts = seeding.generate(connection, users, notes_per_user, mean_friends=mean_friends, seed=seed_value, password=PASSWORD)
+    return counts
+
+def _strangers(user_id, friend_ids, first_id, last_id):
+    for candidate in range(first_id, last_id + 1):
+        if candidate != user_id and candidate not in friend_ids:
+            yield candidate
+
+# Log in pool_size synthetic users and collect what the scenarios need
+def bench_users(client, pool_size, seed_value):
+    rng = random.Random(seed_value)
+    synthetic = db.session.query(db.func.min(User.id), db.func.max(User.id)).filter(User.username.like('user%'))
+    first_id, last_id = synthetic.one()
+    users = []
+    for user_id in rng.sample(range(first_id, last_id + 1), min(pool_size, last_id - first_id + 1)):
+        username = f"user{user_id}"
+        response = _post(client, '/api/login', {'username': username, 'password': PASSWORD})
+        token = json.loads(response.data)['access_token']
+        note_ids = [note_id for (note_id,) in db.session.query(Note.id).filter(Note.user_id == user_id)]
+        friend_ids = {friend_id for (friend_id,) in db.session.query(Friend.friend_id).filter(Friend.user_id == user_id)}
+        users.append(BenchUser(user_id, username, {'Authorization': f'Bearer {token}'}, note_ids, _strangers(user_id, friend_ids, first_id, last_id)))
+    db.session.remove()
+    return users
+
+# Nearest-rank percentile of an ascending list
+def percentile(ordered, fraction):
+    if not ordered:
+        return 0.0
+    rank = math.ceil(fraction * len(ordered))
+    return ordered[max(rank, 1) - 1]
+
+# Stops early when the scenario runs out of data, e.g. notes_read_one
+# without seeded notes, and reports only the requests that were sent
+def run_scenario(ctx, name, requests, warmup):
+    scenario = SCENARIOS[name]
+    latencies = []
+    errors = 0
+    try:
+        for _ in range(warmup):
+            scenario(ctx)
+
+        started = time.perf_counter()
+        with query_stats.collect() as statements:
+            for _ in range(requests):
+                begin = time.perf_counter()
+                response, expected = scenario(ctx)
+                latencies.append(time.perf_counter() - begin)
+                if response.status_code != expected:
+                    errors += 1
+    except NoData:
+        pass
+    elapsed = time.perf_counter() - started if latencies else 0.0
+
+    if not latencies:
+        return {"requests": 0, "errors": 0, "skipped": "no data"}
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput_rps": round(len(latencies) / elapsed, 1),
+        "queries_per_request": round(len(statements) / len(latencies), 2),
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 3),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+    }
@@ -0,0 +1,118 @@
+# Benchmark concurrent note creation with and without group commit
+# Usage: python -m benchmarks.group_commit --threads 1 8 32 --notes 50 --window 0.002
+#
+# Runs against a SQLite file so that every commit is a real fsync, which is what
+# group commit saves. The database lives in a temporary directory, under --dir if
+# given, which should be on the disk to measure.
+
+import os
+import argparse
+import json
+import tempfile
+import threading
+import time
+
+# Set the environment variable to determine the app configuration
+os.environ['CONFIG'] = 'TESTING'
+
+from application.app import create_app
+from configuration.config import Config, db
+from application.models import User
+from helpers import group_commit
+from helpers.passwords import hash_password
+
+USERNAME = 'benchuser'
+PASSWORD = 'B3nchmark!'
+
+
+class FileConfig(Config):
+    def __init__(self, path):
+        super().__init__('TESTING')
+        self.path = path
+
+    @property
+    def SQLALCHEMY_DATABASE_URI(self):
+        return f"sqlite:///{self.path}"
+
+    # Writers wait for each other instead of failing with "database is locked"
+    @property
+    def SQLALCHEMY_ENGINE_OPTIONS(self):
+        return {'connect_args': {'timeout': 60}}
+
+
+def setup(app):
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        user = User(username=USERNAME, password=hash_password(PASSWORD))
+        db.session.add(user)
+        db.session.commit()
+        user_id = user.id
+
+    response = app.test_client().post('/api/login', data=json.dumps({'username': USERNAME, 'password': PASSWORD}), content_type='application/json')
+    return user_id, {'Authorization': f'Bearer {response.get_json()["access_token"]}'}
+
+def run(app, threads, notes, enabled):
+    app.config['GROUP_COMMIT_ENABLED'] = enabled
+    user_id, headers = setup(app)
+    committer = group_commit.committer(app)
+    batches, writes = committer.batches, committer.writes
+    errors = []
+    start = threading.Barrier(threads + 1)
+
+    def client():
+        test_client = app.test_client()
+        start.wait()
+        for i in range(notes):
+            response = test_client.post(f'/api/users/{user_id}/notes', data=json.dumps({'content': f'note {i}'}), headers=headers, content_type='application/json')
+            if response.status_code != 201:
+                errors.append(response.status_code)
+
+    workers = [threading.Thread(target=client) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    start.wait()
+    started = time.perf_counter()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - started
+
+    result = {
+        "threads": threads,
+        "writes": threads * notes,
+        "errors": len(errors),
+        "writes_per_second": round(threads * notes / elapsed, 1),
+        "mean_latency_ms": round(elapsed / notes * 1000, 3),
+    }
+    if enabled:
+        batches, writes = committer.batches - batches, committer.writes - writes
+        result["commits"] = batches
+        result["mean_batch_size"] = round(writes / batches, 2) if batches else 0.0
+    return result
+
+def bench(thread_counts, notes, window, parent=None):
+    with tempfile.TemporaryDirectory(dir=parent) as directory:
+        app = create_app(FileConfig(os.path.abspath(os.path.join(directory, 'bench.db'))))
+        app.config['GROUP_COMMIT_WINDOW'] = window
+        results = []
+        for threads in thread_counts:
+            single = run(app, threads, notes, False)
+            grouped = run(app, threads, notes, True)
+            results.append({
+                "threads": threads,
+                "commit_per_write": single,
+                "group_commit": grouped,
+                "speedup": round(grouped["writes_per_second"] / single["writes_per_second"], 2),
+            })
+        return {"window_seconds": window, "notes_per_thread": notes, "results": results}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark note writes with and without group commit")
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 8, 32])
+    parser.add_argument('--notes', type=int, default=50, help="notes created by every thread")
+    parser.add_argument('--window', type=float, default=0.002, help="GROUP_COMMIT_WINDOW in seconds")
+    parser.add_argument('--dir', default=None, help="directory to create the database in")
+    args = parser.parse_args()
+
+    print(json.dumps(bench(args.threads, args.notes, args.window, args.dir), indent=2))
@@ -0,0 +1,71 @@
+# Benchmark login throughput at several password hashing costs
+# Usage: python -m benchmarks.login --iterations 1000 100000 260000 --logins 50 --threads 8
+
+import os
+import argparse
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Set the environment variable to determine the app configuration
+os.environ['CONFIG'] = 'TESTING'
+
+from application.app import create_app
+from configuration.config import db
+from application.models import User
+from helpers.passwords import hash_password, verify_password
+
+app = create_app()
+
+USERNAME = 'benchuser'
+PASSWORD = 'B3nchmark!'
+
+
+def bench(iterations, logins, threads):
+    app.config['PASSWORD_HASH_ITERATIONS'] = iterations
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        user = User(username=USERNAME, password=hash_password(PASSWORD))
+        db.session.add(user)
+        db.session.commit()
+        password_hash = user.password
+
+    # Sequential logins through the full request path
+    client = app.test_client()
+    body = json.dumps({'username': USERNAME, 'password': PASSWORD})
+    start = time.perf_counter()
+    for _ in range(logins):
+        response = client.post('/api/login', data=body, content_type='application/json')
+        assert response.status_code == 200
+    sequential = logins / (time.perf_counter() - start)
+
+    # A burst of concurrent verifications sharing the hashing pool
+    def verify(_):
+        with app.app_context():
+            return verify_password(password_hash, PASSWORD)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as clients:
+        assert all(clients.map(verify, range(logins)))
+    concurrent = logins / (time.perf_counter() - start)
+
+    return {
+        "iterations": iterations,
+        "logins_per_second": round(sequential, 1),
+        "concurrent_verifications_per_second": round(concurrent, 1),
+        "threads": threads,
+        "pool_workers": app.config['PASSWORD_HASH_WORKERS'],
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark login throughput at several hashing costs")
+    parser.add_argument('--iterations', type=int, nargs='+', default=[1000, 50000, 260000])
+    parser.add_argument('--logins', type=int, default=50)
+    parser.add_argument('--threads', type=int, default=8)
+    args = parser.parse_args()
+
+    results = [bench(iterations, args.logins, args.threads) for iterations in args.iterations]
+    print(json.dumps(results, indent=2))
@@ -0,0 +1,64 @@
+# Benchmark list serialization: marshmallow + jsonify against the precompiled serializers
+# Usage: python -m benchmarks.serialization --rows 10000 --repeat 5
+
+import os
+import argparse
+import json
+import time
+from datetime import datetime, timedelta
+
+# Set the environment variable to determine the app configuration
+os.environ['CONFIG'] = 'TESTING'
+
+from flask import jsonify
+from application.app import create_app
+from application.models import User, Note
+from application.schemas import note_schema, user_schema_private
+from application.serializers import serialize_note, serialize_user_private, json_response
+
+app = create_app()
+
+
+def make_rows(count):
+    start = datetime(2024, 1, 1)
+    notes = [
+        Note(id=i, user_id=i % 100, content=f"note number {i} " * 8, timestamp=start + timedelta(seconds=i), updated_at=start + timedelta(seconds=i))
+        for i in range(count)
+    ]
+    users = [User(id=i, username=f"user{i}", timestamp=start + timedelta(seconds=i)) for i in range(count)]
+    return notes, users
+
+def best_of(repeat, fn):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+def bench(rows, repeat):
+    notes, users = make_rows(rows)
+    results = {}
+    with app.test_request_context():
+        for name, objects, schema, serialize in (
+            ("notes", notes, note_schema, serialize_note),
+            ("users", users, user_schema_private, serialize_user_private),
+        ):
+            marshmallow = best_of(repeat, lambda: jsonify(schema.dump(objects, many=True)).get_data())
+            compiled = best_of(repeat, lambda: json_response([serialize(obj) for obj in objects]).get_data())
+            results[name] = {
+                "rows": rows,
+                "marshmallow_ms": round(marshmallow * 1000, 2),
+                "compiled_ms": round(compiled * 1000, 2),
+                "speedup": round(marshmallow / compiled, 1),
+            }
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark list serialization paths")
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    print(json.dumps(bench(args.rows, args.repeat), indent=2))
@@ -0,0 +1,49 @@
+# Benchmark app startup in fresh interpreters: imports, create_app() steps and the first request
+# Usage: python -m benchmarks.startup --runs 10
+
+import os
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+# Runs in a new interpreter per measurement, so nothing is imported or cached yet
+PROBE = """
+import json, os, time
+os.environ['CONFIG'] = 'TESTING'
+started = time.perf_counter()
+from application.app import create_app
+imported = time.perf_counter()
+app = create_app()
+created = time.perf_counter()
+response = app.test_client().get('/api/docs')
+assert response.status_code == 200
+finished = time.perf_counter()
+timings = {'import': imported - started, **{f"create_app.{name}": seconds for name, seconds in app.extensions['startup'].items()}}
+timings['first_request'] = finished - created
+timings['total'] = finished - started
+print(json.dumps(timings))
+"""
+
+
+def measure():
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    output = subprocess.run([sys.executable, '-c', PROBE], cwd=root, check=True, capture_output=True, text=True).stdout
+    return json.loads(output)
+
+def bench(runs):
+    samples = [measure() for _ in range(runs)]
+    return {
+        "runs": runs,
+        "median_ms": {name: round(statistics.median(sample[name] for sample in samples) * 1000, 2) for name in samples[0]},
+        "max_ms": {name: round(max(sample[name] for sample in samples) * 1000, 2) for name in samples[0]},
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark app startup")
+    parser.add_argument('--runs', type=int, default=10)
+    args = parser.parse_args()
+
+    print(json.dumps(bench(args.runs), indent=2))
@@ -1,118 +1,68 @@
 import os
-from datetime import datetime, timezone
-from werkzeug.security import generate_password_hash
+import argparse
+import time
 import toml
-from sqlalchemy import create_engine, text, inspect
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy import text, inspect
 
 # Set the environment variable to determine the app configuration
 os.environ['CONFIG'] = 'DEVELOPMENT'
 
-from configuration.config import app, db
-from application.models import User, Note, Friend, Role, Permission
-
-def drop_all(engine):
-    inspector = inspect(engine)
-
-    # Disable foreign key checks
-    with engine.connect() as connection:
-        connection.execute(text('SET foreign_key_checks = 0;'))
-
+from configuration.config import db
+from application.app import create_app
+from application import seeding
+from helpers import timelines
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Recreate the database and seed it")
+    parser.add_argument('--users', type=int, default=0, help="number of synthetic users to generate")
+    parser.add_argument('--notes-per-user', type=int, default=0, help="notes generated for every synthetic user")
+    parser.add_argument('--mean-friends', type=float, default=20, help="average friends added by a synthetic user")
+    parser.add_argument('--seed', type=int, default=0, help="random seed of the synthetic data")
+    parser.add_argument('--batch-size', type=int, default=5000, help="rows per insert statement")
+    parser.add_argument('--timelines', action='store_true', help="rebuild the fan-out timelines afterwards")
+    return parser.parse_args()
+
+def drop_all(connection):
+    # Disable foreign key checks so tables can go in any order
+    connection.execute(text('SET foreign_key_checks = 0;'))
     try:
-        # Get all tables
-        tables = inspector.get_table_names()
-
-        # Drop all tables
-        for table in tables:
-            with engine.connect() as connection:
-                connection.execute(text(f'DROP TABLE IF EXISTS `{table}`;'))
-
-    except Exception as e:
-        print(f"Error dropping tables: {e}")
-
+        for table in inspect(connection).get_table_names():
+            connection.execute(text(f'DROP TABLE IF EXISTS `{table}`;'))
     finally:
-        # Re-enable foreign key checks
-        with engine.connect() as connection:
-            connection.execute(text('SET foreign_key_checks = 1;'))
-
-def create_role_if_not_exists(session, role_name):
-    role = session.query(Role).filter_by(name=role_name).first()
-    if not role:
-        role = Role(name=role_name)
-        session.add(role)
-        session.commit()
-    return role
+        connection.execute(text('SET foreign_key_checks = 1;'))
 
-def create_permission_if_not_exists(session, permission_name):
-    permission = session.query(Permission).filter_by(name=permission_name).first()
-    if not permission:
-        permission = Permission(name=permission_name)
-        session.add(permission)
-        session.commit()
-    return permission
+# Main
+if __name__ == '__main__':
+    args = parse_args()
+    app = create_app()
 
-def assign_permission_to_role(session, permission_name, role_name):
-    role = session.query(Role).filter_by(name=role_name).first()
-    permission = session.query(Permission).filter_by(name=permission_name).first()
-    if role and permission:
-        if not any(p.id == permission.id for p in role.permissions):
-            role.add_permission(permission)
-            session.commit()
+    with app.app_context():
+        engine = db.engine
+        started = time.perf_counter()
 
-def assign_role_to_user(session, username, role_name):
-    user = session.query(User).filter_by(username=username).first()
-    role = session.query(Role).filter_by(name=role_name).first()
-    if user and role:
-        if role not in user.roles:
-            user.roles.append(role)
-            session.commit()
+        # Drop and create all tables over a single connection
+        with engine.begin() as connection:
+            drop_all(connection)
+            db.metadata.create_all(connection)
 
-def create_admin_users(session):
-    try:
         # Load config from config file
         with open('configuration/elevated_users.toml', 'r') as file:
             config = toml.load(file)
 
-        # Initialize roles and permissions from config
-        for role_name in config['users']['elevated_users']:
-            create_role_if_not_exists(session, role_name)
-
-        for role_name, permissions in config['permissions'].items():
-            for permission_name in permissions:
-                create_permission_if_not_exists(session, permission_name)
-                assign_permission_to_role(session, permission_name, role_name)
-
-        # Create privileged admins from config
-        elevated_users = config['users']['elevated_users']
-        for i, username in enumerate(elevated_users, start=1):
-            admin_user = User(
-                id=i,
-                username=username,
-                password=generate_password_hash(username)
-            )
-            session.add(admin_user)
-            session.commit()
-            assign_role_to_user(session, username=username, role_name=username)
-
-    except SQLAlchemyError as e:
-        print(f"Error creating admin users: {e}")
-
-# Main
-with app.app_context():
-    engine = db.engine
-    Session = sessionmaker(bind=engine)
-
-    # Drop all tables
-    drop_all(engine)
-
-    # Create all tables
-    db.metadata.create_all(engine)
-
-    session = Session()
-
-    # Create and add admin users dynamically
-    create_admin_users(session)
-
-    session.close()
-    print("Database initialized successfully")
+        # Seed everything in one transaction
+        with engine.begin() as connection:
+            counts = seeding.seed_admins(connection, config)
+            if args.users:
+                synthetic = seeding.generate(
+                    connection, args.users, args.notes_per_user,
+                    mean_friends=args.mean_friends, seed=args.seed, batch_size=args.batch_size
+                )
+                for table, count in synthetic.items():
+                    counts[table] = counts.get(table, 0) + count
+
+        if args.timelines:
+            timelines.rebuild()
+
+        for table, count in sorted(counts.items()):
+            print(f"{table}: {count} rows")
+        print(f"Database initialized successfully in {time.perf_counter() - started:.1f}s")
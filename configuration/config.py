@@ -1,29 +1,77 @@
 import os
 import toml
-from flask import Flask
+from functools import cached_property
 from flask_sqlalchemy import SQLAlchemy
 from flask_marshmallow import Marshmallow
 from flask_jwt_extended import JWTManager
+from helpers.db_routing import RoutingSession
 
 
-# Set the configuration type based on the CONFIG environment variable
-config_type = os.getenv('CONFIG')
-
 class Config:
-    def __init__(self):
-        # Load config from config file
-        self._config = toml.load("configuration/database_config.toml")
+    def __init__(self, config_type=None, database=None):
+        # Set the configuration type based on the CONFIG environment variable unless given
+        self.config_type = config_type or os.getenv('CONFIG')
+        # Settings used instead of the config file's [database], e.g. by tests
+        self._database_override = database
+
+    # Load config from config file, the first time a database setting is needed
+    @cached_property
+    def _config(self):
+        return toml.load("configuration/database_config.toml")
 
     # Set relevant properties
 
+    # The [database] settings, an in-memory SQLite database when testing
+    @property
+    def _database(self):
+        if self._database_override is not None:
+            return self._database_override
+        if self.config_type == 'TESTING':
+            return {'uri': "sqlite:///:memory:"}
+        return self._config['database']
+
+    # A uri key is used as is, otherwise the URI is built from the MariaDB settings
+    def _database_uri(self, database):
+        if 'uri' in database:
+            return database['uri']
+        return f"mariadb+pymysql://{database['user']}:{database['password']}@{database['host']}:{database['port']}/{database['name']}"
+
     @property
     def SQLALCHEMY_DATABASE_URI(self):
-        if config_type == 'TESTING':
-            return "sqlite:///:memory:"
-        elif config_type == 'DEVELOPMENT':
-            return f"mariadb+pymysql://{self._config['database']['user']}:{self._config['database']['password']}@{self._config['database']['host']}:{self._config['database']['port']}/{self._config['database']['name']}"
-        else:
+        if self.config_type not in ('TESTING', 'DEVELOPMENT'):
             raise ValueError("Invalid CONFIG environment variable value")
+        return self._database_uri(self._database)
+
+    # Connection pool settings from [database.pool], applied to the primary and every replica
+    @property
+    def SQLALCHEMY_ENGINE_OPTIONS(self):
+        if self.config_type == 'TESTING':
+            return {}
+        pool = self._database.get('pool', {})
+        return {
+            'pool_size': pool.get('size', 10),
+            'max_overflow': pool.get('max_overflow', 20),
+            'pool_timeout': pool.get('timeout', 30),
+            'pool_pre_ping': pool.get('pre_ping', True),
+            'pool_recycle': pool.get('recycle', 1800),
+        }
+
+    # Read replicas from [[database.replicas]], each entry overriding the primary's settings or giving a uri
+    # GET requests are routed to them by helpers.db_routing
+    @property
+    def SQLALCHEMY_BINDS(self):
+        # The primary's uri is not inherited, a replica gives its own or the settings to build one
+        database = {key: value for key, value in self._database.items() if key not in ('pool', 'replicas', 'uri')}
+        return {
+            f"replica_{index}": self._database_uri({**database, **replica})
+            for index, replica in enumerate(self._database.get('replicas', []))
+        }
+
+    # Seconds a client that wrote keeps reading from the primary
+    @property
+    def REPLICA_STICKY_SECONDS(self):
+        return 5
+
     @property
     def SQLALCHEMY_TRACK_MODIFICATIONS(self):
         return False
@@ -32,24 +80,183 @@ class Config:
     def JWT_SECRET_KEY(self):
         return 'Mobptimus Prime'
 
+    # Seconds the in-process RBAC cache may serve data before reloading it
+    # Writes made by this process invalidate it immediately
     @property
-    def TESTING(self):
-        return config_type == 'TESTING'
+    def RBAC_CACHE_TTL(self):
+        return 60
 
+    # Seconds the authorization claims of a JWT are trusted before re-validating them
     @property
-    def WTF_CSRF_ENABLED(self):
-        return False if config_type == 'TESTING' else True
+    def JWT_CLAIMS_REVALIDATE_SECONDS(self):
+        return 300
+
+    # Serve friendship checks and friend lists from the in-memory friend index
+    @property
+    def FRIEND_INDEX_ENABLED(self):
+        return False
 
-config = Config()
+    # Seconds between full reloads of the friend index
+    @property
+    def FRIEND_INDEX_RELOAD_SECONDS(self):
+        return 60
 
-# Create the Flask app
-app = Flask(__name__,
-            static_url_path='',
-            static_folder='../static',
-            template_folder='../templates')
-app.config.from_object(config)
+    # Password hashing parameters, stored hashes using others are rehashed on login
+    @property
+    def PASSWORD_HASH_METHOD(self):
+        return 'pbkdf2:sha256'
+
+    @property
+    def PASSWORD_HASH_ITERATIONS(self):
+        return 1000 if self.config_type == 'TESTING' else 260000
+
+    # Size of the worker pool that runs password hashing
+    @property
+    def PASSWORD_HASH_WORKERS(self):
+        return 4
+
+    # Page size used when only a cursor is given, and the largest page served
+    @property
+    def PAGINATION_DEFAULT_LIMIT(self):
+        return 50
+
+    @property
+    def PAGINATION_MAX_LIMIT(self):
+        return 500
+
+    # Rows fetched per round trip when streaming NDJSON exports
+    @property
+    def STREAM_BATCH_SIZE(self):
+        return 1000
+
+    # Fan notes out into materialized friend timelines when they are posted
+    @property
+    def TIMELINE_FANOUT_ENABLED(self):
+        return False
+
+    # Read-through cache for single users and notes, per process
+    # Writes through other processes are only seen once an entry's TTL runs out
+    @property
+    def RESPONSE_CACHE_ENABLED(self):
+        return False
+
+    @property
+    def RESPONSE_CACHE_SIZE(self):
+        return 10000
+
+    @property
+    def RESPONSE_CACHE_TTL(self):
+        return 30
+
+    # Maximum number of operations accepted by the bulk notes and friends endpoints
+    @property
+    def NOTES_BATCH_MAX_SIZE(self):
+        return 500
+
+    @property
+    def FRIENDS_BATCH_MAX_SIZE(self):
+        return 1000
+
+    # Commit concurrent note writes together, gathering them for up to GROUP_COMMIT_WINDOW seconds
+    @property
+    def GROUP_COMMIT_ENABLED(self):
+        return False
+
+    @property
+    def GROUP_COMMIT_WINDOW(self):
+        return 0.002
+
+    @property
+    def GROUP_COMMIT_MAX_SIZE(self):
+        return 100
+
+    # Users with more notes and friends than this are deleted in the background by
+    # helpers.user_purge, USER_PURGE_BATCH_SIZE rows per transaction. None deletes every user at once
+    @property
+    def USER_DELETE_ASYNC_THRESHOLD(self):
+        return None
+
+    @property
+    def USER_PURGE_BATCH_SIZE(self):
+        return 1000
+
+    # Report each request's SQL statement count and time in a Server-Timing header
+    @property
+    def SERVER_TIMING_ENABLED(self):
+        return True
+
+    # Directory each process writes its request metrics to, so /metrics can report
+    # all workers of a multi-process deployment; unset reports this process only
+    @property
+    def METRICS_DIR(self):
+        return os.getenv('METRICS_DIR')
+
+    # Seconds between writes of a process's metrics file
+    @property
+    def METRICS_FLUSH_SECONDS(self):
+        return 1.0
+
+    # Upper bounds in seconds of the latency histogram buckets
+    @property
+    def METRICS_BUCKETS(self):
+        return (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    # Sampling profiler, writes collapsed stacks of profiled requests to PROFILER_DIR
+    # Profiles a PROFILER_SAMPLE_RATE share of requests plus those of admins sending X-Profile
+    @property
+    def PROFILER_ENABLED(self):
+        return False
+
+    @property
+    def PROFILER_SAMPLE_RATE(self):
+        return 0.0
+
+    @property
+    def PROFILER_DIR(self):
+        return 'profiles'
+
+    # Seconds between stack samples, and the longest a single request is sampled
+    @property
+    def PROFILER_INTERVAL(self):
+        return 0.005
+
+    @property
+    def PROFILER_MAX_SECONDS(self):
+        return 30
+
+    @property
+    def PROFILER_MAX_CONCURRENT(self):
+        return 2
+
+    # Worker processes forked by run_server.py, each serving requests on threads if SERVER_THREADED
+    @property
+    def SERVER_WORKERS(self):
+        return os.cpu_count() or 1
+
+    @property
+    def SERVER_THREADED(self):
+        return True
+
+    # Seconds workers get to finish in-flight requests on shutdown before they are killed
+    @property
+    def SERVER_GRACEFUL_TIMEOUT(self):
+        return 30
+
+    # Seconds a reload waits for a new worker to serve before giving up on replacing the rest
+    @property
+    def SERVER_START_TIMEOUT(self):
+        return 30
+
+    @property
+    def TESTING(self):
+        return self.config_type == 'TESTING'
+
+    @property
+    def WTF_CSRF_ENABLED(self):
+        return False if self.config_type == 'TESTING' else True
 
-# Initialize JWT, SQLAlchemy, and Marshmallow with the Flask app
-jwt = JWTManager(app)
-db = SQLAlchemy(app)
-ma = Marshmallow(app)
+# Create JWT, SQLAlchemy, and Marshmallow unbound
+# application.app.create_app binds them to the app it creates
+jwt = JWTManager()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+ma = Marshmallow()
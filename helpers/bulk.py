@@ -0,0 +1,30 @@
+# Dialect-aware bulk statements
+#
+# insert_ignore() writes many rows with a single multi-row INSERT that skips
+# rows violating a unique constraint instead of failing the whole statement:
+# ON CONFLICT DO NOTHING on SQLite/PostgreSQL, a no-op ON DUPLICATE KEY UPDATE
+# on MySQL/MariaDB.
+
+from sqlalchemy import insert
+from sqlalchemy.dialects import sqlite, mysql, postgresql
+from configuration.config import db
+
+
+def insert_ignore(model, rows):
+    if not rows:
+        return
+    dialect = db.session.get_bind().dialect.name
+
+    if dialect == 'sqlite':
+        statement = sqlite.insert(model).values(rows).on_conflict_do_nothing()
+    elif dialect == 'postgresql':
+        statement = postgresql.insert(model).values(rows).on_conflict_do_nothing()
+    elif dialect in ('mysql', 'mariadb'):
+        statement = mysql.insert(model).values(rows)
+        # Assigning the primary key to itself leaves duplicates untouched
+        key = model.__table__.primary_key.columns.values()[0]
+        statement = statement.on_duplicate_key_update({key.name: key})
+    else:
+        statement = insert(model).values(rows)
+
+    db.session.execute(statement)
@@ -0,0 +1,95 @@
+# Read-replica routing
+#
+# The session sends the queries of GET and HEAD requests to a read replica,
+# any engine bound under a "replica_" key, and everything else to the primary.
+# A request that writes stays on the primary for the rest of the request, and a
+# cookie pins the client to the primary for REPLICA_STICKY_SECONDS afterwards so
+# it reads its own writes while the replicas catch up. Code that must not see
+# replication lag (e.g. caches of authorization data) reads inside use_primary().
+
+import random
+import time
+from contextlib import contextmanager
+from flask import request, has_request_context
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+
+STICKY_COOKIE = 'db_primary_until'
+REPLICA_PREFIX = 'replica_'
+
+# Per-request routing state lives in the WSGI environ
+WROTE_KEY = 'db_routing.wrote'
+REPLICA_KEY = 'db_routing.replica'
+
+
+class RoutingSession(Session):
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and self._reads_from_replica():
+            replica = _request_replica(self._db.engines)
+            if replica is not None:
+                return replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def _reads_from_replica(self):
+        if self._flushing or self.info.get('use_primary') or not has_request_context():
+            return False
+        if request.method not in ('GET', 'HEAD') or request.environ.get(WROTE_KEY):
+            return False
+        return not _pinned_to_primary()
+
+
+# The replica engine used for the whole request, None without replicas
+def _request_replica(engines):
+    if REPLICA_KEY not in request.environ:
+        replicas = sorted(key for key in engines if key and key.startswith(REPLICA_PREFIX))
+        request.environ[REPLICA_KEY] = random.choice(replicas) if replicas else None
+    key = request.environ[REPLICA_KEY]
+    return engines.get(key) if key is not None else None
+
+def _pinned_to_primary():
+    try:
+        return float(request.cookies.get(STICKY_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+@contextmanager
+def use_primary(session):
+    previous = session.info.get('use_primary', False)
+    session.info['use_primary'] = True
+    try:
+        yield
+    finally:
+        session.info['use_primary'] = previous
+
+
+# Count the current request as a write, for writes made through another session
+def mark_write():
+    if has_request_context():
+        request.environ[WROTE_KEY] = True
+
+
+def _has_replicas(engines):
+    return any(key and key.startswith(REPLICA_PREFIX) for key in engines)
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _after_flush(session, flush_context):
+    if has_request_context():
+        request.environ[WROTE_KEY] = True
+
+# Core INSERT/UPDATE/DELETE run through the session count as writes too, and
+# are marked before the session picks their engine
+@event.listens_for(RoutingSession, 'do_orm_execute')
+def _do_orm_execute(orm_execute_state):
+    if not orm_execute_state.is_select and has_request_context():
+        request.environ[WROTE_KEY] = True
+
+
+def init_app(app):
+    @app.after_request
+    def pin_writers_to_primary(response):
+        if request.environ.get(WROTE_KEY) and _has_replicas(app.extensions['sqlalchemy'].engines):
+            seconds = app.config['REPLICA_STICKY_SECONDS']
+            response.set_cookie(STICKY_COOKIE, str(time.time() + seconds), max_age=seconds, httponly=True)
+        return response
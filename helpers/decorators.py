@@ -1,28 +1,61 @@
+import time
+from collections import namedtuple
 from functools import wraps
-from flask import request, jsonify
-from flask_jwt_extended import get_jwt_identity
-from application.models import User, Permission
+from flask import request, jsonify, current_app
+from flask_jwt_extended import get_jwt_identity, get_jwt
+from sqlalchemy import select, exists
+from configuration.config import db
+from application.models import User, Friend
 from helpers.common_responses import unauthorized, forbidden
+from helpers.rbac_cache import rbac_cache
+
+Caller = namedtuple('Caller', ['id', 'roles', 'permissions'])
+
+# Claims issued by login() can be trusted without a lookup while they are younger
+# than JWT_CLAIMS_REVALIDATE_SECONDS and no authorization write happened since
+def _claims_are_fresh(claims):
+    if 'uid' not in claims or 'perms' not in claims:
+        return False
+
+    interval = current_app.config.get('JWT_CLAIMS_REVALIDATE_SECONDS')
+    if not interval:
+        return False
+
+    issued_at = claims.get('iat', 0)
+    return time.time() - issued_at < interval and issued_at > rbac_cache.last_write
+
+# Resolve the caller of the current request, returns None if the JWT is invalid
+def current_caller():
+    current_user = get_jwt_identity()
+
+    if not current_user:
+        return None
+
+    claims = get_jwt()
+
+    if _claims_are_fresh(claims):
+        return Caller(claims['uid'], frozenset(claims['roles']), frozenset(claims['perms']))
+
+    # Stale or legacy token, re-validate against the RBAC cache
+    user = rbac_cache.get_user(current_user['username'])
+
+    if not user or claims.get('uid', user.id) != user.id:
+        return None
+
+    return Caller(user.id, user.roles, rbac_cache.permissions_of(user))
 
 # Decorator that only authorizes privileged admins to invoking function
 def admin_required(permission_name):
     def decorator(f):
         @wraps(f)
         def decorated_function(*args, **kwargs):
-            current_user = get_jwt_identity()
-
-            if not current_user:
-                return unauthorized()
-
-            user = User.query.filter_by(username=current_user['username']).first()
+            user = current_caller()
 
             if not user:
                 return unauthorized()
 
-            permission = Permission.query.filter_by(name=permission_name).first()
-
             # Check if user has the required permission
-            if not any(role.has_permission(permission) for role in user.roles):
+            if permission_name not in user.permissions:
                 return forbidden()
 
             return f(*args, **kwargs)
@@ -30,16 +63,12 @@ def admin_required(permission_name):
     return decorator
 
 # Decorator that authorizes privileged admins and resource owners to invoking function
-def permission_required(permission_name):
+# Admins need every one of the given permissions
+def permission_required(*permission_names):
     def decorator(f):
         @wraps(f)
         def decorated_function(*args, **kwargs):
-            current_user = get_jwt_identity()
-
-            if not current_user:
-                return unauthorized()
-
-            user = User.query.filter_by(username=current_user['username']).first()
+            user = current_caller()
 
             if not user:
                 return unauthorized()
@@ -47,10 +76,8 @@ def permission_required(permission_name):
             if 'user_id' not in kwargs:
                 return forbidden()
 
-            permission = Permission.query.filter_by(name=permission_name).first()
-
-            # Check if user has the required permission
-            if not any(role.has_permission(permission) for role in user.roles) and kwargs['user_id'] != user.id:
+            # Check if user owns the resource or has the required permission
+            if kwargs['user_id'] != user.id and not user.permissions.issuperset(permission_names):
                 return forbidden()
 
             return f(*args, **kwargs)
@@ -62,12 +89,7 @@ def access_required(permission_name):
     def decorator(f):
         @wraps(f)
         def decorated_function(*args, **kwargs):
-            current_user = get_jwt_identity()
-
-            if not current_user:
-                return unauthorized()
-
-            user = User.query.filter_by(username=current_user['username']).first()
+            user = current_caller()
 
             if not user:
                 return unauthorized()
@@ -75,17 +97,19 @@ def access_required(permission_name):
             if 'user_id' not in kwargs:
                 return forbidden()
 
-            target_user = User.query.get(kwargs['user_id'])
+            # Check target existence and friendship in a single statement
+            target_exists, is_friend = db.session.execute(select(
+                exists().where(User.id == kwargs['user_id']),
+                exists().where((Friend.user_id == kwargs['user_id']) & (Friend.friend_id == user.id))
+            )).one()
 
-            if not target_user:
+            if not target_exists:
                 return forbidden()
 
-            permission = Permission.query.filter_by(name=permission_name).first()
-
             if (
-                not target_user.is_friend(user.id) and
                 kwargs['user_id'] != user.id and
-                not any(role.has_permission(permission) for role in user.roles)
+                permission_name not in user.permissions and
+                not is_friend
             ):
                 return forbidden()
 
@@ -0,0 +1,44 @@
+# Strong ETags and conditional GETs for the notes and friends lists
+#
+# Every user row carries a notes_version and friends_version counter that the
+# write handlers bump in the same transaction as the change. An ETag is derived
+# from the counter plus everything else that shapes the response, so checking
+# If-None-Match costs one primary key lookup and no list query or serialization.
+
+import hashlib
+from flask import request, current_app
+from sqlalchemy import select, update
+from configuration.config import db
+from application.models import User
+
+NOTES = 'notes_version'
+FRIENDS = 'friends_version'
+
+
+# Increment a counter for the given user ids (an iterable or a select of ids)
+def bump(kind, user_ids):
+    column = getattr(User, kind)
+    db.session.execute(
+        update(User)
+        .where(User.id.in_(user_ids))
+        # Keep the user's own timestamp, only their notes/friends changed
+        .values({column: column + 1, User.timestamp: User.timestamp})
+        .execution_options(synchronize_session=False)
+    )
+
+# Current counter value, None if the user does not exist
+def current_version(kind, user_id):
+    return db.session.execute(select(getattr(User, kind)).where(User.id == user_id)).scalar()
+
+def make_etag(kind, user_id, version):
+    variant = f"{request.query_string.decode()}|{request.headers.get('Accept', '')}"
+    digest = hashlib.sha1(variant.encode()).hexdigest()[:12]
+    return f"{kind.split('_')[0]}-{user_id}-{version}-{digest}"
+
+def is_fresh(etag):
+    return request.if_none_match.contains(etag)
+
+def not_modified(etag):
+    response = current_app.response_class(status=304)
+    response.set_etag(etag)
+    return response
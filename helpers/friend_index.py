@@ -0,0 +1,154 @@
+# Optional in-memory adjacency index of the friend graph
+#
+# Keeps, per user, a sorted integer array of the ids they added as friends and a
+# reverse array of the ids that added them. Friendship checks become a binary
+# search and friend lists a plain read instead of a walk over the friend table.
+# Enabled with FRIEND_INDEX_ENABLED, loaded on first use and kept current by the
+# friends/users handlers. A full reload every FRIEND_INDEX_RELOAD_SECONDS picks
+# up writes made by other processes. The index also remembers the friends_version
+# each user's friends were read at, so a reader that knows a newer version (e.g.
+# for an ETag) gets that user's friends reread from the table first.
+
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from configuration.config import db
+from helpers.db_routing import use_primary
+
+
+def _contains(ids, value):
+    i = bisect_left(ids, value)
+    return i < len(ids) and ids[i] == value
+
+def _insert(ids, value):
+    i = bisect_left(ids, value)
+    if i < len(ids) and ids[i] == value:
+        return
+    ids.insert(i, value)
+
+def _discard(ids, value):
+    i = bisect_left(ids, value)
+    if i < len(ids) and ids[i] == value:
+        del ids[i]
+
+
+class FriendIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._friends = {}
+        self._added_by = {}
+        self._versions = {}
+        self._loaded_at = None
+
+    @property
+    def loaded(self):
+        return self._loaded_at is not None
+
+    def enabled(self):
+        return has_app_context() and current_app.config.get('FRIEND_INDEX_ENABLED', False)
+
+    # Build both directions of the index from the friend table
+    def load(self):
+        from application.models import Friend, User
+
+        friends = {}
+        added_by = {}
+        with use_primary(db.session):
+            # Versions first, so the rows read after are at least as new
+            versions = dict(db.session.query(User.id, User.friends_version).all())
+            rows = db.session.query(Friend.user_id, Friend.friend_id).order_by(Friend.user_id, Friend.friend_id).all()
+        for user_id, friend_id in rows:
+            friends.setdefault(user_id, array('i')).append(friend_id)
+            added_by.setdefault(friend_id, array('i')).append(user_id)
+
+        for ids in added_by.values():
+            ids[:] = array('i', sorted(ids))
+
+        with self._lock:
+            self._friends = friends
+            self._added_by = added_by
+            self._versions = versions
+            self._loaded_at = time.monotonic()
+
+    # Reread the friends user_id has added, known to be at least at version
+    def _refresh(self, user_id, version):
+        from application.models import Friend
+
+        with use_primary(db.session):
+            rows = db.session.query(Friend.friend_id).filter(Friend.user_id == user_id).order_by(Friend.friend_id).all()
+        friend_ids = array('i', (friend_id for friend_id, in rows))
+
+        with self._lock:
+            for friend_id in self._friends.get(user_id, ()):
+                _discard(self._added_by.get(friend_id, array('i')), user_id)
+            for friend_id in friend_ids:
+                _insert(self._added_by.setdefault(friend_id, array('i')), user_id)
+            self._friends[user_id] = friend_ids
+            self._versions[user_id] = max(version, self._versions.get(user_id, version))
+
+    def reset(self):
+        with self._lock:
+            self._friends = {}
+            self._added_by = {}
+            self._versions = {}
+            self._loaded_at = None
+
+    def _ensure_loaded(self):
+        interval = current_app.config.get('FRIEND_INDEX_RELOAD_SECONDS')
+        if not self.loaded or (interval and time.monotonic() - self._loaded_at > interval):
+            self.load()
+
+    # True if user_id has added friend_id as a friend
+    def is_friend(self, user_id, friend_id):
+        self._ensure_loaded()
+        return _contains(self._friends.get(user_id, ()), friend_id)
+
+    # Ids user_id has added as friends, as of their friends_version if given
+    def friends_of(self, user_id, version=None):
+        self._ensure_loaded()
+        if version is not None and self._versions.get(user_id, -1) < version:
+            self._refresh(user_id, version)
+        return tuple(self._friends.get(user_id, ()))
+
+    # Ids of the users that have added user_id as a friend
+    def added_by(self, user_id):
+        self._ensure_loaded()
+        return tuple(self._added_by.get(user_id, ()))
+
+    # Write-through updates, called after the matching commit
+    # Nothing to do until the index has been loaded
+
+    def add(self, user_id, friend_id):
+        if not self.loaded:
+            return
+        with self._lock:
+            _insert(self._friends.setdefault(user_id, array('i')), friend_id)
+            _insert(self._added_by.setdefault(friend_id, array('i')), user_id)
+
+    def remove(self, user_id, friend_id):
+        if not self.loaded:
+            return
+        with self._lock:
+            _discard(self._friends.get(user_id, array('i')), friend_id)
+            _discard(self._added_by.get(friend_id, array('i')), user_id)
+
+    def remove_user(self, user_id):
+        if not self.loaded:
+            return
+        with self._lock:
+            self._versions.pop(user_id, None)
+            for friend_id in self._friends.pop(user_id, ()):
+                _discard(self._added_by.get(friend_id, array('i')), user_id)
+            for other_id in self._added_by.pop(user_id, ()):
+                _discard(self._friends.get(other_id, array('i')), user_id)
+
+
+friend_index = FriendIndex()
+
+
+@event.listens_for(db.metadata, 'after_drop')
+def _after_drop(target, connection, **kw):
+    friend_index.reset()
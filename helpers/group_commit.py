@@ -0,0 +1,171 @@
+# Group commit of note writes
+#
+# Each write is a function that changes the session and returns what the request
+# responds with, already serialized. Without GROUP_COMMIT_ENABLED it runs and is
+# committed in the request's own session. With it, the request hands the function
+# to a per-process committer thread and waits. The committer gathers the writes
+# that arrive within GROUP_COMMIT_WINDOW seconds (at most GROUP_COMMIT_MAX_SIZE),
+# runs each in a savepoint of one transaction and commits them with a single
+# commit, so concurrent writers share one fsync instead of paying for one each.
+#
+# Every write still gets its own outcome: one that raises is rolled back to its
+# savepoint and its exception is re-raised in its request, the others are kept.
+# If the shared commit fails, the writes are retried one transaction each.
+#
+# pysqlite commits the whole transaction when its first savepoint is released,
+# so on SQLite the writes run without savepoints. A write that raises there rolls
+# back the batch, and the other writes of the batch are run again without it.
+
+import os
+import queue
+import threading
+import time
+from flask import current_app
+from configuration.config import db
+from helpers import db_routing
+
+
+def enabled():
+    return current_app.config.get('GROUP_COMMIT_ENABLED', False)
+
+
+class _Write:
+    def __init__(self, function):
+        self.function = function
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+    def finish(self, result=None, error=None):
+        self.result = result
+        self.error = error
+        self.done.set()
+
+
+class GroupCommitter:
+    def __init__(self, app):
+        self.app = app
+        self.pid = None
+        self.queue = None
+        self.lock = threading.Lock()
+        self.batches = 0
+        self.writes = 0
+
+    # Start the committer thread, again in a forked worker since threads do not survive fork
+    def _ensure_running(self):
+        if self.pid == os.getpid():
+            return
+        with self.lock:
+            if self.pid != os.getpid():
+                self.queue = queue.Queue()
+                threading.Thread(target=self._run, name="group-commit", daemon=True).start()
+                self.pid = os.getpid()
+
+    def submit(self, function):
+        self._ensure_running()
+        write = _Write(function)
+        self.queue.put(write)
+        write.done.wait()
+        if write.error is not None:
+            raise write.error
+        return write.result
+
+    # Writes that arrive within the window after the first one, up to the maximum batch size
+    def _collect(self):
+        batch = [self.queue.get()]
+        max_size = self.app.config['GROUP_COMMIT_MAX_SIZE']
+        deadline = time.monotonic() + self.app.config['GROUP_COMMIT_WINDOW']
+        while len(batch) < max_size:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self.queue.get(timeout=remaining) if remaining > 0 else self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        with self.app.app_context():
+            while True:
+                batch = self._collect()
+                self.batches += 1
+                self.writes += len(batch)
+                try:
+                    self._commit(batch)
+                except BaseException as e:
+                    for write in batch:
+                        if not write.done.is_set():
+                            write.finish(error=e)
+                finally:
+                    db.session.remove()
+
+    def _commit(self, batch):
+        savepoints = db.engine.dialect.name != 'sqlite'
+        done = []
+        for index, write in enumerate(batch):
+            try:
+                if savepoints:
+                    with db.session.begin_nested():
+                        result = write.function()
+                else:
+                    result = write.function()
+                    db.session.flush()
+            except Exception as e:
+                write.finish(error=e)
+                if not savepoints:
+                    # Only the whole transaction can be undone, run the others again without this write
+                    db.session.rollback()
+                    return self._commit([write for write, _ in done] + batch[index + 1:])
+            else:
+                done.append((write, result))
+
+        try:
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            self._commit_one_by_one([write for write, _ in done])
+        else:
+            for write, result in done:
+                write.finish(result)
+
+    def _commit_one_by_one(self, writes):
+        for write in writes:
+            try:
+                result = write.function()
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                write.finish(error=e)
+            else:
+                write.finish(result)
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "writes": self.writes,
+            "mean_batch_size": self.writes / self.batches if self.batches else 0.0,
+        }
+
+
+_lock = threading.Lock()
+
+# The committer of an app, created on first use
+def committer(app=None):
+    app = app or current_app._get_current_object()
+    if 'group_commit' not in app.extensions:
+        with _lock:
+            app.extensions.setdefault('group_commit', GroupCommitter(app))
+    return app.extensions['group_commit']
+
+# Run function and commit what it wrote, returns its result
+# The result must not hold ORM objects, with group commit they belong to another session
+def submit(function):
+    if not enabled():
+        result = function()
+        db.session.commit()
+        return result
+
+    # Reads made so far must not hold locks the committer waits for
+    db.session.rollback()
+    result = committer().submit(function)
+    db_routing.mark_write()
+    return result
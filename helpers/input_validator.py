@@ -1,17 +1,19 @@
+from functools import lru_cache
 from string import ascii_letters, digits
 import toml
 
-# Load configs from config files
-with open('configuration/reserved_usernames.toml', 'r') as file_reserved:
-    config_reserved = toml.load(file_reserved)
+# Load configs from config files, once on first use
+@lru_cache(maxsize=None)
+def reserved_usernames():
+    with open('configuration/reserved_usernames.toml', 'r') as file_reserved:
+        config_reserved = toml.load(file_reserved)
 
-with open('configuration/elevated_users.toml', 'r') as file_elevated:
-    config_elevated = toml.load(file_elevated)
+    with open('configuration/elevated_users.toml', 'r') as file_elevated:
+        config_elevated = toml.load(file_elevated)
 
-reserved_usernames = config_reserved['users']['reserved_usernames']
-elevated_users = config_elevated['users']['elevated_users']
+    elevated_users = config_elevated['users']['elevated_users']
 
-reserved_usernames = reserved_usernames + elevated_users
+    return frozenset(config_reserved['users']['reserved_usernames'] + elevated_users)
 
 
 def password_is_valid(password):
@@ -37,4 +39,4 @@ def username_is_valid(username):
     return True
 
 def username_is_reserved(username):
-    return username in reserved_usernames
+    return username in reserved_usernames()
@@ -0,0 +1,285 @@
+# Request metrics in the Prometheus text format
+#
+# Every request is counted by status code and observed in latency, DB time and
+# JSON encoding histograms, labelled with its blueprint and endpoint. Sum over
+# the endpoint label for per-blueprint figures.
+#
+# Each process keeps its own cumulative values. When METRICS_DIR is set they are
+# written to a file per process there (at most every METRICS_FLUSH_SECONDS), and
+# /metrics merges the files of all processes, so any worker of a multi-process
+# deployment can answer a scrape. In-flight requests are only summed over
+# processes that are still alive, and a process whose file still shows requests
+# in flight writes it again as soon as it has none left. Without METRICS_DIR only this process is reported.
+
+import glob
+import json
+import os
+import threading
+import time
+from flask import request, has_request_context
+from flask.json.provider import DefaultJSONProvider
+from helpers import query_stats
+
+METRICS_MIMETYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+STARTED_KEY = 'metrics.started'
+SERIALIZATION_KEY = 'metrics.serialization'
+
+_HELP = {
+    'http_requests_total': ('counter', "Requests handled, by status code"),
+    'http_requests_in_flight': ('gauge', "Requests currently being handled"),
+    'http_request_duration_seconds': ('histogram', "Time spent handling a request"),
+    'http_request_db_seconds': ('histogram', "Time spent executing SQL statements per request"),
+    'http_request_db_queries_total': ('counter', "SQL statements executed"),
+    'http_request_serialization_seconds': ('histogram', "Time spent encoding JSON per request"),
+}
+
+
+class Registry:
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.lock = threading.Lock()
+        self.pid = os.getpid()
+        self.last_flush = 0.0
+        # Whether the last written file shows a gauge other than zero
+        self.flushed_gauges = False
+        # Keeps the files written in the order of their snapshots
+        self.flush_lock = threading.Lock()
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+
+    # A forked child starts from zero instead of reporting its parent's values twice
+    def _check_fork(self):
+        if self.pid != os.getpid():
+            self.pid = os.getpid()
+            self.last_flush = 0.0
+            self.flushed_gauges = False
+            self.counters.clear()
+            self.gauges.clear()
+            self.histograms.clear()
+
+    def inc(self, name, labels, amount=1):
+        with self.lock:
+            self._check_fork()
+            key = (name, labels)
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    # Returns the gauge's new value
+    def add(self, name, labels, amount):
+        with self.lock:
+            self._check_fork()
+            key = (name, labels)
+            self.gauges[key] = self.gauges.get(key, 0) + amount
+            return self.gauges[key]
+
+    def observe(self, name, labels, value):
+        with self.lock:
+            self._check_fork()
+            key = (name, labels)
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = [[0] * len(self.buckets), 0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    histogram[0][index] += 1
+                    break
+            histogram[1] += value
+            histogram[2] += 1
+
+    # flushing records what the snapshot shows for the file it is written to
+    def snapshot(self, flushing=False):
+        with self.lock:
+            self._check_fork()
+            if flushing:
+                self.flushed_gauges = any(self.gauges.values())
+            return {
+                'pid': self.pid,
+                'buckets': list(self.buckets),
+                'counters': [[name, list(labels), value] for (name, labels), value in self.counters.items()],
+                'gauges': [[name, list(labels), value] for (name, labels), value in self.gauges.items()],
+                'histograms': [
+                    [name, list(labels), list(counts), total, count]
+                    for (name, labels), (counts, total, count) in self.histograms.items()
+                ],
+            }
+
+    def reset(self):
+        with self.lock:
+            self.counters.clear()
+            self.gauges.clear()
+            self.histograms.clear()
+
+_registry = None
+
+
+def _labels(**labels):
+    return tuple(sorted(labels.items()))
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def _file_name(directory, pid):
+    return os.path.join(directory, f"metrics_{pid}.json")
+
+# Write this process's values to its file in the metrics directory
+def flush(app):
+    directory = app.config['METRICS_DIR']
+    if not directory:
+        return
+    with _registry.flush_lock:
+        snapshot = _registry.snapshot(flushing=True)
+        path = _file_name(directory, snapshot['pid'])
+        temporary = f"{path}.tmp"
+        with open(temporary, 'w') as file:
+            json.dump(snapshot, file)
+        os.replace(temporary, path)
+        _registry.last_flush = time.monotonic()
+
+# Snapshots of every process, this one always current
+def _snapshots(app):
+    directory = app.config['METRICS_DIR']
+    if not directory:
+        return [_registry.snapshot()]
+
+    flush(app)
+    snapshots = []
+    for path in glob.glob(os.path.join(directory, 'metrics_*.json')):
+        try:
+            with open(path, 'r') as file:
+                snapshots.append(json.load(file))
+        except (OSError, ValueError):
+            # Removed or being replaced while we read it
+            continue
+    return snapshots
+
+# Merge the snapshots of all processes into one set of values
+def collect(app):
+    counters, gauges, histograms = {}, {}, {}
+    buckets = _registry.buckets
+    for snapshot in _snapshots(app):
+        alive = snapshot['pid'] == os.getpid() or _process_alive(snapshot['pid'])
+        for name, labels, value in snapshot['counters']:
+            key = (name, tuple(map(tuple, labels)))
+            counters[key] = counters.get(key, 0) + value
+        if alive:
+            for name, labels, value in snapshot['gauges']:
+                key = (name, tuple(map(tuple, labels)))
+                gauges[key] = gauges.get(key, 0) + value
+        if tuple(snapshot['buckets']) != buckets:
+            # Written with other bucket bounds, cannot be merged
+            continue
+        for name, labels, counts, total, count in snapshot['histograms']:
+            key = (name, tuple(map(tuple, labels)))
+            merged = histograms.setdefault(key, [[0] * len(buckets), 0.0, 0])
+            merged[0] = [a + b for a, b in zip(merged[0], counts)]
+            merged[1] += total
+            merged[2] += count
+    return counters, gauges, histograms
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels) + '}'
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+# All metrics in the Prometheus text exposition format
+def render(app):
+    counters, gauges, histograms = collect(app)
+    gauges.setdefault(('http_requests_in_flight', ()), 0)
+    lines = []
+    for name, (kind, description) in _HELP.items():
+        lines.append(f"# HELP {name} {description}")
+        lines.append(f"# TYPE {name} {kind}")
+        if kind == 'counter':
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        elif kind == 'gauge':
+            for (metric, labels), value in sorted(gauges.items()):
+                if metric == name:
+                    lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        else:
+            for (metric, labels), (counts, total, count) in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                cumulative = 0
+                for bound, bucket in zip(_registry.buckets, counts):
+                    cumulative += bucket
+                    lines.append(f"{name}_bucket{_format_labels(labels + (('le', _format_value(float(bound))),))} {cumulative}")
+                lines.append(f"{name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {count}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(float(total))}")
+                lines.append(f"{name}_count{_format_labels(labels)} {count}")
+    return '\n'.join(lines) + '\n'
+
+def reset():
+    _registry.reset()
+
+
+# Add time spent encoding JSON to the current request
+def add_serialization_time(seconds):
+    if has_request_context():
+        request.environ[SERIALIZATION_KEY] = request.environ.get(SERIALIZATION_KEY, 0.0) + seconds
+
+# jsonify() encoder that reports its time like application.serializers.dumps does
+class TimedJSONProvider(DefaultJSONProvider):
+    def dumps(self, obj, **kwargs):
+        started = time.perf_counter()
+        try:
+            return super().dumps(obj, **kwargs)
+        finally:
+            add_serialization_time(time.perf_counter() - started)
+
+
+def init_app(app):
+    global _registry
+    _registry = Registry(app.config['METRICS_BUCKETS'])
+    if app.config['METRICS_DIR']:
+        os.makedirs(app.config['METRICS_DIR'], exist_ok=True)
+    app.json = TimedJSONProvider(app)
+
+    @app.before_request
+    def start_metrics():
+        request.environ[STARTED_KEY] = time.perf_counter()
+        _registry.add('http_requests_in_flight', (), 1)
+
+    @app.after_request
+    def record_metrics(response):
+        started = request.environ.get(STARTED_KEY)
+        if started is None:
+            return response
+        labels = _labels(blueprint=request.blueprint or '', endpoint=request.endpoint or 'unmatched')
+        _registry.observe('http_request_duration_seconds', labels, time.perf_counter() - started)
+        _registry.inc('http_requests_total', labels + (('method', request.method), ('status', str(response.status_code))))
+        _registry.observe('http_request_serialization_seconds', labels, request.environ.get(SERIALIZATION_KEY, 0.0))
+
+        stats = query_stats.current()
+        if stats is not None:
+            _registry.observe('http_request_db_seconds', labels, stats.db_time)
+            _registry.inc('http_request_db_queries_total', labels, stats.queries)
+        return response
+
+    @app.teardown_request
+    def finish_metrics(exception=None):
+        if request.environ.pop(STARTED_KEY, None) is None:
+            return
+        in_flight = _registry.add('http_requests_in_flight', (), -1)
+        if not app.config['METRICS_DIR']:
+            return
+        # Other processes would otherwise report this one busy until its next request
+        if (in_flight == 0 and _registry.flushed_gauges) or time.monotonic() - _registry.last_flush >= app.config['METRICS_FLUSH_SECONDS']:
+            flush(app)
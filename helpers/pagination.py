@@ -0,0 +1,118 @@
+# Keyset (cursor) pagination for the list endpoints
+#
+# Pages are selected with a WHERE on the ordering columns of the last row seen
+# instead of OFFSET, so the cost of a page does not depend on how deep it is.
+# The position is handed to clients as an opaque url-safe token.
+
+import base64
+import json
+from datetime import datetime, timezone
+from flask import request, current_app
+from sqlalchemy import and_, or_, DateTime
+
+
+class PaginationError(ValueError):
+    pass
+
+
+def encode_cursor(values):
+    values = [value.isoformat() if isinstance(value, datetime) else value for value in values]
+    raw = json.dumps(values, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(token, columns):
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        values = json.loads(raw)
+        if not isinstance(values, list) or len(values) != len(columns):
+            raise ValueError
+        return [
+            datetime.fromisoformat(value) if isinstance(column.type, DateTime) else value
+            for column, value in zip(columns, values)
+        ]
+    except (ValueError, TypeError):
+        raise PaginationError("Invalid cursor")
+
+# Read limit/cursor from the query string, limit is None when the client did not ask for pages
+# unless always is set
+def page_args(always=False):
+    limit = request.args.get('limit')
+    cursor = request.args.get('cursor')
+
+    if limit is None and cursor is None and not always:
+        return None, None
+
+    if limit is None:
+        limit = current_app.config['PAGINATION_DEFAULT_LIMIT']
+    else:
+        try:
+            limit = int(limit)
+        except ValueError:
+            raise PaginationError("Invalid limit")
+        if limit < 1:
+            raise PaginationError("Invalid limit")
+
+    return min(limit, current_app.config['PAGINATION_MAX_LIMIT']), cursor
+
+# Rows strictly after the cursor position in (columns...) order
+def _after(columns, values, descending):
+    column, value = columns[0], values[0]
+    beyond = column < value if descending else column > value
+    if len(columns) == 1:
+        return beyond
+    return or_(beyond, and_(column == value, _after(columns[1:], values[1:], descending)))
+
+# Apply keyset pagination to a query ordered by the given unique column tuple
+# key maps a row to its values of those columns, by default the same-named attributes
+# Returns (rows, next_cursor), or every row and no cursor if no page was requested and
+# always is not set
+def paginate(query, columns, descending=False, key=None, always=False):
+    limit, cursor = page_args(always)
+
+    if limit is None:
+        return query.all(), None
+
+    if cursor:
+        query = query.filter(_after(columns, decode_cursor(cursor, columns), descending))
+
+    ordering = [column.desc() if descending else column.asc() for column in columns]
+    rows = query.order_by(*ordering).limit(limit + 1).all()
+
+    if len(rows) <= limit:
+        return rows, None
+
+    rows = rows[:limit]
+    last = rows[-1]
+    values = key(last) if key else [getattr(last, column.key) for column in columns]
+    return rows, encode_cursor(values)
+
+# Read since/until ISO-8601 bounds from the query string
+# Returned as naive UTC datetimes, like the stored timestamps
+def time_range_args():
+    bounds = []
+    for name in ('since', 'until'):
+        value = request.args.get(name)
+        if value is None:
+            bounds.append(None)
+            continue
+        try:
+            bound = datetime.fromisoformat(value)
+        except ValueError:
+            raise PaginationError(f"Invalid {name}")
+        if bound.tzinfo is not None:
+            bound = bound.astimezone(timezone.utc).replace(tzinfo=None)
+        bounds.append(bound)
+    return bounds
+
+# Restrict a query to since <= column < until
+def filter_time_range(query, column):
+    since, until = time_range_args()
+    if since is not None:
+        query = query.filter(column >= since)
+    if until is not None:
+        query = query.filter(column < until)
+    return query
+
+# Response headers advertising the next page
+def page_headers(next_cursor):
+    return {'X-Next-Cursor': next_cursor} if next_cursor else {}
@@ -0,0 +1,40 @@
+# Password hashing on a bounded worker pool
+#
+# Hashing and verification run on a small thread pool (hashlib releases the GIL
+# while it works) so bursts of logins cannot occupy more than
+# PASSWORD_HASH_WORKERS cores at once. The hash method and its cost come from
+# the config and hashes made with other parameters are flagged for rehashing.
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app
+from werkzeug.security import generate_password_hash, check_password_hash
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _pool():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=current_app.config['PASSWORD_HASH_WORKERS'],
+                    thread_name_prefix='password-hash'
+                )
+    return _executor
+
+# Method string in werkzeug's format, e.g. pbkdf2:sha256:260000
+def hash_method():
+    return f"{current_app.config['PASSWORD_HASH_METHOD']}:{current_app.config['PASSWORD_HASH_ITERATIONS']}"
+
+def hash_password(password):
+    return _pool().submit(generate_password_hash, password, hash_method()).result()
+
+def verify_password(password_hash, password):
+    return _pool().submit(check_password_hash, password_hash, password).result()
+
+# True if the stored hash was made with different parameters than the configured ones
+def needs_rehash(password_hash):
+    return password_hash.split('$', 1)[0] != hash_method()
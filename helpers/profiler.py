@@ -0,0 +1,152 @@
+# On-demand sampling profiler for single requests
+#
+# A profiled request gets a sampler thread that snapshots the request thread's
+# stack every PROFILER_INTERVAL seconds, from the before_request hooks until the
+# response is made, so the authorization decorators, SQLAlchemy, marshmallow and JSON
+# encoding all show up. The samples are written to PROFILER_DIR as collapsed
+# stacks ("frame;frame;frame count" per line), the input of flamegraph.pl and
+# speedscope.
+#
+# Nothing is profiled unless PROFILER_ENABLED is set. Requests are then picked
+# by the PROFILER_SAMPLE_RATE, or by a PROFILE_HEADER sent with the JWT of an
+# admin holding PROFILE_PERMISSION. Overhead is bounded by the sampling interval,
+# by stopping after PROFILER_MAX_SECONDS and by profiling at most
+# PROFILER_MAX_CONCURRENT requests at a time.
+
+import itertools
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from flask import request
+from flask_jwt_extended import verify_jwt_in_request
+from flask_jwt_extended.exceptions import JWTExtendedException
+from jwt.exceptions import PyJWTError
+
+PROFILE_HEADER = 'X-Profile'
+PROFILE_FILE_HEADER = 'X-Profile-File'
+PROFILE_PERMISSION = 'can_profile_requests'
+
+PROFILER_KEY = 'profiler.sampler'
+
+_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_sequence = itertools.count()
+_slots = None
+
+
+def _frame_name(code):
+    filename = code.co_filename
+    if filename.startswith(_root):
+        filename = os.path.relpath(filename, _root)
+    return f"{code.co_name} ({filename}:{code.co_firstlineno})"
+
+
+class Sampler:
+    def __init__(self, thread_id, interval, max_seconds):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.max_seconds = max_seconds
+        self.stacks = Counter()
+        self._names = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        return self
+
+    def _sample(self):
+        frame = sys._current_frames().get(self.thread_id)
+        names = []
+        while frame is not None:
+            code = frame.f_code
+            name = self._names.get(code)
+            if name is None:
+                name = self._names[code] = _frame_name(code)
+            names.append(name)
+            frame = frame.f_back
+        if names:
+            self.stacks[';'.join(reversed(names))] += 1
+
+    def _run(self):
+        deadline = time.perf_counter() + self.max_seconds
+        while not self._stop.wait(self.interval):
+            if time.perf_counter() > deadline:
+                return
+            self._sample()
+
+    def collapsed(self):
+        return ''.join(f"{stack} {count}\n" for stack, count in sorted(self.stacks.items()))
+
+
+# True if the request carries the profile header and the JWT of an admin allowed to profile
+def _requested_by_admin():
+    if not request.headers.get(PROFILE_HEADER):
+        return False
+    from helpers.decorators import current_caller
+    try:
+        if verify_jwt_in_request(optional=True) is None:
+            return False
+        caller = current_caller()
+    except (JWTExtendedException, PyJWTError):
+        return False
+    return caller is not None and PROFILE_PERMISSION in caller.permissions
+
+def _should_profile(app):
+    if not app.config['PROFILER_ENABLED']:
+        return False
+    rate = app.config['PROFILER_SAMPLE_RATE']
+    return (rate and random.random() < rate) or _requested_by_admin()
+
+# Write a finished profile, returns the file name
+def write_profile(app, sampler, endpoint):
+    directory = app.config['PROFILER_DIR']
+    os.makedirs(directory, exist_ok=True)
+    name = f"{time.strftime('%Y%m%d-%H%M%S')}-{endpoint}-{os.getpid()}-{next(_sequence)}.collapsed"
+    with open(os.path.join(directory, name), 'w') as file:
+        file.write(sampler.collapsed())
+    return name
+
+
+def init_app(app):
+    global _slots
+    _slots = threading.BoundedSemaphore(app.config['PROFILER_MAX_CONCURRENT'])
+
+    @app.before_request
+    def start_profiler():
+        if not _should_profile(app):
+            return
+        if not _slots.acquire(blocking=False):
+            return
+        request.environ[PROFILER_KEY] = Sampler(
+            threading.get_ident(), app.config['PROFILER_INTERVAL'], app.config['PROFILER_MAX_SECONDS']
+        ).start()
+
+    # Stop sampling and write the profile, once per request
+    def finish_profile():
+        sampler = request.environ.pop(PROFILER_KEY, None)
+        if sampler is None:
+            return None
+        try:
+            return write_profile(app, sampler.stop(), request.endpoint or 'unmatched')
+        finally:
+            _slots.release()
+
+    @app.after_request
+    def report_profile(response):
+        name = finish_profile()
+        if name is not None:
+            response.headers[PROFILE_FILE_HEADER] = name
+        return response
+
+    # Requests that fail without a response are still written out
+    @app.teardown_request
+    def stop_profiler(exception=None):
+        finish_profile()
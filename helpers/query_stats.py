@@ -0,0 +1,108 @@
+# Per-request SQL statement counting and timing
+#
+# Engine-wide cursor events count and time every statement, on the primary and
+# on every replica. Statements run while handling a request are added to that
+# request's totals, which are reported in a Server-Timing header and folded
+# into per-endpoint aggregates. collect() captures the statements of any block
+# of code, which is what the query-count assertions in the tests build on.
+
+import threading
+import time
+from contextlib import contextmanager
+from flask import request, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+STATS_KEY = 'query_stats'
+
+_local = threading.local()
+_lock = threading.Lock()
+_endpoints = {}
+
+
+class RequestStats:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info['query_started'].pop()
+
+    for statements in getattr(_local, 'collectors', ()):
+        statements.append(statement)
+
+    if has_request_context():
+        stats = request.environ.get(STATS_KEY)
+        if stats is not None:
+            stats.queries += 1
+            stats.db_time += elapsed
+
+@event.listens_for(Engine, 'handle_error')
+def _handle_error(exception_context):
+    started = exception_context.connection.info.get('query_started') if exception_context.connection is not None else None
+    if started:
+        started.pop()
+
+
+# Collect the SQL of every statement executed by this thread inside the block
+@contextmanager
+def collect():
+    statements = []
+    collectors = _local.__dict__.setdefault('collectors', [])
+    collectors.append(statements)
+    try:
+        yield statements
+    finally:
+        collectors.remove(statements)
+
+# Totals of the current request, None outside of requests
+def current():
+    return request.environ.get(STATS_KEY) if has_request_context() else None
+
+# Snapshot of the per-endpoint aggregates
+def endpoint_stats():
+    with _lock:
+        return {endpoint: dict(totals) for endpoint, totals in _endpoints.items()}
+
+def reset():
+    with _lock:
+        _endpoints.clear()
+
+def _record(endpoint, stats, elapsed):
+    with _lock:
+        totals = _endpoints.setdefault(endpoint, {
+            "requests": 0, "queries": 0, "max_queries": 0, "db_seconds": 0.0, "total_seconds": 0.0,
+        })
+        totals["requests"] += 1
+        totals["queries"] += stats.queries
+        totals["max_queries"] = max(totals["max_queries"], stats.queries)
+        totals["db_seconds"] += stats.db_time
+        totals["total_seconds"] += elapsed
+
+
+def init_app(app):
+    @app.before_request
+    def start_query_stats():
+        request.environ[STATS_KEY] = RequestStats()
+
+    @app.after_request
+    def report_query_stats(response):
+        stats = current()
+        if stats is None:
+            return response
+        elapsed = time.perf_counter() - stats.started
+        _record(request.endpoint or 'unmatched', stats, elapsed)
+
+        if app.config['SERVER_TIMING_ENABLED']:
+            response.headers.add(
+                'Server-Timing',
+                f'db;dur={stats.db_time * 1000:.2f};desc="{stats.queries} queries", app;dur={elapsed * 1000:.2f}'
+            )
+        return response
@@ -0,0 +1,158 @@
+# Per-process cache of the RBAC data used by the authorization decorators
+#
+# Keeps role -> permission names and username -> (user id, role names) in memory
+# so an authorized request does not have to walk users, roles and permissions in
+# the database every time. Everything cached is tied to a version counter that is
+# bumped whenever a Role or Permission is written, a user is deleted or their
+# roles/username change (or the tables are dropped/created), which throws the
+# cached data away.
+
+import threading
+import time
+from collections import namedtuple
+from flask import current_app
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, joinedload
+from configuration.config import db
+from helpers.db_routing import use_primary
+from application.models import User, Role, Permission
+
+CachedUser = namedtuple('CachedUser', ['id', 'username', 'roles'])
+
+
+class RBACCache:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._users = {}
+        self._role_permissions = None
+        self._loaded_at = time.monotonic()
+        self.version = 0
+        self.last_write = 0.0
+        self.hits = 0
+        self.misses = 0
+
+    # Drop everything cached and move to a new version
+    # Called on every authorization relevant write
+    def invalidate(self):
+        with self._lock:
+            self.version += 1
+            self.last_write = time.time()
+            self._users = {}
+            self._role_permissions = None
+            self._loaded_at = time.monotonic()
+
+    # Drop cached data that outlived RBAC_CACHE_TTL
+    # Bounds staleness for writes made by other processes
+    def _expire(self):
+        ttl = current_app.config.get('RBAC_CACHE_TTL')
+        if ttl and time.monotonic() - self._loaded_at > ttl:
+            with self._lock:
+                self._users = {}
+                self._role_permissions = None
+                self._loaded_at = time.monotonic()
+
+    # Look up a user by username, returns a CachedUser or None
+    def get_user(self, username):
+        self._expire()
+        user = self._users.get(username)
+        if user is not None:
+            self.hits += 1
+            return user
+
+        self.misses += 1
+        version = self.version
+        # Cached authorization data is always read from the primary, never a lagging replica
+        with use_primary(db.session):
+            row = User.query.options(joinedload(User.roles)).filter(User.username == username).first()
+            if row is None:
+                return None
+            user = CachedUser(row.id, row.username, frozenset(role.name for role in row.roles))
+        with self._lock:
+            if self.version == version:
+                self._users[username] = user
+        return user
+
+    # Mapping of role name -> frozenset of permission names
+    def role_permissions(self):
+        self._expire()
+        mapping = self._role_permissions
+        if mapping is not None:
+            self.hits += 1
+            return mapping
+
+        self.misses += 1
+        version = self.version
+        mapping = {}
+        with use_primary(db.session):
+            for role_name, permission_name in db.session.query(Role.name, Permission.name).join(Role.permissions):
+                mapping.setdefault(role_name, set()).add(permission_name)
+        mapping = {role_name: frozenset(names) for role_name, names in mapping.items()}
+
+        with self._lock:
+            if self.version == version:
+                self._role_permissions = mapping
+        return mapping
+
+    # All permission names granted to a cached user through their roles
+    def permissions_of(self, user):
+        mapping = self.role_permissions()
+        return frozenset().union(*(mapping.get(role, ()) for role in user.roles))
+
+    def has_permission(self, user, permission_name):
+        if not user.roles:
+            return False
+        return permission_name in self.permissions_of(user)
+
+    def stats(self):
+        return {
+            "version": self.version,
+            "hits": self.hits,
+            "misses": self.misses,
+            "users": len(self._users),
+        }
+
+
+rbac_cache = RBACCache()
+
+
+# Invalidate on any flush that touches roles, permissions or the roles/username of existing users
+# New users are not cached before they exist, so inserting one is harmless
+def _user_changed(user):
+    state = inspect(user)
+    return (
+        state.attrs.roles.history.has_changes()
+        or state.attrs.username.history.has_changes()
+        or state.attrs.deleted_at.history.has_changes()
+    )
+
+def _touches_rbac(session):
+    for obj in session.deleted:
+        if isinstance(obj, (User, Role, Permission)):
+            return True
+    for obj in session.dirty:
+        if isinstance(obj, (Role, Permission)) or (isinstance(obj, User) and _user_changed(obj)):
+            return True
+    return any(isinstance(obj, (Role, Permission)) for obj in session.new)
+
+@event.listens_for(Session, 'after_flush')
+def _after_flush(session, flush_context):
+    if _touches_rbac(session):
+        session.info['rbac_dirty'] = True
+        rbac_cache.invalidate()
+
+# Invalidate again once the write is visible to other sessions,
+# so nothing loaded between the flush and the commit survives
+@event.listens_for(Session, 'after_commit')
+def _after_commit(session):
+    if session.info.pop('rbac_dirty', False):
+        rbac_cache.invalidate()
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _after_rollback(session, previous_transaction):
+    if session.info.pop('rbac_dirty', False):
+        rbac_cache.invalidate()
+
+@event.listens_for(db.metadata, 'after_create')
+@event.listens_for(db.metadata, 'after_drop')
+def _after_schema_change(target, connection, **kw):
+    rbac_cache.invalidate()
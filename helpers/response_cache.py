@@ -0,0 +1,183 @@
+# Read-through cache for single-resource GETs
+#
+# Handlers look serialized resources up by key and load them from the database
+# on a miss. Entries carry tags (e.g. the owning user) so the write handlers can
+# invalidate a resource and everything that belongs to it precisely. The storage
+# is pluggable through CacheBackend, the default being an in-process LRU with a
+# TTL and a size bound. Enabled with RESPONSE_CACHE_ENABLED. Misses are loaded
+# from the primary, a lagging replica would keep stale data cached for the TTL.
+# A loaded value is only cached when nothing was invalidated while loading it,
+# otherwise a write that committed during the load would be cached over. The tags
+# are only known once the value is loaded, so any invalidation counts.
+
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from configuration.config import db
+from helpers.db_routing import use_primary
+
+
+class CacheBackend(ABC):
+    @abstractmethod
+    def get(self, key):
+        pass
+
+    @abstractmethod
+    def set(self, key, value, tags=()):
+        pass
+
+    @abstractmethod
+    def delete(self, key):
+        pass
+
+    @abstractmethod
+    def delete_tag(self, tag):
+        pass
+
+    @abstractmethod
+    def clear(self):
+        pass
+
+
+class LRUCache(CacheBackend):
+    def __init__(self, max_size=10000, ttl=30):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._tags = {}
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value, tags = entry
+            if expires_at < time.monotonic():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, tags=()):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + self.ttl, value, tuple(tags))
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.max_size:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._remove(key)
+
+    def delete_tag(self, tag):
+        with self._lock:
+            for key in self._tags.pop(tag, ()):
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tags.clear()
+
+    # Caller holds the lock
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for tag in entry[2]:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+
+class ResponseCache:
+    def __init__(self, backend=None):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        # Bumped by every invalidation, the lock makes bump + delete and check + set atomic
+        self._lock = threading.Lock()
+        self._generation = 0
+
+    def enabled(self):
+        return has_app_context() and current_app.config.get('RESPONSE_CACHE_ENABLED', False)
+
+    def _backend(self):
+        if self.backend is None:
+            self.backend = LRUCache(
+                max_size=current_app.config['RESPONSE_CACHE_SIZE'],
+                ttl=current_app.config['RESPONSE_CACHE_TTL']
+            )
+        return self.backend
+
+    # Return the cached value for key, or call loader() and cache what it returns
+    # tags maps a loaded value to the tags it is invalidated by, None is never cached
+    def get_or_load(self, key, loader, tags=None):
+        if not self.enabled():
+            return loader()
+
+        backend = self._backend()
+        value = backend.get(key)
+        if value is not None:
+            self.hits += 1
+            return value
+
+        self.misses += 1
+        generation = self._generation
+        with use_primary(db.session):
+            value = loader()
+        if value is not None:
+            value_tags = tags(value) if tags else ()
+            with self._lock:
+                if self._generation == generation:
+                    backend.set(key, value, value_tags)
+        return value
+
+    def invalidate(self, key):
+        with self._lock:
+            self._generation += 1
+            if self.backend is not None:
+                self.backend.delete(key)
+
+    def invalidate_tag(self, tag):
+        with self._lock:
+            self._generation += 1
+            if self.backend is not None:
+                self.backend.delete_tag(tag)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            if self.backend is not None:
+                self.backend.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "entries": len(self.backend) if isinstance(self.backend, LRUCache) else None,
+        }
+
+
+response_cache = ResponseCache()
+
+
+@event.listens_for(db.metadata, 'after_drop')
+def _after_drop(target, connection, **kw):
+    response_cache.clear()
@@ -0,0 +1,49 @@
+# Ranked full-text search over notes
+#
+# Uses the FTS5 table note_fts on SQLite and the FULLTEXT index on note.content
+# on MariaDB/MySQL, both created with the note table (see application.models).
+# Queries are reduced to plain word terms which must all match; results carry a
+# score where higher ranks better, so they can be keyset-paginated on (score, id).
+
+import re
+from sqlalchemy import func, literal_column, table, column, type_coerce, Float
+from configuration.config import db
+from application.models import Note
+
+MAX_QUERY_LENGTH = 256
+MAX_TERMS = 16
+
+_TERM = re.compile(r'\w+')
+_note_fts = table('note_fts', column('rowid'))
+
+
+class SearchError(ValueError):
+    pass
+
+
+def parse_terms(query):
+    if not query or not query.strip():
+        raise SearchError("Missing search query")
+    if len(query) > MAX_QUERY_LENGTH:
+        raise SearchError("Search query too long")
+    terms = _TERM.findall(query)[:MAX_TERMS]
+    if not terms:
+        raise SearchError("Invalid search query")
+    return terms
+
+# Returns (query of (Note, score) rows, score expression)
+def search_query(terms):
+    dialect = db.session.get_bind(Note).dialect.name
+
+    if dialect == 'sqlite':
+        # bm25() is lower for better matches
+        fts = literal_column('note_fts')
+        score = -func.bm25(fts, type_=Float)
+        query = db.session.query(Note, score.label('score')).join(
+            _note_fts, _note_fts.c.rowid == Note.id
+        ).filter(fts.op('MATCH')(' '.join(f'"{term}"' for term in terms)))
+    else:
+        score = type_coerce(Note.content.match(' '.join(f'+{term}' for term in terms)), Float)
+        query = db.session.query(Note, score.label('score')).filter(score > 0)
+
+    return query, score
@@ -0,0 +1,70 @@
+# Fan-out-on-write friend timelines
+#
+# With TIMELINE_FANOUT_ENABLED, every note is copied into the timeline of each
+# user its author has added as a friend when it is posted, so the friend feed is
+# read with a single range scan over (owner_id, timestamp, note_id). Friend adds
+# backfill, friend removals and note deletes prune the affected rows, and user
+# deletes cascade to them in the database.
+# All functions run in the caller's session, before its commit, and do nothing
+# while the feature is disabled. rebuild() fills the table for existing data.
+
+from flask import current_app
+from sqlalchemy import select, insert, delete, exists
+from configuration.config import db
+from application.models import Note, Friend, TimelineEntry
+from helpers import user_purge
+
+_COLUMNS = ['owner_id', 'note_id', 'author_id', 'timestamp']
+
+
+def enabled():
+    return current_app.config.get('TIMELINE_FANOUT_ENABLED', False)
+
+# Deliver freshly flushed notes to everyone their authors have added
+def fan_out(notes):
+    if not enabled() or not notes:
+        return
+    recipients = select(
+        Friend.friend_id, Note.id, Note.user_id, Note.timestamp
+    ).join(Note, Note.user_id == Friend.user_id).where(Note.id.in_([note.id for note in notes]))
+    db.session.execute(insert(TimelineEntry).from_select(_COLUMNS, recipients))
+
+def remove_notes(note_ids):
+    if not enabled() or not note_ids:
+        return
+    db.session.execute(delete(TimelineEntry).where(TimelineEntry.note_id.in_(note_ids)))
+
+# user_id added friend_ids, so each friend's feed gains all of user_id's notes
+# Entries already in a feed are left alone
+def add_friends(user_id, friend_ids):
+    if not enabled() or not friend_ids:
+        return
+    notes = select(
+        Friend.friend_id, Note.id, Note.user_id, Note.timestamp
+    ).join(Note, Note.user_id == Friend.user_id).where(
+        (Friend.user_id == user_id) & Friend.friend_id.in_(friend_ids)
+        & ~exists().where((TimelineEntry.owner_id == Friend.friend_id) & (TimelineEntry.note_id == Note.id))
+    )
+    db.session.execute(insert(TimelineEntry).from_select(_COLUMNS, notes))
+
+def remove_friends(user_id, friend_ids):
+    if not enabled() or not friend_ids:
+        return
+    db.session.execute(delete(TimelineEntry).where(
+        TimelineEntry.owner_id.in_(friend_ids) & (TimelineEntry.author_id == user_id)
+    ))
+
+# Query of the notes in a user's feed, without those of authors being deleted
+def feed_query(user_id):
+    return Note.query.join(TimelineEntry, TimelineEntry.note_id == Note.id).filter(
+        (TimelineEntry.owner_id == user_id) & user_purge.live_author()
+    )
+
+# Rebuild every timeline from the friend and note tables
+def rebuild():
+    db.session.execute(delete(TimelineEntry))
+    entries = select(
+        Friend.friend_id, Note.id, Note.user_id, Note.timestamp
+    ).join(Note, Note.user_id == Friend.user_id)
+    db.session.execute(insert(TimelineEntry).from_select(_COLUMNS, entries))
+    db.session.commit()
@@ -0,0 +1,162 @@
+# Background deletion of large users
+#
+# Deleting a user in one statement cascades to all of their notes, friends and
+# timeline rows in a single transaction, which takes long and holds locks for
+# as long on big accounts. Users with more than USER_DELETE_ASYNC_THRESHOLD of
+# those rows are only tombstoned instead: deleted_at is set, which hides them
+# from every ORM query (see application.models), and the request returns. Their
+# notes are left out of the lists that span several authors with live_author().
+#
+# A per-process purger thread then deletes the tombstoned users' rows in batches
+# of USER_PURGE_BATCH_SIZE, one transaction each, and finally the users. Every
+# tombstone is purged, also those left behind by another process, and deleting
+# the same rows twice is harmless, so several workers can purge at once.
+
+import os
+import threading
+from flask import current_app
+from sqlalchemy import select, delete, exists, func, inspect, tuple_
+from configuration.config import db
+from application.models import User, Note, Friend, TimelineEntry, utcnow
+from helpers import etags
+
+
+def enabled():
+    return current_app.config.get('USER_DELETE_ASYNC_THRESHOLD') is not None
+
+# Whether the user has more rows to delete than the threshold,
+# counting at most threshold + 1 rows per table so big users cost no more
+def is_large(user_id):
+    limit = current_app.config['USER_DELETE_ASYNC_THRESHOLD'] + 1
+    rows = 0
+    for query in (
+        select(Note.id).where(Note.user_id == user_id),
+        select(Friend.id).where(Friend.user_id == user_id),
+        select(Friend.id).where(Friend.friend_id == user_id),
+    ):
+        rows += db.session.execute(select(func.count()).select_from(query.limit(limit).subquery())).scalar()
+        if rows >= limit:
+            return True
+    return False
+
+# Hide the user and leave the rest to the purger, in the caller's transaction
+def tombstone(user):
+    user.deleted_at = utcnow()
+
+# Filter leaving out the notes of tombstoned users
+# Goes through the user table, which the ORM query hook would otherwise filter on
+def live_author():
+    users = User.__table__
+    return ~exists().where((users.c.id == Note.user_id) & users.c.deleted_at.isnot(None))
+
+
+# Delete one batch of the rows found by rows, a select starting with the primary key
+# columns of model, and commit, returns whether there were any
+def _delete_batch(model, rows, batch_size, before_delete=None):
+    rows = db.session.execute(rows.limit(batch_size)).all()
+    if not rows:
+        return False
+    if before_delete is not None:
+        before_delete(rows)
+    primary_key = inspect(model).primary_key
+    if len(primary_key) == 1:
+        condition = primary_key[0].in_([row[0] for row in rows])
+    else:
+        condition = tuple_(*primary_key).in_([tuple(row)[:len(primary_key)] for row in rows])
+    db.session.execute(delete(model).where(condition).execution_options(synchronize_session=False))
+    db.session.commit()
+    return True
+
+def purge_user(user_id):
+    batch_size = current_app.config['USER_PURGE_BATCH_SIZE']
+    # Friend lists that contained the user change with every batch of their friends_of rows
+    def bump_friend_lists(rows):
+        etags.bump(etags.FRIENDS, [row.user_id for row in rows])
+
+    batches = [
+        # Timeline rows first, deleting notes would otherwise cascade to all their copies at once
+        (TimelineEntry, select(TimelineEntry.owner_id, TimelineEntry.note_id).where(TimelineEntry.author_id == user_id), None),
+        (TimelineEntry, select(TimelineEntry.owner_id, TimelineEntry.note_id).where(TimelineEntry.owner_id == user_id), None),
+        (Note, select(Note.id).where(Note.user_id == user_id), None),
+        (Friend, select(Friend.id).where(Friend.user_id == user_id), None),
+        (Friend, select(Friend.id, Friend.user_id).where(Friend.friend_id == user_id), bump_friend_lists),
+    ]
+    for model, rows, before_delete in batches:
+        while _delete_batch(model, rows, batch_size, before_delete):
+            pass
+
+    # What is left (e.g. role assignments) goes with the user
+    db.session.execute(delete(User).where(User.id == user_id).execution_options(synchronize_session=False))
+    db.session.commit()
+
+# Purge every tombstoned user, oldest first, returns how many were purged
+def purge_deleted():
+    purged = 0
+    while True:
+        user_id = db.session.execute(
+            select(User.id).where(User.deleted_at.isnot(None)).order_by(User.deleted_at).limit(1),
+            execution_options={'include_deleted': True}
+        ).scalar()
+        if user_id is None:
+            return purged
+        purge_user(user_id)
+        purged += 1
+
+
+class UserPurger:
+    def __init__(self, app):
+        self.app = app
+        self.pid = None
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.idle = threading.Event()
+        self.idle.set()
+        self.purged = 0
+
+    # Start the purger thread, again in a forked worker since threads do not survive fork
+    def _ensure_running(self):
+        if self.pid == os.getpid():
+            return
+        with self.lock:
+            if self.pid != os.getpid():
+                threading.Thread(target=self._run, name="user-purge", daemon=True).start()
+                self.pid = os.getpid()
+
+    # Have the thread look for tombstones
+    def wake_up(self):
+        self._ensure_running()
+        with self.lock:
+            self.idle.clear()
+            self.wake.set()
+
+    # Wait until there is nothing left to purge, returns False on timeout
+    def wait(self, timeout=None):
+        return self.idle.wait(timeout)
+
+    def _run(self):
+        with self.app.app_context():
+            while True:
+                self.wake.wait()
+                self.wake.clear()
+                try:
+                    self.purged += purge_deleted()
+                except Exception:
+                    # The tombstones stay and are retried on the next wake-up
+                    db.session.rollback()
+                    self.app.logger.exception("Purging deleted users failed")
+                finally:
+                    db.session.remove()
+                with self.lock:
+                    if not self.wake.is_set():
+                        self.idle.set()
+
+
+_lock = threading.Lock()
+
+# The purger of an app, created on first use
+def purger(app=None):
+    app = app or current_app._get_current_object()
+    if 'user_purge' not in app.extensions:
+        with _lock:
+            app.extensions.setdefault('user_purge', UserPurger(app))
+    return app.extensions['user_purge']
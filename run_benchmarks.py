@@ -0,0 +1,106 @@
+import os
+import argparse
+import json
+import platform
+import sys
+import time
+import toml
+
+def set_benchmark_environment():
+    # Set the environment variable to determine the app configuration
+    os.environ['CONFIG'] = 'TESTING'
+
+def parse_args():
+    from benchmarks import endpoints
+
+    parser = argparse.ArgumentParser(description="Benchmark every endpoint against seeded data sets")
+    parser.add_argument('--users', type=int, nargs='+', default=[1000], help="synthetic users per data set, one run per size")
+    parser.add_argument('--notes-per-user', type=int, default=20)
+    parser.add_argument('--mean-friends', type=float, default=20)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--requests', type=int, default=200, help="timed requests per scenario")
+    parser.add_argument('--warmup', type=int, default=20, help="untimed requests per scenario")
+    parser.add_argument('--pool', type=int, default=50, help="logged-in users the requests are spread over")
+    parser.add_argument('--hash-iterations', type=int, default=None, help="password hashing cost, the testing default if omitted")
+    parser.add_argument('--scenarios', nargs='+', default=None, choices=list(endpoints.SCENARIOS), help="run only these scenarios and those they require")
+    parser.add_argument('--output', default=None, help="write the results as JSON to this file")
+    parser.add_argument('--baseline', default=None, help="compare against results saved earlier with --output")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="allowed relative slowdown before a regression is reported")
+    return parser.parse_args()
+
+def run_benchmarks(args):
+    from application.app import create_app
+    from benchmarks import endpoints
+
+    app = create_app()
+
+    if args.hash_iterations:
+        app.config['PASSWORD_HASH_ITERATIONS'] = args.hash_iterations
+
+    with open('configuration/elevated_users.toml', 'r') as file:
+        config = toml.load(file)
+
+    names = endpoints.with_required(args.scenarios or endpoints.SCENARIOS)
+    results = {}
+    with app.app_context():
+        for users in args.users:
+            counts = endpoints.seed(config, users, args.notes_per_user, args.mean_friends, args.seed)
+            client = app.test_client()
+            ctx = endpoints.Context(client, endpoints.bench_users(client, args.pool, args.seed), args.seed)
+            dataset = f"users={users}"
+            results[dataset] = {
+                "rows": counts,
+                "scenarios": {name: endpoints.run_scenario(ctx, name, args.requests, args.warmup) for name in names},
+            }
+            print(f"{dataset}: done", file=sys.stderr)
+
+    return {
+        "meta": {
+            "timestamp": time.strftime('%Y-%m-%dT%H:%M:%S'),
+            "python": platform.python_version(),
+            "requests": args.requests,
+            "notes_per_user": args.notes_per_user,
+            "mean_friends": args.mean_friends,
+            "seed": args.seed,
+            "hash_iterations": app.config['PASSWORD_HASH_ITERATIONS'],
+        },
+        "results": results,
+    }
+
+# List of (dataset, scenario, metric, baseline, current) that got worse than the tolerance allows
+def compare(results, baseline, tolerance):
+    regressions = []
+    for dataset, current in results['results'].items():
+        previous = baseline['results'].get(dataset)
+        if previous is None:
+            continue
+        for name, stats in current['scenarios'].items():
+            before = previous['scenarios'].get(name)
+            if before is None or 'skipped' in before or 'skipped' in stats:
+                continue
+            for metric in ('p50_ms', 'p95_ms', 'p99_ms'):
+                if stats[metric] > before[metric] * (1 + tolerance):
+                    regressions.append((dataset, name, metric, before[metric], stats[metric]))
+            if stats['throughput_rps'] < before['throughput_rps'] * (1 - tolerance):
+                regressions.append((dataset, name, 'throughput_rps', before['throughput_rps'], stats['throughput_rps']))
+    return regressions
+
+# Run the benchmarks
+if __name__ == '__main__':
+    set_benchmark_environment()
+    args = parse_args()
+    results = run_benchmarks(args)
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
+
+    print(json.dumps(results, indent=2))
+
+    if args.baseline:
+        with open(args.baseline, 'r') as file:
+            baseline = json.load(file)
+        regressions = compare(results, baseline, args.tolerance)
+        for dataset, name, metric, before, after in regressions:
+            print(f"REGRESSION {dataset} {name} {metric}: {before} -> {after}", file=sys.stderr)
+        exit(1 if regressions else 0)
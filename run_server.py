@@ -0,0 +1,223 @@
+import os
+import argparse
+import random
+import select
+import signal
+import socket
+import sys
+import threading
+import time
+from werkzeug.serving import make_server
+
+# Production server
+# The master process creates and warms up the app once, opens the listening socket
+# and forks worker processes that share both, copy-on-write. Each worker resets the
+# connection pools it inherited and serves the socket on its own, on threads if
+# SERVER_THREADED is set. Dead workers are replaced.
+#
+# SIGHUP replaces the workers one by one with fresh forks of the master: an old
+# worker is only stopped once its replacement serves, and finishes its in-flight
+# requests first. Code changes need a restart since the app is preloaded. SIGTERM and SIGINT stop accepting connections and let the
+# workers finish for up to SERVER_GRACEFUL_TIMEOUT seconds before they are killed.
+
+def set_server_environment():
+    # Set the environment variable to determine the app configuration unless given
+    os.environ.setdefault('CONFIG', 'DEVELOPMENT')
+
+def parse_args(config):
+    parser = argparse.ArgumentParser(description="Serve the API from a preforked pool of worker processes")
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8000, help="0 picks a free port")
+    parser.add_argument('--workers', type=int, default=config['SERVER_WORKERS'])
+    parser.add_argument('--threaded', action=argparse.BooleanOptionalAction, default=config['SERVER_THREADED'])
+    parser.add_argument('--graceful-timeout', type=float, default=config['SERVER_GRACEFUL_TIMEOUT'])
+    parser.add_argument('--start-timeout', type=float, default=config['SERVER_START_TIMEOUT'])
+    parser.add_argument('--backlog', type=int, default=2048)
+    return parser.parse_args()
+
+# One write per line, so lines of different processes do not interleave
+def log(message):
+    sys.stderr.write(f"[{os.getpid()}] {message}\n")
+    sys.stderr.flush()
+
+def listen(host, port, backlog):
+    family = socket.AF_INET6 if ':' in host else socket.AF_INET
+    sock = socket.create_server((host, port), family=family, backlog=backlog)
+    # Every worker waits on the socket, whoever loses the race for a connection
+    # must not block in accept()
+    sock.setblocking(False)
+    sock.set_inheritable(True)
+    return sock
+
+
+# ready is the pipe the worker tells the master it serves through
+def run_worker(app, sock, host, threaded, ready):
+    from configuration.config import db
+
+    # The master decides when workers stop
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+    random.seed()
+
+    # Connections inherited from the master belong to it, drop them without closing
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+
+    server = make_server(host, sock.getsockname()[1], app, threaded=threaded, fd=sock.fileno())
+    # Wait for request threads when stopping instead of abandoning them
+    server.daemon_threads = False
+
+    def stop(signum, frame):
+        # shutdown() waits for serve_forever() to return, so it cannot run on this thread
+        threading.Thread(target=server.shutdown).start()
+
+    # Do not outlive a master that was killed
+    def watch_master(master):
+        while os.getppid() == master:
+            time.sleep(1)
+        log("Master is gone")
+        server.shutdown()
+
+    signal.signal(signal.SIGTERM, stop)
+    threading.Thread(target=watch_master, args=(os.getppid(),), daemon=True).start()
+    log("Worker started")
+    os.write(ready, b'1')
+    os.close(ready)
+    server.serve_forever()
+    log("Worker stopped")
+
+
+class Master:
+    def __init__(self, app, sock, args):
+        self.app = app
+        self.sock = sock
+        self.args = args
+        self.workers = set()
+        self.retiring = set()
+        self.stopping = False
+        self.reloading = False
+
+    # Fork a worker and wait until it serves, returns False if it exited or timed out first
+    def spawn(self):
+        ready, notify = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(ready)
+            status = 0
+            try:
+                run_worker(self.app, self.sock, self.args.host, self.args.threaded, notify)
+            except BaseException as e:
+                log(f"Worker failed: {e!r}")
+                status = 1
+            finally:
+                os._exit(status)
+        os.close(notify)
+        self.workers.add(pid)
+        try:
+            readable, _, _ = select.select([ready], [], [], self.args.start_timeout)
+            # Nothing to read means the worker exited before it was ready
+            return bool(readable) and os.read(ready, 1) == b'1'
+        finally:
+            os.close(ready)
+
+    # Collect exited workers, logging those that were not asked to stop
+    def reap(self):
+        while self.workers:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid == 0:
+                break
+            self.workers.discard(pid)
+            if pid in self.retiring:
+                self.retiring.discard(pid)
+            else:
+                log(f"Worker {pid} exited with status {os.waitstatus_to_exitcode(status)}")
+
+    def stop_worker(self, pid):
+        self.retiring.add(pid)
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+
+    # Replace every worker with a fresh fork, one at a time, so that there are
+    # never fewer serving workers than before. Stops at the first replacement
+    # that does not start, leaving the remaining old workers in place
+    def reload(self):
+        log("Reloading workers")
+        for pid in list(self.workers - self.retiring):
+            if self.stopping:
+                return
+            if not self.spawn():
+                log("Reload aborted, a new worker did not start")
+                return
+            self.stop_worker(pid)
+
+    def shutdown(self):
+        log("Shutting down")
+        self.sock.close()
+        for pid in list(self.workers):
+            self.stop_worker(pid)
+
+        deadline = time.monotonic() + self.args.graceful_timeout
+        while self.workers and time.monotonic() < deadline:
+            self.reap()
+            time.sleep(0.1)
+        for pid in self.workers:
+            log(f"Killing worker {pid}")
+            os.kill(pid, signal.SIGKILL)
+        while self.workers:
+            pid, _ = os.waitpid(-1, 0)
+            self.workers.discard(pid)
+
+    def run(self):
+        def stop(signum, frame):
+            self.stopping = True
+
+        def reload(signum, frame):
+            self.reloading = True
+
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+        signal.signal(signal.SIGHUP, reload)
+
+        for _ in range(self.args.workers):
+            self.spawn()
+
+        while not self.stopping:
+            if self.reloading:
+                self.reloading = False
+                self.reload()
+            self.reap()
+            # Replace crashed workers, also those a reload stopped after they had crashed
+            if not self.stopping:
+                for _ in range(self.args.workers - len(self.workers - self.retiring)):
+                    self.spawn()
+            time.sleep(0.2)
+
+        self.shutdown()
+
+
+# Run the server
+if __name__ == '__main__':
+    set_server_environment()
+
+    from application.app import create_app, warm_up
+    from configuration.config import db
+
+    app = create_app()
+    args = parse_args(app.config)
+
+    log(f"Warmed up in {warm_up(app) * 1000:.0f} ms")
+
+    # Workers must not share the connections the warm-up opened
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose()
+    sock = listen(args.host, args.port, args.backlog)
+    host, port = sock.getsockname()[:2]
+    log(f"Listening on http://{host}:{port} with {args.workers} workers")
+    Master(app, sock, args).run()
@@ -1,19 +1,27 @@
 import unittest
+import json
 import toml
+from contextlib import contextmanager
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.exc import OperationalError, SQLAlchemyError
-from werkzeug.security import generate_password_hash
-from application.app import config, app
+from application.app import create_app
 from configuration.config import db
 from application.models import User, Note, Friend, Role, Permission
+from helpers.passwords import hash_password
+from helpers import query_stats
+
+# One app shared by every test case of the process
+app = create_app()
 
 class BaseTestCase(unittest.TestCase):
+    # Test cases that need other settings (e.g. replicas) create their own app
+    app = app
 
     @classmethod
     def setUpClass(cls):
         try:
-            with app.app_context():
+            with cls.app.app_context():
                 cls.engine = db.engine
                 cls.Session = sessionmaker(bind=cls.engine)
 
@@ -88,7 +96,7 @@ class BaseTestCase(unittest.TestCase):
                 admin_user = User(
                     id=i,
                     username=username,
-                    password=generate_password_hash(username)
+                    password=hash_password(username)
                 )
 
                 cls.session = cls.Session()
@@ -111,7 +119,6 @@ class BaseTestCase(unittest.TestCase):
         if not self.engine:
             self.skipTest("Skipping test due to database connection issues.")
 
-        self.app = app
         self.client = self.app.test_client()
         self.app_context = self.app.app_context()
         self.app_context.push()
@@ -142,7 +149,7 @@ class BaseTestCase(unittest.TestCase):
 
     def _create_test_user(self, username="testuser", password="C0mpl3x!"):
         try:
-            user = User(username=username, password=generate_password_hash(password))
+            user = User(username=username, password=hash_password(password))
             self.session.add(user)
             self.session.commit()
             return user.id
@@ -150,6 +157,19 @@ class BaseTestCase(unittest.TestCase):
             print(f"Error creating test user: {e}")
             self.fail(f"Failed to create test user: {e}")
 
+    def _login(self, username, password):
+        return self.client.post('/api/login', data=json.dumps({
+            'username': username,
+            'password': password
+        }), content_type='application/json')
+
+    def _access_token(self, username, password):
+        return json.loads(self._login(username, password).data)['access_token']
+
+    # Authorization headers with a fresh token for the user
+    def _auth_headers(self, username, password):
+        return {'Authorization': f'Bearer {self._access_token(username, password)}'}
+
     def _create_test_note(self, user_id, content):
         try:
             note = Note(content=content, user_id=user_id)
@@ -160,5 +180,13 @@ class BaseTestCase(unittest.TestCase):
             print(f"Error creating test note: {e}")
             self.fail(f"Failed to create test note: {e}")
 
+    # Fail if the block issues more than maximum SQL statements
+    @contextmanager
+    def assertMaxQueries(self, maximum):
+        with query_stats.collect() as statements:
+            yield statements
+        if len(statements) > maximum:
+            self.fail(f"{len(statements)} queries issued, expected at most {maximum}:\n" + "\n".join(statements))
+
 if __name__ == '__main__':
     unittest.main()
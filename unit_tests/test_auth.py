@@ -1,6 +1,10 @@
 import unittest
 import json
+from flask_jwt_extended import decode_token
+from werkzeug.security import generate_password_hash
 from unit_tests.base_test import BaseTestCase
+from application.models import User
+from helpers.passwords import needs_rehash, verify_password
 
 # Test /api/register and /api/login routes
 
@@ -72,6 +76,31 @@ class TestAuthenticationRoutes(BaseTestCase):
         data = json.loads(response.data)
         self.assertIn('access_token', data)
 
+    def test_login_authorization_claims(self):
+        response = self.client.post('/api/login', data=json.dumps({
+            'username': 'admin_note',
+            'password': 'admin_note'
+        }), content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data)
+        claims = decode_token(data['access_token'])
+        self.assertEqual(claims['uid'], int(data['id']))
+        self.assertEqual(claims['roles'], ['admin_note'])
+        self.assertEqual(claims['perms'], ['can_create_notes', 'can_delete_notes', 'can_read_notes', 'can_update_notes'])
+
+    def test_login_rehashes_outdated_password(self):
+        user = User(username='olduser', password=generate_password_hash('C0mpl3x!', 'pbkdf2:sha256:2000'))
+        self.session.add(user)
+        self.session.commit()
+        response = self.client.post('/api/login', data=json.dumps({
+            'username': 'olduser',
+            'password': 'C0mpl3x!'
+        }), content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        stored = User.query.filter_by(username='olduser').one().password
+        self.assertFalse(needs_rehash(stored))
+        self.assertTrue(verify_password(stored, 'C0mpl3x!'))
+
     def test_login_invalid_username(self):
         response = self.client.post('/api/login', data=json.dumps({
             'username': 'INVALID_USER',
@@ -77,3 +77,18 @@ class TestDatabaseState(BaseTestCase):
             # Check that notes of user1 are deleted
             user1_notes = Note.query.filter_by(user_id=user1.id).all()
             self.assertEqual(len(user1_notes), 0)
+
+    def test_note_timestamps_per_row(self):
+        id_2 = self._create_test_user()
+        note_id_1 = self._create_test_note(id_2, 'testcontent1')
+        note_id_2 = self._create_test_note(id_2, 'testcontent2')
+        note_1 = Note.query.get(note_id_1)
+        note_2 = Note.query.get(note_id_2)
+        self.assertLess(note_1.timestamp, note_2.timestamp)
+
+        # Updates move updated_at but keep the creation timestamp
+        created = note_1.timestamp
+        note_1.content = 'changed'
+        db.session.commit()
+        self.assertEqual(note_1.timestamp, created)
+        self.assertGreater(note_1.updated_at, created)
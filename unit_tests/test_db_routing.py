@@ -0,0 +1,116 @@
+import unittest
+import json
+import os
+import tempfile
+from unit_tests.base_test import BaseTestCase
+from application.app import create_app
+from configuration.config import Config, db
+from application.models import Note
+from helpers.db_routing import STICKY_COOKIE, use_primary
+from helpers.response_cache import response_cache
+
+# Test read-replica routing, with a SQLite file configured as the replica
+
+class TestDbRouting(BaseTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        handle, cls.replica_path = tempfile.mkstemp(suffix='.db')
+        os.close(handle)
+        cls.app = create_app(Config('TESTING', database={
+            'uri': "sqlite:///:memory:",
+            'replicas': [{'uri': f"sqlite:///{cls.replica_path}"}],
+        }))
+        with cls.app.app_context():
+            cls.replica = db.engines['replica_0']
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls.replica.dispose()
+        os.remove(cls.replica_path)
+
+    def setUp(self):
+        super().setUp()
+        # Flush what the admin setup left in the session so requests start clean
+        db.session.commit()
+        db.metadata.drop_all(self.replica)
+        db.metadata.create_all(self.replica)
+
+    # Copy every table from the primary, like replication catching up
+    def _replicate(self):
+        with self.engine.connect() as primary, self.replica.begin() as replica:
+            for table in reversed(db.metadata.sorted_tables):
+                replica.execute(table.delete())
+            for table in db.metadata.sorted_tables:
+                rows = [dict(row) for row in primary.execute(table.select()).mappings()]
+                if rows:
+                    replica.execute(table.insert(), rows)
+
+    def _contents(self, user_id, headers):
+        response = self.client.get(f'/api/users/{user_id}/notes', headers=headers)
+        self.assertEqual(response.status_code, 200)
+        return [note['content'] for note in json.loads(response.data)]
+
+    def test_get_reads_replica(self):
+        id_2 = self._create_test_user()
+        self._create_test_note(id_2, 'replicated')
+        self._replicate()
+        self._create_test_note(id_2, 'not yet replicated')
+        headers = self._auth_headers('testuser', 'C0mpl3x!')
+        self.assertEqual(self._contents(id_2, headers), ['replicated'])
+
+    def test_write_pins_client_to_primary(self):
+        id_2 = self._create_test_user()
+        self._replicate()
+        headers = self._auth_headers('testuser', 'C0mpl3x!')
+        response = self.client.post(f'/api/users/{id_2}/notes', data=json.dumps({'content': 'fresh'}), headers=headers, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        self.assertIn(STICKY_COOKIE, response.headers.get('Set-Cookie', ''))
+        self.assertEqual(self._contents(id_2, headers), ['fresh'])
+
+        self.client.delete_cookie('localhost', STICKY_COOKIE)
+        self.assertEqual(self._contents(id_2, headers), [])
+
+    def test_use_primary(self):
+        id_2 = self._create_test_user()
+        self._replicate()
+        self._create_test_note(id_2, 'primary only')
+        with self.app.test_request_context(method='GET'):
+            self.assertEqual(Note.query.count(), 0)
+            with use_primary(db.session):
+                self.assertEqual(Note.query.count(), 1)
+            db.session.remove()
+
+    def test_response_cache_loads_from_primary(self):
+        id_2 = self._create_test_user()
+        note_id = self._create_test_note(id_2, 'old')
+        self._replicate()
+        headers = self._auth_headers('testuser', 'C0mpl3x!')
+        self.app.config['RESPONSE_CACHE_ENABLED'] = True
+        try:
+            response = self.client.put(f'/api/users/{id_2}/notes/{note_id}', data=json.dumps({'content': 'new'}), headers=headers, content_type='application/json')
+            self.assertEqual(response.status_code, 200)
+            # A client that is not pinned must not cache what the replica still has
+            self.client.delete_cookie('localhost', STICKY_COOKIE)
+            response = self.client.get(f'/api/users/{id_2}/notes/{note_id}', headers=headers)
+            self.assertEqual(json.loads(response.data)['content'], 'new')
+        finally:
+            self.app.config['RESPONSE_CACHE_ENABLED'] = False
+            response_cache.clear()
+
+
+# Test routing with the shared app, which has no replicas
+
+class TestNoReplicas(BaseTestCase):
+
+    def test_no_sticky_cookie_without_replicas(self):
+        id_2 = self._create_test_user()
+        headers = self._auth_headers('testuser', 'C0mpl3x!')
+        response = self.client.post(f'/api/users/{id_2}/notes', data=json.dumps({'content': 'fresh'}), headers=headers, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        self.assertNotIn(STICKY_COOKIE, response.headers.get('Set-Cookie', ''))
+
+if __name__ == '__main__':
+    unittest.main()
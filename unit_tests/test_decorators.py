@@ -0,0 +1,61 @@
+import unittest
+from flask_jwt_extended import verify_jwt_in_request
+from unit_tests.base_test import BaseTestCase
+from helpers import query_stats
+from helpers.decorators import access_required
+from helpers.rbac_cache import rbac_cache
+
+# Test the number of statements issued by the authorization decorators
+
+class TestDecoratorQueries(BaseTestCase):
+
+    # Run a decorated no-op view for the given token and count the statements it issues
+    def _count_queries(self, view, token, **kwargs):
+        with self.app.test_request_context(headers={'Authorization': f'Bearer {token}'}):
+            verify_jwt_in_request()
+            with query_stats.collect() as statements:
+                result = view(**kwargs)
+        return result, len(statements)
+
+    def test_access_required_owner_single_query(self):
+        id_2 = self._create_test_user()
+        token = self._access_token('testuser', 'C0mpl3x!')
+        rbac_cache.last_write = 0.0
+        view = access_required('can_read_notes')(lambda user_id: 'ok')
+        result, queries = self._count_queries(view, token, user_id=id_2)
+        self.assertEqual(result, 'ok')
+        self.assertEqual(queries, 1)
+
+    def test_access_required_friend_single_query(self):
+        id_2 = self._create_test_user()
+        id_3 = self._create_test_user(username='frienduser')
+        token_2 = self._access_token('testuser', 'C0mpl3x!')
+        self.client.post(f'/api/users/{id_2}/friends/{id_3}', headers={'Authorization': f'Bearer {token_2}'})
+        token_3 = self._access_token('frienduser', 'C0mpl3x!')
+        rbac_cache.last_write = 0.0
+        view = access_required('can_read_notes')(lambda user_id: 'ok')
+        result, queries = self._count_queries(view, token_3, user_id=id_2)
+        self.assertEqual(result, 'ok')
+        self.assertEqual(queries, 1)
+
+    def test_access_required_stranger_single_query(self):
+        id_2 = self._create_test_user()
+        id_3 = self._create_test_user(username='stranger')
+        token = self._access_token('stranger', 'C0mpl3x!')
+        rbac_cache.last_write = 0.0
+        view = access_required('can_read_notes')(lambda user_id: 'ok')
+        result, queries = self._count_queries(view, token, user_id=id_2)
+        self.assertEqual(result.status_code, 403)
+        self.assertEqual(queries, 1)
+
+    def test_access_required_missing_target_single_query(self):
+        self._create_test_user()
+        token = self._access_token('superuser', 'superuser')
+        rbac_cache.last_write = 0.0
+        view = access_required('can_read_notes')(lambda user_id: 'ok')
+        result, queries = self._count_queries(view, token, user_id=100)
+        self.assertEqual(result.status_code, 403)
+        self.assertEqual(queries, 1)
+
+if __name__ == '__main__':
+    unittest.main()
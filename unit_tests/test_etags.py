@@ -0,0 +1,92 @@
+import unittest
+import json
+from unit_tests.base_test import BaseTestCase
+from helpers import query_stats
+from helpers.rbac_cache import rbac_cache
+
+# Test ETags and conditional GETs on the notes and friends lists
+
+class TestETags(BaseTestCase):
+
+    def test_notes_not_modified(self):
+        id_2 = self._create_test_user()
+        headers = self._auth_headers('testuser', 'C0mpl3x!')
+        self.client.post(f'/api/users/{id_2}/notes', data=json.dumps({'content': 'testcontent'}), headers=headers, content_type='application/json')
+        response = self.client.get(f'/api/users/{id_2}/notes', headers=headers)
+        self.assertEqual(response.status_code, 200)
+        etag = response.headers['ETag']
+
+        response = self.client.get(f'/api/users/{id_2}/notes', headers={**headers, 'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.data, b'')
+        self.assertEqual(response.headers['ETag'], etag)
+
+    def test_notes_write_changes_etag(self):
+        id_2 = self._create_test_user()
+        headers = self._auth_headers('testuser', 'C0mpl3x!')
+        response = self.client.get(f'/api/users/{id_2}/notes', headers=headers)
+        etag = response.headers['ETag']
+        response = self.client.post(f'/api/users/{id_2}/notes', data=json.dumps({'content': 'testcontent'}), headers=headers, content_type='application/json')
+        note_id = json.loads(response.data)['id']
+
+        response = self.client.get(f'/api/users/{id_2}/notes', headers={**headers, 'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['ETag'], etag)
+        etag = response.headers['ETag']
+
+        self.client.put(f'/api/users/{id_2}/notes/{note_id}', data=json.dumps({'content': 'changed'}), headers=headers, content_type='application/json')
+        response = self.client.get(f'/api/users/{id_2}/notes', headers={**headers, 'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.data)[0]['content'], 'changed')
+
+    def test_etag_varies_with_query(self):
+        id_2 = self._create_test_user()
+        headers = self._auth_headers('testuser', 'C0mpl3x!')
+        response = self.client.get(f'/api/users/{id_2}/notes', headers=headers)
+        etag = response.headers['ETag']
+        response = self.client.get(f'/api/users/{id_2}/notes?limit=1', headers={**headers, 'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+
+    def test_friends_not_modified(self):
+        id_2 = self._create_test_user()
+        id_3 = self._create_test_user(username="frienduser")
+        headers = self._auth_headers('testuser', 'C0mpl3x!')
+        response = self.client.get(f'/api/users/{id_2}/friends', headers=headers)
+        etag = response.headers['ETag']
+        response = self.client.get(f'/api/users/{id_2}/friends', headers={**headers, 'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+
+        self.client.post(f'/api/users/{id_2}/friends/{id_3}', headers=headers)
+        response = self.client.get(f'/api/users/{id_2}/friends', headers={**headers, 'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        etag = response.headers['ETag']
+
+        # Updating the friend changes their timestamp in the list
+        headers_3 = self._auth_headers('frienduser', 'C0mpl3x!')
+        response = self.client.put(f'/api/users/{id_3}', data=json.dumps({'password': 'N3wPassw0rd!'}), headers=headers_3, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(f'/api/users/{id_2}/friends', headers={**headers, 'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['ETag'], etag)
+        etag = response.headers['ETag']
+
+        # Deleting the friend's account changes the list too
+        self.client.delete(f'/api/users/{id_3}', headers=headers_3)
+        response = self.client.get(f'/api/users/{id_2}/friends', headers={**headers, 'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.data), [])
+
+    def test_not_modified_skips_list_query(self):
+        id_2 = self._create_test_user()
+        self._create_test_note(id_2, 'testcontent')
+        headers = self._auth_headers('testuser', 'C0mpl3x!')
+        etag = self.client.get(f'/api/users/{id_2}/notes', headers=headers).headers['ETag']
+        rbac_cache.last_write = 0.0
+        with query_stats.collect() as statements:
+            response = self.client.get(f'/api/users/{id_2}/notes', headers={**headers, 'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(len(statements), 2)
+        self.assertFalse(any('FROM note' in statement for statement in statements))
+
+if __name__ == '__main__':
+    unittest.main()
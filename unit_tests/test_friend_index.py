@@ -0,0 +1,92 @@
+import unittest
+import json
+from unit_tests.base_test import BaseTestCase
+from configuration.config import db
+from application.models import User, Friend
+from helpers.friend_index import friend_index
+from helpers import etags
+
+# Test the in-memory friend index against the friends and notes routes
+
+class TestFriendIndex(BaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.app.config['FRIEND_INDEX_ENABLED'] = True
+
+    def tearDown(self):
+        self.app.config['FRIEND_INDEX_ENABLED'] = False
+        super().tearDown()
+
+    def test_index_follows_friend_writes(self):
+        id_2 = self._create_test_user()
+        id_3 = self._create_test_user(username="frienduser")
+        headers = self._auth_headers('testuser', 'C0mpl3x!')
+        friend_index.load()
+
+        self.client.post(f'/api/users/{id_2}/friends/{id_3}', headers=headers)
+        self.assertTrue(friend_index.is_friend(id_2, id_3))
+        self.assertFalse(friend_index.is_friend(id_3, id_2))
+        self.assertEqual(friend_index.friends_of(id_2), (id_3,))
+        self.assertEqual(friend_index.added_by(id_3), (id_2,))
+        self.assertTrue(User.query.get(id_2).is_friend(id_3))
+
+        self.client.delete(f'/api/users/{id_2}/friends/{id_3}', headers=headers)
+        self.assertFalse(friend_index.is_friend(id_2, id_3))
+        self.assertEqual(friend_index.added_by(id_3), ())
+
+    def test_index_drops_deleted_user(self):
+        id_2 = self._create_test_user()
+        id_3 = self._create_test_user(username="frienduser")
+        headers = self._auth_headers('testuser', 'C0mpl3x!')
+        self.client.post(f'/api/users/{id_2}/friends/{id_3}', headers=headers)
+        friend_index.load()
+
+        headers_3 = self._auth_headers('frienduser', 'C0mpl3x!')
+        self.client.delete(f'/api/users/{id_3}', headers=headers_3)
+        self.assertEqual(friend_index.friends_of(id_2), ())
+        self.assertEqual(friend_index.added_by(id_3), ())
+
+    def test_read_all_friends_from_index(self):
+        id_2 = self._create_test_user()
+        id_3 = self._create_test_user(username="frienduser1")
+        id_4 = self._create_test_user(username="frienduser2")
+        headers = self._auth_headers('testuser', 'C0mpl3x!')
+        self.client.post(f'/api/users/{id_2}/friends/{id_3}', headers=headers)
+        self.client.post(f'/api/users/{id_2}/friends/{id_4}', headers=headers)
+        response = self.client.get(f'/api/users/{id_2}/friends', headers=headers)
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data)
+        self.assertEqual({user['id'] for user in data}, {id_3, id_4})
+
+    def test_read_all_friends_sees_writes_of_other_processes(self):
+        id_2 = self._create_test_user()
+        id_3 = self._create_test_user(username="frienduser")
+        headers = self._auth_headers('testuser', 'C0mpl3x!')
+        friend_index.load()
+        self.assertEqual(json.loads(self.client.get(f'/api/users/{id_2}/friends', headers=headers).data), [])
+
+        # Written behind the index's back, as another worker would
+        self.session.add(Friend(user_id=id_2, friend_id=id_3))
+        self.session.commit()
+        etags.bump(etags.FRIENDS, [id_2])
+        db.session.commit()
+
+        response = self.client.get(f'/api/users/{id_2}/friends', headers=headers)
+        self.assertEqual([user['id'] for user in json.loads(response.data)], [id_3])
+        self.assertEqual(friend_index.added_by(id_3), (id_2,))
+
+    def test_friends_notes_from_index(self):
+        id_2 = self._create_test_user()
+        id_3 = self._create_test_user(username="frienduser")
+        self._create_test_note(id_2, 'testcontent')
+        headers = self._auth_headers('testuser', 'C0mpl3x!')
+        self.client.post(f'/api/users/{id_2}/friends/{id_3}', headers=headers)
+        headers_3 = self._auth_headers('frienduser', 'C0mpl3x!')
+        response = self.client.get(f'/api/users/{id_3}/notes/friends', headers=headers_3)
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data)
+        self.assertEqual([note['content'] for note in data], ['testcontent'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,159 @@
+import unittest
+import json
+from unittest import mock
+from sqlalchemy import insert, delete
+from unit_tests.base_test import BaseTestCase
+from configuration.config import db
+from helpers import query_stats, etags, timelines
+from application.models import Friend, TimelineEntry
+from helpers.friend_index import friend_index
+
+# Test the bulk friend add/remove endpoint
+
+class TestFriendsBatch(BaseTestCase):
+
+    def _batch(self, user_id, body, headers):
+        return self.client.post(f'/api/users/{user_id}/friends/batch', data=json.dumps(body), headers=headers, content_type='application/json')
+
+    def _friend_ids(self, user_id):
+        return sorted(friend.friend_id for friend in Friend.query.filter_by(user_id=user_id))
+
+    def test_add_and_remove(self):
+        id_2 = self._create_test_user()
+        id_3 = self._create_test_user(username="friendone")
+        id_4 = self._create_test_user(username="friendtwo")
+        id_5 = self._create_test_user(username="friendthree")
+        headers = self._auth_headers('testuser', 'C0mpl3x!')
+        self.client.post(f'/api/users/{id_2}/friends/{id_3}', headers=headers)
+        self.client.post(f'/api/users/{id_2}/friends/{id_5}', headers=headers)
+
+        response = self._batch(id_2, {'add': [id_3, id_4, id_4, 9999, id_2], 'remove': [id_5, 8888]}, headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.data), {
+            'added': [id_4],
+            'already_friends': [id_3],
+            'removed': [id_5],
+            'not_friends': [],
+            'missing': [9999, 8888],
+            'invalid': [id_2],
+        })
+        self.assertEqual(self._friend_ids(id_2), sorted([id_3, id_4]))
+
+        response = self._batch(id_2, {'remove': [id_5]}, headers)
+        self.assertEqual(json.loads(response.data)['not_friends'], [id_5])
+
+    def test_invalid_body(self):
+        id_2 = self._create_test_user()
+        headers = self._auth_headers('testuser', 'C0mpl3x!')
+        self.assertEqual(self._batch(id_2, {}, headers).status_code, 400)
+        self.assertEqual(self._batch(id_2, [1, 2], headers).status_code, 400)
+        self.assertEqual(self._batch(id_2, {'add': ['3']}, headers).status_code, 400)
+        self.assertEqual(self._batch(id_2, {'add': [1], 'remove': [1]}, headers).status_code, 400)
+
+        self.app.config['FRIENDS_BATCH_MAX_SIZE'] = 2
+        try:
+            response = self._batch(id_2, {'add': [1, 3, 4]}, headers)
+        finally:
+            self.app.config['FRIENDS_BATCH_MAX_SIZE'] = 1000
+        self.assertEqual(response.status_code, 400)
+
+    def test_other_user_forbidden(self):
+        id_2 = self._create_test_user()
+        id_3 = self._create_test_user(username="otheruser")
+        headers = self._auth_headers('testuser', 'C0mpl3x!')
+        self.assertEqual(self._batch(id_3, {'add': [id_2]}, headers).status_code, 403)
+
+    def test_single_insert_statement(self):
+        id_2 = self._create_test_user()
+        targets = [self._create_test_user(username=f"friend{i}") for i in range(5)]
+        headers = self._auth_headers('testuser', 'C0mpl3x!')
+        with query_stats.collect() as statements:
+            response = self._batch(id_2, {'add': targets}, headers)
+        self.assertEqual(json.loads(response.data)['added'], targets)
+        self.assertEqual(len([statement for statement in statements if statement.startswith('INSERT INTO friend')]), 1)
+        self.assertEqual(self._friend_ids(id_2), sorted(targets))
+
+    def test_updates_index_and_timelines(self):
+        id_2 = self._create_test_user()
+        id_3 = self._create_test_user(username="frienduser")
+        self._create_test_note(id_2, 'testcontent')
+        headers = self._auth_headers('testuser', 'C0mpl3x!')
+        self.app.config['TIMELINE_FANOUT_ENABLED'] = True
+        self.app.config['FRIEND_INDEX_ENABLED'] = True
+        try:
+            self._batch(id_2, {'add': [id_3]}, headers)
+            self.assertTrue(friend_index.is_friend(id_2, id_3))
+            self.assertEqual(TimelineEntry.query.filter_by(owner_id=id_3).count(), 1)
+
+            self._batch(id_2, {'remove': [id_3]}, headers)
+            self.assertFalse(friend_index.is_friend(id_2, id_3))
+            self.assertEqual(TimelineEntry.query.filter_by(owner_id=id_3).count(), 0)
+        finally:
+            self.app.config['TIMELINE_FANOUT_ENABLED'] = False
+            self.app.config['FRIEND_INDEX_ENABLED'] = False
+
+    # Run change() right before the batch locks the user's friends, like a concurrent request
+    def _batch_racing(self, user_id, body, headers, change):
+        bump = etags.bump
+
+        def bump_after_change(kind, user_ids):
+            change()
+            bump(kind, user_ids)
+
+        with mock.patch.object(etags, 'bump', side_effect=bump_after_change):
+            return self._batch(user_id, body, headers)
+
+    def test_concurrent_add_is_not_reported_or_fanned_out_again(self):
+        id_2 = self._create_test_user()
+        id_3 = self._create_test_user(username="frienduser")
+        id_4 = self._create_test_user(username="friendtwo")
+        self._create_test_note(id_2, 'testcontent')
+        headers = self._auth_headers('testuser', 'C0mpl3x!')
+
+        def add_friend():
+            db.session.execute(insert(Friend).values(user_id=id_2, friend_id=id_3))
+            timelines.add_friends(id_2, [id_3])
+
+        self.app.config['TIMELINE_FANOUT_ENABLED'] = True
+        try:
+            response = self._batch_racing(id_2, {'add': [id_3, id_4]}, headers, add_friend)
+        finally:
+            self.app.config['TIMELINE_FANOUT_ENABLED'] = False
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data)
+        self.assertEqual(data['added'], [id_4])
+        self.assertEqual(data['already_friends'], [id_3])
+        self.assertEqual(self._friend_ids(id_2), sorted([id_3, id_4]))
+        self.assertEqual(TimelineEntry.query.filter_by(owner_id=id_3).count(), 1)
+        self.assertEqual(TimelineEntry.query.filter_by(owner_id=id_4).count(), 1)
+
+    def test_concurrent_remove_is_not_reported(self):
+        id_2 = self._create_test_user()
+        id_3 = self._create_test_user(username="frienduser")
+        headers = self._auth_headers('testuser', 'C0mpl3x!')
+        self.client.post(f'/api/users/{id_2}/friends/{id_3}', headers=headers)
+
+        def remove_friend():
+            db.session.execute(delete(Friend).where(Friend.user_id == id_2))
+
+        response = self._batch_racing(id_2, {'remove': [id_3]}, headers, remove_friend)
+        data = json.loads(response.data)
+        self.assertEqual(data['removed'], [])
+        self.assertEqual(data['not_friends'], [id_3])
+
+    def test_timeline_fan_out_skips_existing_entries(self):
+        id_2 = self._create_test_user()
+        id_3 = self._create_test_user(username="frienduser")
+        self._create_test_note(id_2, 'testcontent')
+        headers = self._auth_headers('testuser', 'C0mpl3x!')
+        self.app.config['TIMELINE_FANOUT_ENABLED'] = True
+        try:
+            self._batch(id_2, {'add': [id_3]}, headers)
+            timelines.add_friends(id_2, [id_3])
+            db.session.commit()
+        finally:
+            self.app.config['TIMELINE_FANOUT_ENABLED'] = False
+        self.assertEqual(TimelineEntry.query.filter_by(owner_id=id_3).count(), 1)
+
+if __name__ == '__main__':
+    unittest.main()
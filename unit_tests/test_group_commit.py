@@ -0,0 +1,142 @@
+import unittest
+import json
+import threading
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from unit_tests.base_test import BaseTestCase
+from configuration.config import db
+from application.models import Note
+from helpers import group_commit
+
+# Test group commit of note writes
+
+class TestGroupCommit(BaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        db.session.commit()
+        self.app.config['GROUP_COMMIT_ENABLED'] = True
+        self.committer = group_commit.committer(self.app)
+
+    def tearDown(self):
+        self.app.config['GROUP_COMMIT_ENABLED'] = False
+        self.app.config['GROUP_COMMIT_WINDOW'] = 0.002
+        super().tearDown()
+
+    def _create_note(self, user_id, content):
+        def write():
+            if content is None:
+                raise ValueError("no content")
+            note = Note(content=content, user_id=user_id)
+            db.session.add(note)
+            db.session.flush()
+            return note.id
+        return write
+
+    def _create_note_then_fail(self, user_id, content):
+        def write():
+            db.session.add(Note(content=content, user_id=user_id))
+            db.session.flush()
+            raise ValueError("failed after writing")
+        return write
+
+    # Make the next commit of the committer thread fail
+    def _fail_next_commit(self):
+        failed = []
+
+        def fail(session):
+            if threading.current_thread().name == 'group-commit' and not failed:
+                failed.append(True)
+                raise RuntimeError("commit failed")
+
+        event.listen(Session, 'before_commit', fail)
+        self.addCleanup(event.remove, Session, 'before_commit', fail)
+
+    def _contents(self, user_id):
+        return sorted(note.content for note in Note.query.filter_by(user_id=user_id))
+
+    # Submit the writes from one thread each, returns their results or exceptions
+    def _submit_concurrently(self, writes):
+        outcomes = [None] * len(writes)
+        start = threading.Barrier(len(writes))
+
+        def run(index):
+            start.wait()
+            try:
+                outcomes[index] = self.committer.submit(writes[index])
+            except Exception as e:
+                outcomes[index] = e
+
+        threads = [threading.Thread(target=run, args=(index,)) for index in range(len(writes))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return outcomes
+
+    def test_note_routes(self):
+        id_2 = self._create_test_user()
+        headers = self._auth_headers('testuser', 'C0mpl3x!')
+        response = self.client.post(f'/api/users/{id_2}/notes', data=json.dumps({'content': ' grouped '}), headers=headers, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        note_id = json.loads(response.data)['id']
+        self.assertEqual(json.loads(response.data)['content'], 'grouped')
+
+        response = self.client.put(f'/api/users/{id_2}/notes/{note_id}', data=json.dumps({'content': 'changed'}), headers=headers, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.data)['content'], 'changed')
+        self.assertEqual(Note.query.get(note_id).content, 'changed')
+
+        response = self.client.delete(f'/api/users/{id_2}/notes/{note_id}', headers=headers)
+        self.assertEqual(response.status_code, 200)
+        db.session.expire_all()
+        self.assertIsNone(Note.query.get(note_id))
+
+    def test_concurrent_writes_share_commits(self):
+        id_2 = self._create_test_user()
+        self.app.config['GROUP_COMMIT_WINDOW'] = 0.05
+        batches = self.committer.batches
+
+        outcomes = self._submit_concurrently([self._create_note(id_2, f'note {i}') for i in range(20)])
+
+        self.assertTrue(all(isinstance(note_id, int) for note_id in outcomes))
+        self.assertEqual(len(set(outcomes)), 20)
+        self.assertLess(self.committer.batches - batches, 20)
+        self.assertEqual(Note.query.filter_by(user_id=id_2).count(), 20)
+
+    def test_failed_write_does_not_affect_others(self):
+        id_2 = self._create_test_user()
+        self.app.config['GROUP_COMMIT_WINDOW'] = 0.05
+
+        writes = [self._create_note(id_2, f'note {i}') for i in range(5)]
+        writes.insert(2, self._create_note(id_2, None))
+        outcomes = self._submit_concurrently(writes)
+
+        self.assertIsInstance(outcomes[2], ValueError)
+        self.assertTrue(all(isinstance(outcome, int) for index, outcome in enumerate(outcomes) if index != 2))
+        self.assertEqual(Note.query.filter_by(user_id=id_2).count(), 5)
+
+    def test_failed_commit_stores_writes_once(self):
+        id_2 = self._create_test_user()
+        self._fail_next_commit()
+
+        note_id = self.committer.submit(self._create_note(id_2, 'once'))
+
+        self.assertIsInstance(note_id, int)
+        self.assertEqual(self._contents(id_2), ['once'])
+
+    def test_failed_write_and_commit_store_nothing_twice(self):
+        id_2 = self._create_test_user()
+        self.app.config['GROUP_COMMIT_WINDOW'] = 0.05
+        self._fail_next_commit()
+
+        writes = [self._create_note(id_2, f'note {i}') for i in range(4)]
+        writes[2] = self._create_note_then_fail(id_2, 'failed')
+        outcomes = self._submit_concurrently(writes)
+
+        self.assertIsInstance(outcomes[2], ValueError)
+        self.assertTrue(all(isinstance(outcome, int) for index, outcome in enumerate(outcomes) if index != 2))
+        self.assertEqual(self._contents(id_2), ['note 0', 'note 1', 'note 3'])
+
+if __name__ == '__main__':
+    unittest.main()
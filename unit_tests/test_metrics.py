@@ -0,0 +1,94 @@
+import unittest
+import json
+import os
+import tempfile
+from unit_tests.base_test import BaseTestCase
+from helpers import metrics
+
+# Test the Prometheus metrics endpoint
+
+class TestMetrics(BaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        metrics.reset()
+
+    def _samples(self):
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.content_type.startswith('text/plain; version=0.0.4'))
+        samples = {}
+        for line in response.get_data(as_text=True).splitlines():
+            if line and not line.startswith('#'):
+                name, value = line.rsplit(' ', 1)
+                samples[name] = float(value)
+        return samples
+
+    def test_request_counts_and_histograms(self):
+        id_2 = self._create_test_user()
+        headers = self._auth_headers('testuser', 'C0mpl3x!')
+        for _ in range(3):
+            self.client.get(f'/api/users/{id_2}/notes', headers=headers)
+        self.client.get(f'/api/users/{id_2}')
+
+        samples = self._samples()
+        labels = 'blueprint="notes",endpoint="notes.read_all"'
+        self.assertEqual(samples[f'http_requests_total{{{labels},method="GET",status="200"}}'], 3)
+        self.assertEqual(samples[f'http_request_duration_seconds_count{{{labels}}}'], 3)
+        self.assertEqual(samples[f'http_request_duration_seconds_bucket{{{labels},le="+Inf"}}'], 3)
+        self.assertEqual(samples[f'http_request_db_seconds_count{{{labels}}}'], 3)
+        self.assertGreaterEqual(samples[f'http_request_db_queries_total{{{labels}}}'], 3 * 2)
+        self.assertGreater(samples[f'http_request_serialization_seconds_sum{{{labels}}}'], 0)
+        self.assertEqual(samples['http_requests_total{blueprint="users",endpoint="users.read_one",method="GET",status="401"}'], 1)
+        self.assertEqual(samples['http_requests_in_flight'], 1)
+
+    def test_buckets_are_cumulative(self):
+        for _ in range(2):
+            self.client.get('/api/users/1')
+        samples = self._samples()
+        labels = 'blueprint="users",endpoint="users.read_one"'
+        counts = [
+            value for name, value in samples.items()
+            if name.startswith(f'http_request_duration_seconds_bucket{{{labels},')
+        ]
+        self.assertEqual(len(counts), len(self.app.config['METRICS_BUCKETS']) + 1)
+        self.assertEqual(counts, sorted(counts))
+        self.assertEqual(counts[-1], 2)
+
+    def test_merges_process_files(self):
+        with tempfile.TemporaryDirectory() as directory:
+            self.app.config['METRICS_DIR'] = directory
+            try:
+                self.client.get('/api/users/1')
+                labels = [['blueprint', 'users'], ['endpoint', 'users.read_one'], ['method', 'GET'], ['status', '401']]
+                dead_pid = 2 ** 22 + 1
+                with open(os.path.join(directory, f'metrics_{dead_pid}.json'), 'w') as file:
+                    json.dump({
+                        'pid': dead_pid,
+                        'buckets': list(self.app.config['METRICS_BUCKETS']),
+                        'counters': [['http_requests_total', labels, 5]],
+                        'gauges': [['http_requests_in_flight', [], 3]],
+                        'histograms': [],
+                    }, file)
+                samples = self._samples()
+            finally:
+                self.app.config['METRICS_DIR'] = None
+
+        self.assertEqual(samples['http_requests_total{blueprint="users",endpoint="users.read_one",method="GET",status="401"}'], 6)
+        # The in-flight requests of processes that exited are dropped
+        self.assertEqual(samples['http_requests_in_flight'], 1)
+
+    def test_flushes_when_idle(self):
+        with tempfile.TemporaryDirectory() as directory:
+            self.app.config['METRICS_DIR'] = directory
+            try:
+                # The scrape writes the file while it is itself in flight
+                self.assertEqual(self._samples()['http_requests_in_flight'], 1)
+                # Finishing it rewrote the file although METRICS_FLUSH_SECONDS did not pass
+                with open(os.path.join(directory, f'metrics_{os.getpid()}.json'), 'r') as file:
+                    self.assertEqual(json.load(file)['gauges'], [['http_requests_in_flight', [], 0]])
+            finally:
+                self.app.config['METRICS_DIR'] = None
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+import unittest
+import json
+from unit_tests.base_test import BaseTestCase
+
+# Test streaming NDJSON exports of the notes lists
+
+NDJSON = {'Accept': 'application/x-ndjson'}
+
+
+class TestNdjson(BaseTestCase):
+
+    def _lines(self, response):
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'application/x-ndjson')
+        return [json.loads(line) for line in response.data.decode().splitlines()]
+
+    def test_notes_stream_matches_json(self):
+        id_2 = self._create_test_user()
+        for i in range(5):
+            self._create_test_note(id_2, f'note {i}')
+        headers = self._auth_headers('testuser', 'C0mpl3x!')
+        as_json = json.loads(self.client.get(f'/api/users/{id_2}/notes', headers=headers).data)
+        as_ndjson = self._lines(self.client.get(f'/api/users/{id_2}/notes', headers={**headers, **NDJSON}))
+        # Streams are newest first like the paged list
+        self.assertEqual(as_ndjson, sorted(as_json, key=lambda note: note['id'], reverse=True))
+
+    def test_stream_is_written_in_batches(self):
+        id_2 = self._create_test_user()
+        for i in range(5):
+            self._create_test_note(id_2, f'note {i}')
+        headers = self._auth_headers('testuser', 'C0mpl3x!')
+        self.app.config['STREAM_BATCH_SIZE'] = 2
+        try:
+            response = self.client.get(f'/api/users/{id_2}/notes', headers={**headers, **NDJSON}, buffered=False)
+            self.assertTrue(response.is_streamed)
+            chunks = list(response.response)
+        finally:
+            self.app.config['STREAM_BATCH_SIZE'] = 1000
+        self.assertEqual([chunk.count(b'\n') for chunk in chunks], [2, 2, 1])
+
+    def test_friends_feed_stream(self):
+        id_2 = self._create_test_user()
+        id_3 = self._create_test_user(username="frienduser")
+        headers_2 = self._auth_headers('testuser', 'C0mpl3x!')
+        headers_3 = self._auth_headers('frienduser', 'C0mpl3x!')
+        self.client.post(f'/api/users/{id_2}/friends/{id_3}', headers=headers_2)
+        self._create_test_note(id_2, 'older')
+        self._create_test_note(id_2, 'newer')
+        lines = self._lines(self.client.get(f'/api/users/{id_3}/notes/friends', headers={**headers_3, **NDJSON}))
+        self.assertEqual([note['content'] for note in lines], ['newer', 'older'])
+
+    def test_stream_has_its_own_etag(self):
+        id_2 = self._create_test_user()
+        headers = self._auth_headers('testuser', 'C0mpl3x!')
+        json_etag = self.client.get(f'/api/users/{id_2}/notes', headers=headers).headers['ETag']
+        response = self.client.get(f'/api/users/{id_2}/notes', headers={**headers, **NDJSON, 'If-None-Match': json_etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, b'')
+
+        ndjson_etag = response.headers['ETag']
+        response = self.client.get(f'/api/users/{id_2}/notes', headers={**headers, **NDJSON, 'If-None-Match': ndjson_etag})
+        self.assertEqual(response.status_code, 304)
+
+    def test_invalid_range_rejected(self):
+        id_2 = self._create_test_user()
+        headers = self._auth_headers('testuser', 'C0mpl3x!')
+        response = self.client.get(f'/api/users/{id_2}/notes?since=yesterday', headers={**headers, **NDJSON})
+        self.assertEqual(response.status_code, 400)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+import unittest
+import json
+from unit_tests.base_test import BaseTestCase
+from helpers import query_stats
+from application.models import Note
+
+# Test the bulk note create/update/delete endpoint
+
+class TestNotesBatch(BaseTestCase):
+
+    def _batch(self, user_id, operations, headers):
+        return self.client.post(f'/api/users/{user_id}/notes/batch', data=json.dumps(operations), headers=headers, content_type='application/json')
+
+    def test_mixed_batch(self):
+        id_2 = self._create_test_user()
+        note_1 = self._create_test_note(id_2, 'first')
+        note_2 = self._create_test_note(id_2, 'second')
+        headers = self._auth_headers('testuser', 'C0mpl3x!')
+        response = self._batch(id_2, [
+            {'op': 'create', 'content': ' new '},
+            {'op': 'update', 'id': note_1, 'content': 'changed'},
+            {'op': 'delete', 'id': note_2},
+        ], headers)
+        self.assertEqual(response.status_code, 200)
+        results = json.loads(response.data)['results']
+        self.assertEqual([result['status'] for result in results], [201, 200, 200])
+        self.assertEqual(results[0]['note']['content'], 'new')
+        self.assertEqual(results[1]['note']['content'], 'changed')
+        self.assertEqual(results[2]['id'], note_2)
+
+        contents = sorted(note.content for note in Note.query.filter_by(user_id=id_2))
+        self.assertEqual(contents, ['changed', 'new'])
+
+    def test_per_item_errors(self):
+        id_2 = self._create_test_user()
+        id_3 = self._create_test_user(username="otheruser")
+        note_1 = self._create_test_note(id_2, 'first')
+        other_note = self._create_test_note(id_3, 'other')
+        headers = self._auth_headers('testuser', 'C0mpl3x!')
+        response = self._batch(id_2, [
+            {'op': 'create', 'content': 'kept'},
+            {'op': 'create', 'content': '   '},
+            {'op': 'rename', 'id': note_1},
+            {'op': 'update', 'id': 9999, 'content': 'missing'},
+            {'op': 'delete', 'id': other_note},
+            {'op': 'update', 'id': note_1, 'content': 'once'},
+            {'op': 'delete', 'id': note_1},
+            {'op': 'create', 'content': 'x' * 241},
+        ], headers)
+        self.assertEqual(response.status_code, 200)
+        results = json.loads(response.data)['results']
+        self.assertEqual([result['status'] for result in results], [201, 400, 400, 404, 403, 200, 400, 400])
+        self.assertEqual(results[2]['op'], 'rename')
+        self.assertEqual(results[6]['message'], "Duplicate note id in batch")
+        self.assertIsNotNone(Note.query.get(other_note))
+        self.assertEqual(Note.query.get(note_1).content, 'once')
+
+    def test_batch_size_validated(self):
+        id_2 = self._create_test_user()
+        headers = self._auth_headers('testuser', 'C0mpl3x!')
+        self.assertEqual(self._batch(id_2, [], headers).status_code, 400)
+        self.assertEqual(self._batch(id_2, {'op': 'create', 'content': 'x'}, headers).status_code, 400)
+
+        self.app.config['NOTES_BATCH_MAX_SIZE'] = 2
+        try:
+            response = self._batch(id_2, [{'op': 'create', 'content': 'x'}] * 3, headers)
+        finally:
+            self.app.config['NOTES_BATCH_MAX_SIZE'] = 500
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Note.query.filter_by(user_id=id_2).count(), 0)
+
+    def test_other_user_forbidden(self):
+        id_2 = self._create_test_user()
+        id_3 = self._create_test_user(username="otheruser")
+        headers = self._auth_headers('testuser', 'C0mpl3x!')
+        response = self._batch(id_3, [{'op': 'create', 'content': 'x'}], headers)
+        self.assertEqual(response.status_code, 403)
+
+    def test_single_commit(self):
+        id_2 = self._create_test_user()
+        notes = [self._create_test_note(id_2, f'note {i}') for i in range(5)]
+        headers = self._auth_headers('testuser', 'C0mpl3x!')
+        operations = [{'op': 'update', 'id': note_id, 'content': 'changed'} for note_id in notes]
+        operations += [{'op': 'create', 'content': f'new {i}'} for i in range(5)]
+        with query_stats.collect() as statements:
+            response = self._batch(id_2, operations, headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len([statement for statement in statements if statement.startswith('UPDATE note')]), 1)
+        self.assertEqual(len([statement for statement in statements if statement.startswith('SELECT note')]), 1)
+
+if __name__ == '__main__':
+    unittest.main()
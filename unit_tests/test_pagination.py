@@ -0,0 +1,95 @@
+import unittest
+import json
+from unit_tests.base_test import BaseTestCase
+
+# Test keyset pagination of the list endpoints
+
+class TestPagination(BaseTestCase):
+
+    # Follow X-Next-Cursor until the last page, returns every page body
+    def _pages(self, url, headers):
+        pages = []
+        response = self.client.get(url, headers=headers)
+        while True:
+            self.assertEqual(response.status_code, 200)
+            pages.append(json.loads(response.data))
+            cursor = response.headers.get('X-Next-Cursor')
+            if not cursor:
+                return pages
+            response = self.client.get(f'{url}&cursor={cursor}', headers=headers)
+
+    def test_notes_pages(self):
+        id_2 = self._create_test_user()
+        note_ids = [self._create_test_note(id_2, f'testcontent{i}') for i in range(5)]
+        headers = self._auth_headers('testuser', 'C0mpl3x!')
+        pages = self._pages(f'/api/users/{id_2}/notes?limit=2', headers)
+        self.assertEqual([len(page) for page in pages], [2, 2, 1])
+        seen = [note['id'] for page in pages for note in page]
+        self.assertEqual(sorted(seen), sorted(note_ids))
+
+    def test_notes_without_limit_returns_all(self):
+        id_2 = self._create_test_user()
+        for i in range(3):
+            self._create_test_note(id_2, f'testcontent{i}')
+        headers = self._auth_headers('testuser', 'C0mpl3x!')
+        response = self.client.get(f'/api/users/{id_2}/notes', headers=headers)
+        self.assertEqual(len(json.loads(response.data)), 3)
+        self.assertNotIn('X-Next-Cursor', response.headers)
+
+    def test_friends_pages(self):
+        id_2 = self._create_test_user()
+        friend_ids = [self._create_test_user(username=f'frienduser{i}') for i in range(3)]
+        headers = self._auth_headers('testuser', 'C0mpl3x!')
+        for friend_id in friend_ids:
+            self.client.post(f'/api/users/{id_2}/friends/{friend_id}', headers=headers)
+        pages = self._pages(f'/api/users/{id_2}/friends?limit=2', headers)
+        self.assertEqual([user['id'] for page in pages for user in page], friend_ids)
+
+    def test_users_pages(self):
+        user_ids = [self._create_test_user(username=f'testuser{i}') for i in range(3)]
+        headers = self._auth_headers('superuser', 'superuser')
+        pages = self._pages('/api/users?limit=1', headers)
+        self.assertEqual([user['id'] for page in pages for user in page], user_ids)
+
+    def test_invalid_cursor(self):
+        id_2 = self._create_test_user()
+        headers = self._auth_headers('testuser', 'C0mpl3x!')
+        response = self.client.get(f'/api/users/{id_2}/notes?cursor=jibberish', headers=headers)
+        self.assertEqual(response.status_code, 400)
+        data = json.loads(response.data)
+        self.assertEqual(data['error'], 'Bad Request')
+        self.assertEqual(data['message'], 'Invalid cursor')
+
+    def test_invalid_limit(self):
+        id_2 = self._create_test_user()
+        headers = self._auth_headers('testuser', 'C0mpl3x!')
+        response = self.client.get(f'/api/users/{id_2}/notes?limit=0', headers=headers)
+        self.assertEqual(response.status_code, 400)
+        data = json.loads(response.data)
+        self.assertEqual(data['message'], 'Invalid limit')
+
+    def test_notes_time_range(self):
+        id_2 = self._create_test_user()
+        for i in range(3):
+            self._create_test_note(id_2, f'testcontent{i}')
+        headers = self._auth_headers('testuser', 'C0mpl3x!')
+        response = self.client.get(f'/api/users/{id_2}/notes?limit=10', headers=headers)
+        notes = json.loads(response.data)
+        self.assertEqual([note['content'] for note in notes], ['testcontent2', 'testcontent1', 'testcontent0'])
+
+        middle = notes[1]['timestamp']
+        response = self.client.get(f'/api/users/{id_2}/notes?since={middle}', headers=headers)
+        self.assertEqual(sorted(note['content'] for note in json.loads(response.data)), ['testcontent1', 'testcontent2'])
+        response = self.client.get(f'/api/users/{id_2}/notes?until={middle}', headers=headers)
+        self.assertEqual([note['content'] for note in json.loads(response.data)], ['testcontent0'])
+
+    def test_invalid_time_range(self):
+        id_2 = self._create_test_user()
+        headers = self._auth_headers('testuser', 'C0mpl3x!')
+        response = self.client.get(f'/api/users/{id_2}/notes?since=yesterday', headers=headers)
+        self.assertEqual(response.status_code, 400)
+        data = json.loads(response.data)
+        self.assertEqual(data['message'], 'Invalid since')
+
+if __name__ == '__main__':
+    unittest.main()
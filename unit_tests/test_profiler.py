@@ -0,0 +1,77 @@
+import unittest
+import os
+import tempfile
+import threading
+import time
+from unit_tests.base_test import BaseTestCase
+from helpers import profiler
+
+# Test the on-demand request profiler
+
+def _spin(seconds):
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+class TestProfiler(BaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.TemporaryDirectory()
+        self.app.config['PROFILER_ENABLED'] = True
+        self.app.config['PROFILER_DIR'] = self.directory.name
+
+    def tearDown(self):
+        self.app.config['PROFILER_ENABLED'] = False
+        self.app.config['PROFILER_SAMPLE_RATE'] = 0.0
+        self.app.config['PROFILER_DIR'] = 'profiles'
+        self.directory.cleanup()
+        super().tearDown()
+
+    def test_sampler_collapses_stacks(self):
+        sampler = profiler.Sampler(threading.get_ident(), 0.001, 5).start()
+        _spin(0.05)
+        sampler.stop()
+        collapsed = sampler.collapsed()
+        self.assertIn('_spin (unit_tests/test_profiler.py:', collapsed)
+        for line in collapsed.splitlines():
+            stack, count = line.rsplit(' ', 1)
+            self.assertGreater(int(count), 0)
+            self.assertIn(';', stack)
+
+    def test_admin_header_profiles_request(self):
+        headers = self._auth_headers('superuser', 'superuser')
+        headers[profiler.PROFILE_HEADER] = '1'
+        response = self.client.get('/api/users', headers=headers)
+        self.assertEqual(response.status_code, 200)
+        name = response.headers[profiler.PROFILE_FILE_HEADER]
+        self.assertIn('users.read_all', name)
+        self.assertTrue(os.path.exists(os.path.join(self.directory.name, name)))
+
+    def test_header_ignored_without_permission(self):
+        self._create_test_user()
+        headers = self._auth_headers('testuser', 'C0mpl3x!')
+        headers[profiler.PROFILE_HEADER] = '1'
+        response = self.client.get('/api/users/1', headers=headers)
+        self.assertNotIn(profiler.PROFILE_FILE_HEADER, response.headers)
+
+        response = self.client.get('/api/users/1', headers={profiler.PROFILE_HEADER: '1', 'Authorization': 'Bearer invalid'})
+        self.assertEqual(response.status_code, 422)
+        self.assertNotIn(profiler.PROFILE_FILE_HEADER, response.headers)
+        self.assertEqual(os.listdir(self.directory.name), [])
+
+    def test_disabled_by_default(self):
+        self.app.config['PROFILER_ENABLED'] = False
+        headers = self._auth_headers('superuser', 'superuser')
+        headers[profiler.PROFILE_HEADER] = '1'
+        response = self.client.get('/api/users', headers=headers)
+        self.assertNotIn(profiler.PROFILE_FILE_HEADER, response.headers)
+
+    def test_sample_rate(self):
+        self.app.config['PROFILER_SAMPLE_RATE'] = 1.0
+        response = self.client.get('/api/users/1')
+        self.assertIn(profiler.PROFILE_FILE_HEADER, response.headers)
+        self.assertEqual(len(os.listdir(self.directory.name)), 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+import unittest
+from unit_tests.base_test import BaseTestCase
+from helpers import query_stats
+from helpers.rbac_cache import rbac_cache
+
+# Test per-request SQL statement counting and timing
+
+class TestQueryStats(BaseTestCase):
+
+    def _server_timing(self, response):
+        return dict(
+            (part.split(';')[0].strip(), part.strip())
+            for part in response.headers['Server-Timing'].split(',')
+        )
+
+    def test_server_timing_header(self):
+        id_2 = self._create_test_user()
+        note_id = self._create_test_note(id_2, 'testcontent')
+        headers = self._auth_headers('testuser', 'C0mpl3x!')
+        rbac_cache.last_write = 0.0
+        response = self.client.get(f'/api/users/{id_2}/notes/{note_id}', headers=headers)
+        timing = self._server_timing(response)
+        self.assertIn('desc="2 queries"', timing['db'])
+        self.assertIn('dur=', timing['app'])
+
+    def test_server_timing_disabled(self):
+        self.app.config['SERVER_TIMING_ENABLED'] = False
+        try:
+            response = self.client.get('/api/users/1')
+        finally:
+            self.app.config['SERVER_TIMING_ENABLED'] = True
+        self.assertNotIn('Server-Timing', response.headers)
+
+    def test_assert_max_queries(self):
+        id_2 = self._create_test_user()
+        note_id = self._create_test_note(id_2, 'testcontent')
+        headers = self._auth_headers('testuser', 'C0mpl3x!')
+        rbac_cache.last_write = 0.0
+        with self.assertMaxQueries(2):
+            self.client.get(f'/api/users/{id_2}/notes/{note_id}', headers=headers)
+
+        with self.assertRaises(AssertionError):
+            with self.assertMaxQueries(1):
+                self.client.get(f'/api/users/{id_2}/notes/{note_id}', headers=headers)
+
+    def test_endpoint_aggregates(self):
+        id_2 = self._create_test_user()
+        headers = self._auth_headers('testuser', 'C0mpl3x!')
+        query_stats.reset()
+        for _ in range(3):
+            self.client.get(f'/api/users/{id_2}/notes', headers=headers)
+        stats = query_stats.endpoint_stats()
+        self.assertEqual(stats['notes.read_all']['requests'], 3)
+        self.assertGreaterEqual(stats['notes.read_all']['queries'], 3 * 2)
+        self.assertGreaterEqual(stats['notes.read_all']['max_queries'], 2)
+        self.assertGreater(stats['notes.read_all']['total_seconds'], 0)
+
+if __name__ == '__main__':
+    unittest.main()
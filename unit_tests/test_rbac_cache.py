@@ -0,0 +1,75 @@
+import unittest
+from unit_tests.base_test import BaseTestCase
+from configuration.config import db
+from application.models import Role, Permission
+from helpers.rbac_cache import rbac_cache
+
+# Test the RBAC cache used by the authorization decorators
+
+class TestRBACCache(BaseTestCase):
+
+    def test_repeated_requests_hit_cache(self):
+        id_2 = self._create_test_user()
+        headers = self._auth_headers('testuser', 'C0mpl3x!')
+        # Never trust the token's claims, so every request goes through the cache
+        self.app.config['JWT_CLAIMS_REVALIDATE_SECONDS'] = 0
+        try:
+            self.client.get(f'/api/users/{id_2}', headers=headers)
+            hits = rbac_cache.hits
+            misses = rbac_cache.misses
+            response = self.client.get(f'/api/users/{id_2}', headers=headers)
+            self.assertEqual(response.status_code, 200)
+            self.assertGreater(rbac_cache.hits, hits)
+            self.assertEqual(rbac_cache.misses, misses)
+        finally:
+            self.app.config['JWT_CLAIMS_REVALIDATE_SECONDS'] = 300
+
+    def test_permission_change_invalidates_cache(self):
+        id_2 = self._create_test_user()
+        headers = self._auth_headers('admin_user', 'admin_user')
+        response = self.client.get(f'/api/users/{id_2}', headers=headers)
+        self.assertEqual(response.status_code, 200)
+
+        version = rbac_cache.version
+        role = Role.query.filter_by(name='admin_user').one()
+        permission = Permission.query.filter_by(name='can_read_users').one()
+        role.remove_permission(permission)
+        db.session.commit()
+        self.assertGreater(rbac_cache.version, version)
+
+        response = self.client.get(f'/api/users/{id_2}', headers=headers)
+        self.assertEqual(response.status_code, 403)
+
+    def test_user_deletion_invalidates_cache(self):
+        id_2 = self._create_test_user()
+        headers = self._auth_headers('testuser', 'C0mpl3x!')
+        self.client.get(f'/api/users/{id_2}', headers=headers)
+        self.client.delete(f'/api/users/{id_2}', headers=headers)
+        self.assertIsNone(rbac_cache.get_user('testuser'))
+
+    def test_fresh_claims_skip_lookup(self):
+        id_2 = self._create_test_user()
+        headers = self._auth_headers('testuser', 'C0mpl3x!')
+        rbac_cache.last_write = 0.0
+        hits = rbac_cache.hits
+        misses = rbac_cache.misses
+        response = self.client.get(f'/api/users/{id_2}', headers=headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(rbac_cache.hits, hits)
+        self.assertEqual(rbac_cache.misses, misses)
+
+    def test_stale_claims_are_revalidated(self):
+        id_2 = self._create_test_user()
+        headers = self._auth_headers('testuser', 'C0mpl3x!')
+        rbac_cache.last_write = 0.0
+        self.app.config['JWT_CLAIMS_REVALIDATE_SECONDS'] = 0
+        try:
+            lookups = rbac_cache.hits + rbac_cache.misses
+            response = self.client.get(f'/api/users/{id_2}', headers=headers)
+            self.assertEqual(response.status_code, 200)
+            self.assertGreater(rbac_cache.hits + rbac_cache.misses, lookups)
+        finally:
+            self.app.config['JWT_CLAIMS_REVALIDATE_SECONDS'] = 300
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+import unittest
+import json
+import time
+from unit_tests.base_test import BaseTestCase
+from helpers.response_cache import response_cache, LRUCache, CacheBackend
+
+# Test the read-through cache of single users and notes
+
+class TestResponseCache(BaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.app.config['RESPONSE_CACHE_ENABLED'] = True
+
+    def tearDown(self):
+        self.app.config['RESPONSE_CACHE_ENABLED'] = False
+        super().tearDown()
+
+    def test_user_read_through(self):
+        id_2 = self._create_test_user()
+        headers = self._auth_headers('testuser', 'C0mpl3x!')
+        misses = response_cache.misses
+        hits = response_cache.hits
+        first = self.client.get(f'/api/users/{id_2}', headers=headers)
+        second = self.client.get(f'/api/users/{id_2}', headers=headers)
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(json.loads(first.data), json.loads(second.data))
+        self.assertEqual(response_cache.misses, misses + 1)
+        self.assertEqual(response_cache.hits, hits + 1)
+
+    def test_user_update_invalidates(self):
+        id_2 = self._create_test_user()
+        headers = self._auth_headers('testuser', 'C0mpl3x!')
+        before = json.loads(self.client.get(f'/api/users/{id_2}', headers=headers).data)
+        self.client.put(f'/api/users/{id_2}', data=json.dumps({'password': 'N3wPassw0rd!'}), headers=headers, content_type='application/json')
+        misses = response_cache.misses
+        after = json.loads(self.client.get(f'/api/users/{id_2}', headers=headers).data)
+        self.assertEqual(response_cache.misses, misses + 1)
+        self.assertEqual(before['id'], after['id'])
+
+    def test_note_update_invalidates(self):
+        id_2 = self._create_test_user()
+        note_id = self._create_test_note(id_2, 'testcontent')
+        headers = self._auth_headers('testuser', 'C0mpl3x!')
+        self.client.get(f'/api/users/{id_2}/notes/{note_id}', headers=headers)
+        self.client.put(f'/api/users/{id_2}/notes/{note_id}', data=json.dumps({'content': 'changed'}), headers=headers, content_type='application/json')
+        response = self.client.get(f'/api/users/{id_2}/notes/{note_id}', headers=headers)
+        self.assertEqual(json.loads(response.data)['content'], 'changed')
+
+        self.client.delete(f'/api/users/{id_2}/notes/{note_id}', headers=headers)
+        response = self.client.get(f'/api/users/{id_2}/notes/{note_id}', headers=headers)
+        self.assertEqual(response.status_code, 404)
+
+    def test_cached_note_of_other_user_forbidden(self):
+        id_2 = self._create_test_user()
+        note_id = self._create_test_note(id_2, 'testcontent')
+        headers = self._auth_headers('superuser', 'superuser')
+        self.client.get(f'/api/users/{id_2}/notes/{note_id}', headers=headers)
+        response = self.client.get(f'/api/users/1/notes/{note_id}', headers=headers)
+        self.assertEqual(response.status_code, 403)
+
+    def test_lru_eviction_and_ttl(self):
+        cache = LRUCache(max_size=2, ttl=60)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertEqual(cache.get('b'), None)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.evictions, 1)
+
+        cache = LRUCache(max_size=2, ttl=0.01)
+        cache.set('a', 1)
+        time.sleep(0.02)
+        self.assertEqual(cache.get('a'), None)
+
+    def test_lru_tag_invalidation(self):
+        cache = LRUCache()
+        cache.set(('note', 1), 'one', tags=[('user', 7)])
+        cache.set(('note', 2), 'two', tags=[('user', 7)])
+        cache.set(('note', 3), 'three', tags=[('user', 8)])
+        cache.delete_tag(('user', 7))
+        self.assertEqual(len(cache), 1)
+        self.assertEqual(cache.get(('note', 3)), 'three')
+
+    def test_invalidation_during_load_is_not_cached_over(self):
+        # A write invalidating the entry while the old value is being loaded
+        def loader():
+            response_cache.invalidate_tag(('user', 7))
+            return 'stale'
+
+        with self.app.app_context():
+            self.assertEqual(response_cache.get_or_load(('note', 1), loader, lambda value: [('user', 7)]), 'stale')
+            self.assertEqual(response_cache.get_or_load(('note', 1), lambda: 'fresh'), 'fresh')
+            self.assertEqual(response_cache.get_or_load(('note', 1), lambda: 'other'), 'fresh')
+
+    def test_backend_must_implement_every_method(self):
+        class Partial(CacheBackend):
+            def get(self, key):
+                return None
+
+        with self.assertRaises(TypeError):
+            Partial()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+import unittest
+import os
+import re
+import signal
+import subprocess
+import sys
+import time
+import urllib.request
+from urllib.error import HTTPError
+
+# Test the preforking production server in a subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+class TestRunServer(unittest.TestCase):
+
+    def setUp(self):
+        self.server = subprocess.Popen(
+            [sys.executable, 'run_server.py', '--host', '127.0.0.1', '--port', '0', '--workers', '2'],
+            cwd=ROOT, env={**os.environ, 'CONFIG': 'TESTING'}, stderr=subprocess.PIPE, text=True
+        )
+        self.lines = []
+        self.port = int(self._wait_for(r'Listening on http://127\.0\.0\.1:(\d+)').group(1))
+        self._wait_for_workers(2)
+
+    def tearDown(self):
+        if self.server.poll() is None:
+            self.server.terminate()
+        self.server.wait(timeout=30)
+        self.server.stderr.close()
+
+    def _wait_for(self, pattern):
+        for line in self.server.stderr:
+            self.lines.append(line)
+            match = re.search(pattern, line)
+            if match:
+                return match
+        self.fail("Server exited early:\n" + "".join(self.lines))
+
+    def _wait_for_workers(self, count):
+        for _ in range(count):
+            self._wait_for(r'Worker started')
+
+    def _get(self, path):
+        try:
+            with urllib.request.urlopen(f'http://127.0.0.1:{self.port}{path}', timeout=5) as response:
+                return response.status
+        except HTTPError as e:
+            return e.code
+
+    def test_serves_reloads_and_stops(self):
+        self.assertEqual(self._get('/api/docs'), 200)
+        self.assertEqual(self._get('/api/users/1'), 401)
+
+        self.server.send_signal(signal.SIGHUP)
+        self._wait_for('Reloading workers')
+        reload_start = len(self.lines)
+        # Both old workers stop once replaced
+        while "".join(self.lines[reload_start:]).count('Worker stopped') < 2:
+            self._wait_for('Worker stopped')
+        self.assertEqual(self._get('/api/docs'), 200)
+
+        self.server.send_signal(signal.SIGTERM)
+        self.assertEqual(self.server.wait(timeout=30), 0)
+        self.lines.extend(self.server.stderr)
+        output = "".join(self.lines)
+        self.assertEqual(output.count('Worker stopped'), 4)
+
+        # Every old worker is stopped only after its replacement started
+        started = stopped = 0
+        for line in self.lines[reload_start:]:
+            if 'Shutting down' in line:
+                break
+            started += 'Worker started' in line
+            stopped += 'Worker stopped' in line
+            self.assertLessEqual(stopped, started, "".join(self.lines))
+        self.assertEqual((started, stopped), (2, 2))
+
+    def test_replaces_dead_workers(self):
+        os.kill(self.server.pid, 0)
+        children = subprocess.run(['pgrep', '-P', str(self.server.pid)], capture_output=True, text=True).stdout.split()
+        self.assertEqual(len(children), 2)
+        os.kill(int(children[0]), signal.SIGKILL)
+        self._wait_for_workers(1)
+        self.assertEqual(self._get('/api/docs'), 200)
+
+if __name__ == '__main__':
+    unittest.main()
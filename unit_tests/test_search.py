@@ -0,0 +1,97 @@
+import unittest
+import json
+from unit_tests.base_test import BaseTestCase
+from configuration.config import db
+from application.models import Note
+
+# Test full-text search over notes
+
+class TestSearch(BaseTestCase):
+
+    def _search(self, path, headers):
+        response = self.client.get(path, headers=headers)
+        self.assertEqual(response.status_code, 200)
+        return [note['content'] for note in json.loads(response.data)], response
+
+    def test_search_ranks_matches(self):
+        id_2 = self._create_test_user()
+        self._create_test_note(id_2, 'grocery list: milk')
+        self._create_test_note(id_2, 'milk milk milk, buy more milk')
+        self._create_test_note(id_2, 'call the plumber')
+        headers = self._auth_headers('testuser', 'C0mpl3x!')
+        contents, _ = self._search(f'/api/users/{id_2}/notes/search?q=milk', headers)
+        self.assertEqual(contents, ['milk milk milk, buy more milk', 'grocery list: milk'])
+
+        contents, _ = self._search(f'/api/users/{id_2}/notes/search?q=buy%20milk', headers)
+        self.assertEqual(contents, ['milk milk milk, buy more milk'])
+
+    def test_search_scoped_to_user(self):
+        id_2 = self._create_test_user()
+        id_3 = self._create_test_user(username="otheruser")
+        self._create_test_note(id_2, 'my secret')
+        self._create_test_note(id_3, 'their secret')
+        headers = self._auth_headers('testuser', 'C0mpl3x!')
+        contents, _ = self._search(f'/api/users/{id_2}/notes/search?q=secret', headers)
+        self.assertEqual(contents, ['my secret'])
+
+    def test_index_follows_writes(self):
+        id_2 = self._create_test_user()
+        headers = self._auth_headers('testuser', 'C0mpl3x!')
+        response = self.client.post(f'/api/users/{id_2}/notes', data=json.dumps({'content': 'first draft'}), headers=headers, content_type='application/json')
+        note_id = json.loads(response.data)['id']
+        self.assertEqual(self._search(f'/api/users/{id_2}/notes/search?q=draft', headers)[0], ['first draft'])
+
+        self.client.put(f'/api/users/{id_2}/notes/{note_id}', data=json.dumps({'content': 'final version'}), headers=headers, content_type='application/json')
+        self.assertEqual(self._search(f'/api/users/{id_2}/notes/search?q=draft', headers)[0], [])
+        self.assertEqual(self._search(f'/api/users/{id_2}/notes/search?q=final', headers)[0], ['final version'])
+
+        self.client.delete(f'/api/users/{id_2}/notes/{note_id}', headers=headers)
+        self.assertEqual(self._search(f'/api/users/{id_2}/notes/search?q=final', headers)[0], [])
+
+    def test_search_paginates(self):
+        id_2 = self._create_test_user()
+        for i in range(5):
+            self._create_test_note(id_2, f'report number {i}')
+        headers = self._auth_headers('testuser', 'C0mpl3x!')
+        seen = []
+        path = f'/api/users/{id_2}/notes/search?q=report&limit=2'
+        while path:
+            contents, response = self._search(path, headers)
+            self.assertLessEqual(len(contents), 2)
+            seen += contents
+            cursor = response.headers.get('X-Next-Cursor')
+            path = f'/api/users/{id_2}/notes/search?q=report&limit=2&cursor={cursor}' if cursor else None
+        self.assertEqual(sorted(seen), [f'report number {i}' for i in range(5)])
+
+    def test_friends_search(self):
+        id_2 = self._create_test_user()
+        id_3 = self._create_test_user(username="frienduser")
+        id_4 = self._create_test_user(username="stranger")
+        self._create_test_note(id_2, 'party on friday')
+        self._create_test_note(id_4, 'party on saturday')
+        headers_2 = self._auth_headers('testuser', 'C0mpl3x!')
+        headers_3 = self._auth_headers('frienduser', 'C0mpl3x!')
+        self.client.post(f'/api/users/{id_2}/friends/{id_3}', headers=headers_2)
+        contents, _ = self._search(f'/api/users/{id_3}/notes/friends/search?q=party', headers_3)
+        self.assertEqual(contents, ['party on friday'])
+
+    def test_invalid_queries(self):
+        id_2 = self._create_test_user()
+        headers = self._auth_headers('testuser', 'C0mpl3x!')
+        for query in ['', '?q=', '?q=%22%2A%28', '?q=' + 'a' * 300]:
+            response = self.client.get(f'/api/users/{id_2}/notes/search{query}', headers=headers)
+            self.assertEqual(response.status_code, 400)
+
+        # FTS5 syntax in the query is treated as plain words
+        self._create_test_note(id_2, 'NEAR the OR gate')
+        contents, _ = self._search(f'/api/users/{id_2}/notes/search?q=NEAR%20OR%20%22gate', headers)
+        self.assertEqual(contents, ['NEAR the OR gate'])
+
+    def test_triggers_index_every_insert(self):
+        id_2 = self._create_test_user()
+        self._create_test_note(id_2, 'written outside the api')
+        count = db.session.execute(db.text("SELECT count(*) FROM note_fts WHERE note_fts MATCH 'outside'")).scalar()
+        self.assertEqual(count, Note.query.count())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import unittest
+import json
+import toml
+from datetime import datetime, timezone
+from collections import Counter
+from unit_tests.base_test import BaseTestCase
+from configuration.config import db
+from application.models import User, Note, Friend
+from application import seeding
+from helpers.rbac_cache import rbac_cache
+
+# Test bulk seeding and the synthetic data generator
+
+NOW = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+class TestSeeding(BaseTestCase):
+
+    def _generate(self, **kwargs):
+        with self.engine.begin() as connection:
+            return seeding.generate(connection, now=NOW, **kwargs)
+
+    def _edges(self):
+        return sorted((friend.user_id, friend.friend_id) for friend in Friend.query)
+
+    def test_generate_counts(self):
+        counts = self._generate(users=50, notes_per_user=3, mean_friends=5, batch_size=7)
+        self.assertEqual(counts['user'], 50)
+        self.assertEqual(counts['note'], 150)
+        self.assertEqual(counts['friend'], Friend.query.count())
+        self.assertEqual(User.query.count(), 54)
+        self.assertEqual(Note.query.count(), 150)
+        self.assertFalse(any(user_id == friend_id for user_id, friend_id in self._edges()))
+
+    def test_generate_is_reproducible(self):
+        self._generate(users=30, notes_per_user=2, seed=7)
+        first_edges = self._edges()
+        first_notes = sorted(note.content for note in Note.query)
+
+        db.session.query(Friend).delete()
+        db.session.query(Note).delete()
+        db.session.query(User).filter(User.id > 4).delete()
+        db.session.commit()
+
+        self._generate(users=30, notes_per_user=2, seed=7)
+        self.assertEqual(self._edges(), first_edges)
+        self.assertEqual(sorted(note.content for note in Note.query), first_notes)
+
+    def test_friend_graph_is_skewed(self):
+        self._generate(users=400, notes_per_user=0, mean_friends=10, seed=1)
+        followers = Counter(friend_id for _, friend_id in self._edges())
+        mean = sum(followers.values()) / 400
+        # The most befriended users are far above average, most users far below
+        self.assertGreater(followers.most_common(1)[0][1], 10 * mean)
+        self.assertGreater(len([user_id for user_id in range(5, 405) if followers[user_id] < mean]), 200)
+
+    def test_generated_users_can_log_in(self):
+        self._generate(users=2, notes_per_user=1, password="S33ded!pw")
+        response = self.client.post('/api/login', data=json.dumps({
+            'username': 'user5',
+            'password': 'S33ded!pw'
+        }), content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+
+    def test_seed_admins(self):
+        db.session.remove()
+        db.metadata.drop_all(self.engine)
+        db.metadata.create_all(self.engine)
+        with open('configuration/elevated_users.toml', 'r') as file:
+            config = toml.load(file)
+        with self.engine.begin() as connection:
+            counts = seeding.seed_admins(connection, config)
+        self.assertEqual(counts['user'], len(config['users']['elevated_users']))
+        superuser = rbac_cache.get_user('superuser')
+        self.assertEqual(rbac_cache.permissions_of(superuser), frozenset(config['permissions']['superuser']))
+        self.assertEqual(superuser.roles, frozenset(['superuser']))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,36 @@
+import unittest
+import json
+from unit_tests.base_test import BaseTestCase
+from application.models import User, Note, Role
+from application.schemas import note_schema, user_schema_private
+from application.serializers import serialize_note, serialize_user_private, dumps
+
+# Test that the precompiled serializers match the marshmallow schemas
+
+class TestSerializers(BaseTestCase):
+
+    def test_note_matches_schema(self):
+        id_2 = self._create_test_user()
+        note_id = self._create_test_note(id_2, 'testcontent')
+        note = Note.query.get(note_id)
+        self.assertEqual(serialize_note(note), note_schema.dump(note))
+
+    def test_user_matches_schema(self):
+        self._create_test_user()
+        for user in User.query.all():
+            self.assertEqual(serialize_user_private(user), user_schema_private.dump(user))
+
+    def test_admin_roles_match_schema(self):
+        user = User.query.filter_by(username='superuser').one()
+        self.assertTrue(user.roles)
+        self.assertEqual(serialize_user_private(user), user_schema_private.dump(user))
+
+    def test_dumps_sorts_keys(self):
+        id_2 = self._create_test_user()
+        note = Note.query.get(self._create_test_note(id_2, 'testcontent'))
+        encoded = json.loads(dumps([serialize_note(note)]))
+        self.assertEqual(encoded, [note_schema.dump(note)])
+        self.assertEqual(list(encoded[0]), sorted(encoded[0]))
+
+if __name__ == '__main__':
+    unittest.main()
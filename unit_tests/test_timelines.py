@@ -0,0 +1,90 @@
+import unittest
+import json
+from unit_tests.base_test import BaseTestCase
+from configuration.config import db
+from application.models import TimelineEntry
+from helpers import timelines
+
+# Test the fan-out-on-write friend timelines
+
+class TestTimelines(BaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.app.config['TIMELINE_FANOUT_ENABLED'] = True
+
+    def tearDown(self):
+        self.app.config['TIMELINE_FANOUT_ENABLED'] = False
+        super().tearDown()
+
+    def _feed(self, user_id, headers):
+        response = self.client.get(f'/api/users/{user_id}/notes/friends', headers=headers)
+        self.assertEqual(response.status_code, 200)
+        return [note['content'] for note in json.loads(response.data)]
+
+    def _post_note(self, user_id, content, headers):
+        response = self.client.post(f'/api/users/{user_id}/notes', data=json.dumps({'content': content}), headers=headers, content_type='application/json')
+        return json.loads(response.data)['id']
+
+    def test_note_fans_out_to_feed(self):
+        id_2 = self._create_test_user()
+        id_3 = self._create_test_user(username="frienduser")
+        headers_2 = self._auth_headers('testuser', 'C0mpl3x!')
+        headers_3 = self._auth_headers('frienduser', 'C0mpl3x!')
+        self.client.post(f'/api/users/{id_2}/friends/{id_3}', headers=headers_2)
+        self._post_note(id_2, 'testcontent', headers_2)
+        self.assertEqual(TimelineEntry.query.filter_by(owner_id=id_3).count(), 1)
+        self.assertEqual(self._feed(id_3, headers_3), ['testcontent'])
+
+    def test_batch_fans_out_to_feed(self):
+        id_2 = self._create_test_user()
+        id_3 = self._create_test_user(username="frienduser")
+        headers_2 = self._auth_headers('testuser', 'C0mpl3x!')
+        headers_3 = self._auth_headers('frienduser', 'C0mpl3x!')
+        self.client.post(f'/api/users/{id_2}/friends/{id_3}', headers=headers_2)
+        note_id = self._post_note(id_2, 'old', headers_2)
+        self.client.post(f'/api/users/{id_2}/notes/batch', data=json.dumps([
+            {'op': 'create', 'content': 'one'},
+            {'op': 'create', 'content': 'two'},
+            {'op': 'delete', 'id': note_id},
+        ]), headers=headers_2, content_type='application/json')
+        self.assertEqual(sorted(self._feed(id_3, headers_3)), ['one', 'two'])
+
+    def test_friend_add_backfills_and_remove_prunes(self):
+        id_2 = self._create_test_user()
+        id_3 = self._create_test_user(username="frienduser")
+        headers_2 = self._auth_headers('testuser', 'C0mpl3x!')
+        headers_3 = self._auth_headers('frienduser', 'C0mpl3x!')
+        self._post_note(id_2, 'testcontent', headers_2)
+        self.client.post(f'/api/users/{id_2}/friends/{id_3}', headers=headers_2)
+        self.assertEqual(self._feed(id_3, headers_3), ['testcontent'])
+        self.client.delete(f'/api/users/{id_2}/friends/{id_3}', headers=headers_2)
+        self.assertEqual(self._feed(id_3, headers_3), [])
+
+    def test_note_delete_prunes_feed(self):
+        id_2 = self._create_test_user()
+        id_3 = self._create_test_user(username="frienduser")
+        headers_2 = self._auth_headers('testuser', 'C0mpl3x!')
+        headers_3 = self._auth_headers('frienduser', 'C0mpl3x!')
+        self.client.post(f'/api/users/{id_2}/friends/{id_3}', headers=headers_2)
+        note_id = self._post_note(id_2, 'testcontent', headers_2)
+        self.client.delete(f'/api/users/{id_2}/notes/{note_id}', headers=headers_2)
+        self.assertEqual(TimelineEntry.query.count(), 0)
+        self.assertEqual(self._feed(id_3, headers_3), [])
+
+    def test_rebuild_matches_fan_out(self):
+        id_2 = self._create_test_user()
+        id_3 = self._create_test_user(username="frienduser")
+        headers_2 = self._auth_headers('testuser', 'C0mpl3x!')
+        self.client.post(f'/api/users/{id_2}/friends/{id_3}', headers=headers_2)
+        self._post_note(id_2, 'testcontent1', headers_2)
+        self._post_note(id_2, 'testcontent2', headers_2)
+        before = {(e.owner_id, e.note_id) for e in TimelineEntry.query.all()}
+        db.session.query(TimelineEntry).delete()
+        timelines.rebuild()
+        after = {(e.owner_id, e.note_id) for e in TimelineEntry.query.all()}
+        self.assertEqual(before, after)
+        self.assertEqual(len(after), 2)
+
+if __name__ == '__main__':
+    unittest.main()
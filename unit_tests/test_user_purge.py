@@ -0,0 +1,132 @@
+import unittest
+import json
+from unittest import mock
+from sqlalchemy import select, func
+from unit_tests.base_test import BaseTestCase
+from configuration.config import db
+from application.models import User, Note, Friend, TimelineEntry
+from helpers import user_purge, etags
+
+# Test database-side cascading user deletes and the background purge of large users
+
+class TestUserPurge(BaseTestCase):
+
+    def tearDown(self):
+        self.app.config['USER_DELETE_ASYNC_THRESHOLD'] = None
+        self.app.config['USER_PURGE_BATCH_SIZE'] = 1000
+        super().tearDown()
+
+    # A user with notes, friends both ways and timeline rows
+    def _create_big_user(self, notes=5):
+        user_id = self._create_test_user()
+        other_id = self._create_test_user(username='otheruser')
+        for i in range(notes):
+            note_id = self._create_test_note(user_id, f'note {i}')
+            self.session.add(TimelineEntry(owner_id=other_id, note_id=note_id, author_id=user_id, timestamp=db.func.now()))
+        self.session.add_all([Friend(user_id=user_id, friend_id=other_id), Friend(user_id=other_id, friend_id=user_id)])
+        self.session.commit()
+        return user_id, other_id
+
+    def _count(self, model, condition):
+        return db.session.execute(select(func.count()).select_from(model).where(condition)).scalar()
+
+    def _assert_rows_gone(self, user_id):
+        self.assertEqual(self._count(Note, Note.user_id == user_id), 0)
+        self.assertEqual(self._count(Friend, (Friend.user_id == user_id) | (Friend.friend_id == user_id)), 0)
+        self.assertEqual(self._count(TimelineEntry, TimelineEntry.author_id == user_id), 0)
+        self.assertIsNone(db.session.execute(
+            select(User.id).where(User.id == user_id), execution_options={'include_deleted': True}
+        ).scalar())
+
+    def test_delete_cascades_in_database(self):
+        user_id, _ = self._create_big_user()
+        headers = self._auth_headers('testuser', 'C0mpl3x!')
+
+        with self.assertMaxQueries(10) as statements:
+            response = self.client.delete(f'/api/users/{user_id}', headers=headers)
+        self.assertEqual(response.status_code, 200)
+        # The notes and friends are never loaded, the database deletes them
+        self.assertFalse([s for s in statements if s.startswith('SELECT') and ('FROM note' in s or 'FROM friend' in s)])
+        db.session.expire_all()
+        self._assert_rows_gone(user_id)
+
+    def test_small_user_deleted_at_once(self):
+        self.app.config['USER_DELETE_ASYNC_THRESHOLD'] = 10
+        user_id, _ = self._create_big_user()
+        headers = self._auth_headers('testuser', 'C0mpl3x!')
+
+        response = self.client.delete(f'/api/users/{user_id}', headers=headers)
+        self.assertEqual(response.status_code, 200)
+        self._assert_rows_gone(user_id)
+
+    def test_large_user_deleted_in_background(self):
+        self.app.config['USER_DELETE_ASYNC_THRESHOLD'] = 3
+        self.app.config['USER_PURGE_BATCH_SIZE'] = 2
+        user_id, other_id = self._create_big_user()
+        headers = self._auth_headers('testuser', 'C0mpl3x!')
+        purger = user_purge.purger(self.app)
+        friends_version = etags.current_version(etags.FRIENDS, other_id)
+
+        # Keep the purger asleep to check what the request itself changed
+        with mock.patch.object(purger, 'wake_up'):
+            response = self.client.delete(f'/api/users/{user_id}', headers=headers)
+        self.assertEqual(response.status_code, 202)
+        self.assertGreater(etags.current_version(etags.FRIENDS, other_id), friends_version)
+        self.assertEqual(self._count(Note, Note.user_id == user_id), 5)
+
+        purger.wake_up()
+        self.assertTrue(purger.wait(10))
+        db.session.expire_all()
+        self._assert_rows_gone(user_id)
+        self.assertIsNotNone(User.query.filter(User.id == other_id).one_or_none())
+
+    def test_tombstoned_user_is_hidden(self):
+        user_id, _ = self._create_big_user()
+        user = User.query.get(user_id)
+        user_purge.tombstone(user)
+        db.session.commit()
+        admin = self._auth_headers('admin_user', 'admin_user')
+
+        self.assertIsNone(User.query.filter(User.id == user_id).one_or_none())
+        self.assertEqual(self.client.get(f'/api/users/{user_id}', headers=admin).status_code, 404)
+        self.assertEqual(self._login('testuser', 'C0mpl3x!').status_code, 401)
+        # The username stays taken until the user is purged
+        response = self.client.post('/api/register', data=json.dumps({'username': 'testuser', 'password': 'C0mpl3x!'}), content_type='application/json')
+        self.assertEqual(response.status_code, 406)
+
+        self.assertEqual(user_purge.purge_deleted(), 1)
+        self._assert_rows_gone(user_id)
+        response = self.client.post('/api/register', data=json.dumps({'username': 'testuser', 'password': 'C0mpl3x!'}), content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+
+    def test_tombstoned_user_notes_leave_friend_feeds(self):
+        user_id, other_id = self._create_big_user()
+        headers = self._auth_headers('otheruser', 'C0mpl3x!')
+        feeds = [f'/api/users/{other_id}/notes/friends', f'/api/users/{other_id}/notes/friends/search?q=note']
+        for path in feeds:
+            self.assertEqual(len(json.loads(self.client.get(path, headers=headers).data)), 5)
+
+        user_purge.tombstone(User.query.get(user_id))
+        db.session.commit()
+
+        for path in feeds:
+            self.assertEqual(json.loads(self.client.get(path, headers=headers).data), [], path)
+        self.app.config['TIMELINE_FANOUT_ENABLED'] = True
+        try:
+            self.assertEqual(json.loads(self.client.get(feeds[0], headers=headers).data), [])
+        finally:
+            self.app.config['TIMELINE_FANOUT_ENABLED'] = False
+
+    def test_registration_ignores_deleted_at(self):
+        response = self.client.post('/api/register', data=json.dumps({
+            'username': 'testuser',
+            'password': 'C0mpl3x!',
+            'deleted_at': '2020-01-01T00:00:00'
+        }), content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        self.assertNotIn('deleted_at', json.loads(response.data))
+        self.assertIsNone(User.query.filter(User.username == 'testuser').one().deleted_at)
+        self.assertEqual(self._login('testuser', 'C0mpl3x!').status_code, 200)
+
+if __name__ == '__main__':
+    unittest.main()